@@ -5,10 +5,13 @@ import zlib
 import json
 import logging
 import argparse
-import time
+import atexit
+import hashlib
+import secrets
 
 import numpy as np
 
+import metrics
 from PIL import Image
 from colorama import Fore, init
 from tkinter import Tk, filedialog
@@ -16,11 +19,22 @@ from __version__ import __version__
 from cryptography.fernet import Fernet
 
 from utils import *
+from kernels import embed, embed_chunks, extract_chunks, difference, layout_capacity, COVER_MODES, VALID_DEPTHS, CRUMB_SIZE
+from parallel import SharedArray, embed_parallel, extract_chunks_parallel
+from streams import reveal_chunks, write_chunks, file_chunks, compress_chunks, encrypt_chunks
+from backends import set_backend
+from frames import is_animation, encode_frames, extract_frame_chunks, FRAME_FORMATS
+from stealth import embed_stealth, extract_stealth_chunks
+from adaptive import embed_adaptive, extract_adaptive_chunks
+from passwords import KEY_CACHE, PASSWORD_VARIABLE, kdf_parameters
+from scanlines import RowReader
 
 SINGLE_RGB_BIT_SIZE = 8 # Each RGB value is composed of 3 colors, each color is composed of 8 bits
 SINGLE_RGB_PIXEL_BIT_SIZE = SINGLE_RGB_BIT_SIZE * 3 # Each pixel is composed of 3 RGB values, each RGB value is composed of 3 colors, each color is composed of 8 bits
+HEADER_PIXEL_BITS = 3 # Number of bits of each channel used by the header
+SCANLINE_FLAG = 1 # Added to the extension length (always a multiple of 8) of carriers whose header was moved to row 0
 
-def add_header(image: str, extension: str, data_length: int) -> None:
+def add_header(image: str, extension: str, data_length: int, metadata: dict = None) -> None:
     """
     Adds a header to the cover image before hiding data.
 
@@ -28,6 +42,7 @@ def add_header(image: str, extension: str, data_length: int) -> None:
     - image (str): Path to the cover image.
     - extension (str): File extension to be hidden.
     - data_length (int): Length of the data to be hidden.
+    - metadata (dict): Optional extra fields (e.g. shard information), stored as "key=value;key=value" text.
 
     Returns:
     None
@@ -39,14 +54,6 @@ def add_header(image: str, extension: str, data_length: int) -> None:
     except FileNotFoundError:
         raise FileNotFoundError(f"Image file not found: {image}")
 
-    # Check if the extension is a non-empty string
-    if not extension or not isinstance(extension, str):
-        raise ValueError("Invalid extension. It should be a non-empty string.")
-
-    # Check if data_length is a positive integer
-    if not isinstance(data_length, int) or data_length <= 0:
-        raise ValueError("Invalid data length. It should be a positive integer.")
-
     # Read the cover image
     try:
         with Image.open(image, "r") as cover:
@@ -54,112 +61,213 @@ def add_header(image: str, extension: str, data_length: int) -> None:
     except Exception as e:
         raise Exception(f"Error opening the cover image: {e}")
 
-    # Getting the height of the cover image (we will write the header vertically)
-    height = cover_array.shape[0]
+    write_header(cover_array, extension, data_length, metadata)
+
+    try:
+        save_png(cover_array, image) # Replacing the image in a single step, it's never seen half written
+    except Exception as e:
+        raise Exception(f"Error saving the modified cover image: {e}")
+
+def write_bits(values: np.ndarray, binary: str) -> None:
+    '''writes a string of bits in the last 3 bits of `values` (a view of column 0 of the image), in place'''
+    pixels_needed = int(np.ceil(len(binary) / HEADER_PIXEL_BITS))
+    if pixels_needed > len(values):
+        raise ValueError("Data to be hidden is too large for the given image.")
+
+    # Every group of 3 bits becomes a number between 0 and 7, the last group is padded with zeros
+    bits = np.frombuffer(binary.ljust(pixels_needed * HEADER_PIXEL_BITS, '0').encode(), dtype=np.uint8) - ord('0')
+    numbers = bits.reshape(-1, HEADER_PIXEL_BITS) @ np.array([4, 2, 1], dtype=np.uint8)
+    values[:pixels_needed] = (values[:pixels_needed] >> HEADER_PIXEL_BITS << HEADER_PIXEL_BITS) | numbers # Clearing the last 3 bits, then setting them
+
+def read_bits(values: np.ndarray, length: int) -> str:
+    '''reads `length` bits from the last 3 bits of `values`, the opposite of `write_bits`'''
+    pixels_needed = int(np.ceil(length / HEADER_PIXEL_BITS))
+    if pixels_needed > len(values):
+        raise ValueError("Invalid image format. Insufficient pixels for the header.")
+    return "".join(f"{value & 0b00000111:03b}" for value in values[:pixels_needed])[:length]
+
+def write_header(cover_array: np.ndarray, extension: str, data_length: int, metadata: dict = None) -> None:
+    """
+    Writes the header in column 0 of the cover array, in place.\n
+    RGB and RGBA images use the red channel for the extension, the green one for the data length and the blue one
+    for the metadata, their lengths go in the first pixel. Single channel images (L, I;16) store the three lengths
+    in the first three pixels, then the fields one after the other. The alpha channel is never used by the header.
+
+    Parameters:
+    - cover_array (np.ndarray): Array of the cover image.
+    - extension (str): File extension to be hidden.
+    - data_length (int): Length of the data to be hidden.
+    - metadata (dict): Optional extra fields.
+
+    Returns:
+    int: Number of pixels of column 0 holding the header.
+    """
+    # Check if the extension is a non-empty string
+    if not extension or not isinstance(extension, str):
+        raise ValueError("Invalid extension. It should be a non-empty string.")
+
+    # Check if data_length is a positive integer
+    if not isinstance(data_length, int) or data_length <= 0:
+        raise ValueError("Invalid data length. It should be a positive integer.")
 
     # Convert extension and data_length to binary and get their lengths
     extension_binary = text_to_binary(extension)
-    extension_length = len(extension_binary)
-    
     data_length_binary = text_to_binary(str(data_length))
-    data_length_length = len(data_length_binary)
+    if len(extension_binary) > 255:
+        raise ValueError("Invalid extension. It can't be more than 31 characters.")
 
-    # Check if the data to be hidden is small enough to fit in the image
-    total_bits_needed = extension_length + data_length_length
-    max_bits_available = (height - 1) * 3 * 8  # Height - 1 pixels, 3 channels (RGB), 8 bits per channel
-    if total_bits_needed > max_bits_available:
-        raise ValueError("Data to be hidden is too large for the given image.")
+    # Metadata text, its length is stored in bytes
+    metadata_text = format_metadata(metadata or {})
+    if len(metadata_text) > 255:
+        raise ValueError("Metadata is too long, it can't be more than 255 characters.")
+    metadata_binary = text_to_binary(metadata_text)
 
-    # Writing the extension length and data length length to the first pixel
-    cover_array[0, 0] = [extension_length, data_length_length, 0]
-        
-    # Writing the extension to the next pixels, we will use the 3 red channel bits of each pixel
-    pixel_bits_used = 3 # Number of bits we will use in each pixel
-    pixels_needed = np.ceil(extension_length / pixel_bits_used).astype(int) # Number of pixels needed to store the extension
-    
-    for i in range(pixels_needed):
-        # Get the RGB values of the current pixel
-        r, g, b = cover_array[i + 1, 0] # We start at 1 because we already used the first pixel
-        
-        # Get the bits of the extension that will be stored in the current pixel
-        extension_bits = extension_binary[i * pixel_bits_used : (i + 1) * pixel_bits_used].ljust(pixel_bits_used, '0')
-        
-        # Convert the bits to an integer
-        extension_int = int(extension_bits, 2)
-        
-        # Modify the last 3 bits of the red channel
-        r = (r & 0b11111000) | extension_int # 0b11111000 is used to clear the last 3 bits of the red channel
-        
-        # Replace the RGB values of the current pixel with the modified RGB values
-        cover_array[i + 1, 0] = [r, g, b]
-        
-    # Writing the data length to the next pixels, we will use the 3 green channel bits of each pixel
-    starting_index = 1 + pixels_needed # We start at 1 because we already used the first pixel
-    pixels_needed = np.ceil(data_length_length / pixel_bits_used).astype(int)
-    
-    for i in range(starting_index, starting_index + pixels_needed):
-        # Get the RGB values of the current pixel
-        r, g, b = cover_array[i, 0]
-        
-        # Get the bits of the data length that will be stored in the current pixel
-        data_length_bits = data_length_binary[(i - starting_index) * pixel_bits_used : (i - starting_index + 1) * pixel_bits_used].ljust(pixel_bits_used, '0')
+    lengths = [len(extension_binary), len(data_length_binary), len(metadata_text)]
 
-        # Convert the bits to an integer
-        data_length_int = int(data_length_bits, 2)
-        
-        # Modify the last 3 bits of the green channel
-        g = (g & 0b11111000) | data_length_int
-        
-        # Replace the RGB values of the current pixel with the modified RGB values
-        cover_array[i, 0] = [r, g, b]
-        
-    try:
-        Image.fromarray(cover_array).save(image, format="PNG")
-    except Exception as e:
-        raise Exception(f"Error saving the modified cover image: {e}")
+    if cover_array.ndim == 2:
+        # Single channel image, the lengths take the first three pixels and the fields follow each other
+        cover_array[0:3, 0] = lengths
+        write_bits(cover_array[3:, 0], extension_binary + data_length_binary + metadata_binary)
+    else:
+        # Writing the extension length, data length length and metadata length to the first pixel
+        cover_array[0, 0, :3] = lengths
+
+        # Writing the extension in the red channel and the metadata in the blue one, starting after the first pixel
+        write_bits(cover_array[1:, 0, 0], extension_binary)
+        write_bits(cover_array[1:, 0, 2], metadata_binary)
+
+        # Writing the data length in the green channel, starting after the pixels used by the extension
+        starting_index = 1 + int(np.ceil(len(extension_binary) / HEADER_PIXEL_BITS))
+        write_bits(cover_array[starting_index:, 0, 1], data_length_binary)
+    return header_pixels(lengths, cover_array.ndim == 2)
+
+def header_pixels(lengths: list[int], single_channel: bool = False) -> int:
+    '''number of pixels of column 0 holding a header, from its extension, data length and metadata lengths (see write_header)'''
+    extension_length, data_length_length, metadata_length = lengths
+    if single_channel:
+        return 3 + -(-(extension_length + data_length_length + metadata_length * 8) // HEADER_PIXEL_BITS)
+    return 1 + max(-(-extension_length // HEADER_PIXEL_BITS) + -(-data_length_length // HEADER_PIXEL_BITS),
+                   -(-metadata_length * 8 // HEADER_PIXEL_BITS))
+
+def header_height(extension: str, data_length: int, metadata: dict, mode: str) -> int:
+    '''number of rows a cover of `mode` needs for the header (see write_header), covers of other modes count as RGB
+    since they're converted to it. Lets covers too short for the header be left out before anything is hidden in them'''
+    lengths = [len(text_to_binary(extension)), len(text_to_binary(str(data_length))), len(format_metadata(metadata))]
+    return header_pixels(lengths, mode in COVER_MODES and COVER_MODES[mode][1] == 1)
+
+def job_metadata(stealth: bool = False, adaptive: bool = False, name: str = "", kdf: dict = None) -> dict:
+    '''header metadata encode_image stores besides the layout (see layout_metadata)'''
+    metadata = {}
+    if stealth:
+        metadata["stealth"] = 1
+    if adaptive:
+        metadata["adaptive"] = 1
+    if name:
+        metadata["name"] = name
+    metadata.update(kdf or {})
+    return metadata
+
+def move_header(cover_array: np.ndarray, pixels: int, depth: int) -> None:
+    """
+    Moves the header from the top of column 0 to the start of row 0, in place. It's its own inverse, the same call moves it back.
+
+    PNG images are decoded row by row, with the header in row 0 reading it only needs the first row of the image
+    (see header_array), instead of every row for column 0. The low bits of pixels 1 to `pixels` - 1 of column 0 are swapped
+    with the ones of row 0, the data hidden in row 0 goes to column 0 and the header to row 0, the image looks the same.
+    The lengths of single channel images (pixels 1 and 2) are swapped whole. The extension length in pixel (0,0) gets
+    SCANLINE_FLAG, it tells where the header is.
+
+    Parameters:
+    - cover_array (np.ndarray): Array of the image, with the header and the data.
+    - pixels (int): Number of pixels holding the header, see write_header.
+    - depth (int): Number of bits hidden in each channel by the data.
+
+    Returns:
+    None
+    """
+    if pixels > min(cover_array.shape[:2]):
+        raise ValueError("The image is too narrow to hold the header in its first row.")
+
+    whole = 3 if cover_array.ndim == 2 else 1 # The lengths of single channel images are stored whole
+    column, row = cover_array[1:whole, 0].copy(), cover_array[0, 1:whole].copy()
+    cover_array[1:whole, 0], cover_array[0, 1:whole] = row, column
+
+    mask = cover_array.dtype.type((1 << max(HEADER_PIXEL_BITS, depth)) - 1)
+    column, row = cover_array[whole:pixels, 0].copy(), cover_array[0, whole:pixels].copy()
+    cover_array[whole:pixels, 0] = (column & ~mask) | (row & mask)
+    cover_array[0, whole:pixels] = (row & ~mask) | (column & mask)
+
+    if cover_array.ndim == 2:
+        cover_array[0, 0] ^= SCANLINE_FLAG
+    else:
+        cover_array[0, 0, 0] ^= SCANLINE_FLAG
 
-              
 def get_header(image: str) -> dict:
     
     try:
         # Check if the image file exists
-        with open(image, 'rb'):
-            pass
+        if isinstance(image, (str, os.PathLike)):
+            with open(image, 'rb'):
+                pass
     except FileNotFoundError:
         raise FileNotFoundError(f"Image file not found: {image}")
 
     try:
-        with Image.open(image, "r") as cover:
-            cover_array = np.array(cover)
+        cover_array = header_array(image)
     except Exception as e:
         raise Exception(f"Error opening the cover image: {e}")
 
-    # Get the extension length and data length length from the first pixel
-    try:
-        extension_length, data_length_length, _ = cover_array[0, 0]
-    except IndexError:
-        raise ValueError("Invalid image format. Header information not found.")
+    return read_header(cover_array)
 
-    # Get the extension from the next pixels, we will use the 3 red channel bits of each pixel
-    extension = ""
-    pixel_bits_used = 3  # Number of bits we will use in each pixel
-    pixels_needed = np.ceil(extension_length / pixel_bits_used).astype(int)
+def header_array(image) -> np.ndarray:
+    '''returns the pixels of an image (path or file object) holding its header, shaped like column 0 (see read_header):
+    the start of row 0 when the header was moved there (see move_header), the top of column 0 otherwise.
+    Only the rows needed are decoded for PNG images, a single one for headers in row 0 (see scanlines.py)'''
+    with RowReader(image) as reader:
+        first_row = reader.read(1)
+        if int(first_row.reshape(-1)[0]) & SCANLINE_FLAG:
+            return first_row.swapaxes(0, 1) # Row 0 as a column
 
-    for i in range(pixels_needed):
-        # Get the RGB values of the current pixel
-        try:
-            r, _, _ = cover_array[i + 1, 0]  # We start at 1 because we already used the first pixel
-        except IndexError:
-            raise ValueError("Invalid image format. Insufficient pixels for extension.")
+        # The lengths in the first pixel(s) tell how many rows the header takes
+        single_channel = first_row.ndim == 2
+        top = reader.read(3)[:, :1] if single_channel else first_row[:, :1]
+        lengths = [int(value) for value in (top[:3, 0] if single_channel else top[0, 0, :3])]
+        return reader.read(header_pixels(lengths, single_channel))[:, :1]
 
-        # Get the last 3 bits of the red channel
-        extension_bits = f"{r & 0b00000111:03b}"
+def read_header(cover_array: np.ndarray) -> dict:
+    """
+    Reads the header from the array of an image (only column 0 is needed).
 
-        # Add the bits to the extension
-        extension += extension_bits
+    Parameters:
+    - cover_array (np.ndarray): Array of the image, or of its first column (see header_array).
 
-    # Remove extra bits beyond the extension length
-    extension = extension[:extension_length]
+    Returns:
+    dict: The header fields, "extension", "data_length" and "metadata" (empty for older images),
+    with "scanline" (the header was moved to row 0, see move_header) and the number of "pixels" it takes.
+    """
+    # Get the extension length, data length length and metadata length
+    try:
+        if cover_array.ndim == 2:
+            extension_length, data_length_length, metadata_length = (int(value) for value in cover_array[0:3, 0])
+        else:
+            extension_length, data_length_length, metadata_length = (int(value) for value in cover_array[0, 0, :3])
+    except (IndexError, ValueError):
+        raise ValueError("Invalid image format. Header information not found.")
+    scanline = bool(extension_length & SCANLINE_FLAG) # Header moved to row 0, the array given is row 0
+    extension_length &= ~SCANLINE_FLAG
+    pixels = header_pixels([extension_length, data_length_length, metadata_length], cover_array.ndim == 2)
+    metadata_length *= 8 # Stored in bytes
+
+    if cover_array.ndim == 2:
+        binary = read_bits(cover_array[3:, 0], extension_length + data_length_length + metadata_length)
+        extension = binary[:extension_length]
+        data_length = binary[extension_length:extension_length + data_length_length]
+        metadata = binary[extension_length + data_length_length:]
+    else:
+        extension = read_bits(cover_array[1:, 0, 0], extension_length)
+        metadata = read_bits(cover_array[1:, 0, 2], metadata_length)
+        starting_index = 1 + int(np.ceil(extension_length / HEADER_PIXEL_BITS))
+        data_length = read_bits(cover_array[starting_index:, 0, 1], data_length_length)
 
     # Convert the extension to text
     try:
@@ -167,28 +275,6 @@ def get_header(image: str) -> dict:
     except ValueError as e:
         raise ValueError(f"Error converting extension to text: {e}")
 
-    # Get the data length from the next pixels, we will use the 3 green channel bits of each pixel
-    starting_index = 1 + pixels_needed  # We start at 1 because we already used the first pixel
-    pixels_needed = np.ceil(data_length_length / pixel_bits_used).astype(int)
-
-    data_length = ""
-
-    for i in range(starting_index, starting_index + pixels_needed):
-        # Get the RGB values of the current pixel
-        try:
-            _, g, _ = cover_array[i, 0]
-        except IndexError:
-            raise ValueError("Invalid image format. Insufficient pixels for data length.")
-
-        # Get the last 3 bits of the green channel
-        data_length_bits = f"{g & 0b00000111:03b}"
-
-        # Add the bits to the data length
-        data_length += data_length_bits
-
-    # Remove extra bits beyond the data length
-    data_length = data_length[:data_length_length]
-
     # Convert the data length to text and remove null characters
     try:
         data_length = binary_to_text(data_length).replace('\x00', '')
@@ -197,207 +283,512 @@ def get_header(image: str) -> dict:
 
     return {
         "extension": extension,
-        "data_length": int(data_length)
+        "data_length": int(data_length),
+        "metadata": parse_metadata(binary_to_text(metadata)),
+        "scanline": scanline,
+        "pixels": pixels
     }
 
+def cover_layout(mode: str, alpha: bool = False, depth: int = None) -> tuple[int, int]:
+    """
+    Chooses how data is hidden in a cover of the given mode.
+
+    Parameters:
+    - mode (str): PIL mode of the cover, see kernels.COVER_MODES.
+    - alpha (bool): Also hide data in the alpha channel (RGBA covers only), 33% more capacity.
+    - depth (int): Number of bits hidden in each channel, defaults to 2 (4 for 16-bit covers).
+
+    Returns:
+    tuple: (channels, depth)
+    """
+    if mode not in COVER_MODES:
+        raise ValueError(f"Unsupported cover mode '{mode}', supported modes are {', '.join(COVER_MODES)}.")
+    _, channels, default_depth = COVER_MODES[mode]
+
+    if alpha:
+        if mode != "RGBA":
+            raise ValueError("Only RGBA covers have an alpha channel to hide data in.")
+        channels = 4
+
+    depth = depth or default_depth
+    if depth not in VALID_DEPTHS or (depth == 8 and mode != "I;16"):
+        raise ValueError(f"Invalid depth {depth}, it must be 1, 2 or 4 (or 8 for 16-bit covers).")
+    return channels, depth
+
+def layout_metadata(mode: str, channels: int, depth: int) -> dict:
+    '''header metadata describing a layout, nothing is stored for the default RGB layout (so older versions can read it)'''
+    metadata = {}
+    if channels != COVER_MODES[mode][1]:
+        metadata["channels"] = channels
+    if depth != CRUMB_SIZE:
+        metadata["depth"] = depth
+    return metadata
+
+def header_layout(header: dict, mode: str) -> tuple[int, int]:
+    '''returns the (channels, depth) layout used to hide the data, read from the header'''
+    if mode == "P" and "frames" in header["metadata"]:
+        mode = "L" # GIF carriers hide data in the palette indices (see frames.py)
+    if mode not in COVER_MODES:
+        raise ValueError(f"Unsupported image mode '{mode}'.")
+    channels = int(header["metadata"].get("channels", COVER_MODES[mode][1]))
+    depth = int(header["metadata"].get("depth", CRUMB_SIZE))
+    if channels > COVER_MODES[mode][0] or depth not in VALID_DEPTHS:
+        raise ValueError("Invalid image format. Invalid layout in the header.")
+    return channels, depth
+
+def check_header(header: dict, size: tuple, mode: str = "RGB") -> None:
+    """
+    Makes sure a header read from an image is plausible, images without hidden data give random garbage.
+
+    Parameters:
+    - header (dict): Header returned by `get_header`/`read_header`.
+    - size (tuple): Size (width, height) of the image the header comes from.
+    - mode (str): Mode of the image the header comes from.
+
+    Returns:
+    None, raises a ValueError if the image doesn't look like it contains a hidden file.
+    """
+    data_length = header["data_length"]
+    extension = header["extension"].replace("\x01", "_")
+    channels, depth = header_layout(header, mode)
+
+    # encode_image always hides whole bytes, and the data must fit inside the image
+    if data_length <= 0 or data_length % 8:
+        raise ValueError("Image doesn't contain a hidden file (invalid data length).")
+    frames = int(header["metadata"].get("frames", 1)) # Animations hold the data in several frames
+    if data_length > layout_capacity((size[1], size[0]), 1, channels, depth) * max(frames, 1):
+        raise ValueError("Image doesn't contain a hidden file (data length larger than the image).")
+
+    # Extensions are short printable strings, without path separators
+    if not extension.isprintable() or any(separator in extension for separator in "/\\:"):
+        raise ValueError("Image doesn't contain a hidden file (invalid extension).")
+
 # Getting the RGB of each pixel in the cover image, then converting it to binary and modifying the LSB
-def encode_image(file: str, image: str, output_directory: str = "", encrypt: bool = False, compress = False) -> None:
+def layout_chunks(steg_array: np.ndarray, size: int, channels: int, depth: int, stealth_key: str = "", adaptive: bool = False, shared_steg: SharedArray = None, workers: int = 1):
+    '''reveals `size` bytes in chunks with the layout they were hidden with: stealth when a stealth key is given,
+    adaptive, or column by column (by `workers` processes reading `shared_steg` when there are several)'''
+    if stealth_key:
+        return extract_stealth_chunks(steg_array, size, stealth_key, channels, depth)
+    if adaptive:
+        return extract_adaptive_chunks(steg_array, size, channels, depth)
+    if workers > 1:
+        return extract_chunks_parallel(shared_steg, size, workers, 1, channels, depth)
+    return extract_chunks(steg_array, size, 1, 0, channels, depth)
+
+def verify_embedding(steg_array: np.ndarray, data, mode: str, stealth_key: str = "", shared_steg: SharedArray = None, workers: int = 1) -> None:
+    """
+    Checks that the data can be revealed from a stego array before it's saved.
+
+    The header is read back from the array and the data revealed exactly like decode_image does,
+    then its sha256 is compared with the one of the hidden data.
+
+    Parameters:
+    - steg_array (np.ndarray): Array of the cover, with the data and the header hidden in it.
+    - data (bytes-like): Data that was hidden.
+    - mode (str): Mode of the image.
+    - stealth_key (str): Key used in stealth mode.
+    - shared_steg (SharedArray): Shared memory holding `steg_array`, when revealing with several workers.
+    - workers (int): Number of processes used to reveal the data.
+
+    Returns:
+    None, raises a ValueError when the revealed data differs.
+    """
+    header = read_header(steg_array[:, :1])
+    check_header(header, (steg_array.shape[1], steg_array.shape[0]), mode)
+    channels, depth = header_layout(header, mode)
+    stealth = header["metadata"].get("stealth") == "1"
+    adaptive = header["metadata"].get("adaptive") == "1"
+
+    size = -(-header["data_length"] // 8)
+    digest = hashlib.sha256()
+    for chunk in layout_chunks(steg_array, size, channels, depth, stealth_key if stealth else "", adaptive, shared_steg, workers):
+        digest.update(chunk)
+
+    if size != len(data) or digest.digest() != hashlib.sha256(data).digest():
+        raise ValueError("Verification failed, the data revealed from the image differs from the hidden data.")
+
+def write_key_file(path: str, text: str) -> str:
+    '''writes a key file under a name no other job uses (see utils.publish), returns its path'''
+    key_file = AtomicFile(path, unique=True, text=True)
+    with key_file as f:
+        f.write(text)
+    return key_file.path
+
+def write_keys(image_path: str, encryption_key: bytes = None, stealth_key: str = "") -> None:
+    '''writes the keys generated while hiding a file next to the stego image ({image}.key and {image}.stealth.key).
+    Images written to a stream have no name to give to the keys, they're printed to stderr instead: key files with a
+    fixed name in a shared directory couldn't be told apart from the ones of the other jobs'''
+    if not image_path:
+        if encryption_key:
+            print(f"This is your encryption key, keep it safe, you will need it to decrypt the data: {encryption_key}", file=sys.stderr)
+        if stealth_key:
+            print(f"This is your stealth key, keep it safe, you will need it to reveal the data: {stealth_key}", file=sys.stderr)
+        return
+
+    stem = os.path.splitext(image_path)[0]
+    key_path, stealth_key_path = f"{stem}.key", f"{stem}.stealth.key"
+    if encryption_key:
+        key_path = write_key_file(key_path, f"This is your encryption key, keep it safe, you will need it to decrypt the data: {encryption_key}")
+        print(f"Encryption key saved to {key_path}")
+    if stealth_key:
+        stealth_key_path = write_key_file(stealth_key_path, f"This is your stealth key, keep it safe, you will need it to reveal the data: {stealth_key}")
+        print(f"Stealth key saved to {stealth_key_path}")
+
+@metrics.job("encode")
+def encode_image(file, image: str, output_directory: str = "", encrypt: bool = False, compress = False, workers: int = 1, alpha: bool = False, depth: int = None, extension: str = "", stealth: bool = False, stealth_key: str = "", adaptive: bool = False, verify: bool = False, name: str = "", output = None, output_path: str = "", password: str = "", scanline: bool = False) -> str:
+    '''hides `file` in the cover `image`, `file` is a path or any bytes-like object (bytes, memoryview, numpy array...),
+    in which case `extension` gives the extension of the revealed file (default: bin).
+    `file` can also be a binary file object or "-" (stdin), the data is then compressed, encrypted and hidden while
+    it's read, without ever holding it whole (stealth, adaptive, verify and animations need it whole, it's read in memory).
+    `image` can be "-" to read the cover from stdin. `name` is stored in the header, the file is revealed under it
+    (its extension is used when `extension` isn't given). The image is saved to `output` when it's given
+    (any object with a `write` method, e.g. sys.stdout.buffer) instead of a file in `output_directory`.
+    The image is written to a temporary file first and renamed once complete. It's saved to `output_path` when it's given
+    (replacing it), otherwise as Cover_{extension}.png, or Cover_{extension}-1.png... when another job already took the name,
+    so jobs running side by side in the same directory never write to the same file. Generated keys are saved next to it.
+    Returns the path of the image (None when it's written to `output`).
+    In stealth mode the data is scattered across the cover in an order derived from `stealth_key` (see stealth.py),
+    in adaptive mode it's hidden in the most textured pixels first (see adaptive.py).
+    With `verify` the data is revealed from the stego array before it's saved, nothing is written if it differs.
+    With a `password` the data is encrypted with a key derived from it (see passwords.py), the salt is stored in the
+    header instead of a key file being written. With `scanline` the header is moved to the first row of the image,
+    it's then read by decoding that row only (see move_header), older versions can't read such images'''
     print('please wait, cheking files...', end='')
-    time.sleep(1)
-    try:
-        # Check if the file to hide exists
-        with open(file, 'rb') as f:
-            pass
-    except FileNotFoundError:
-        raise FileNotFoundError(f"File to hide not found: {file}")
+    pause()
+    if isinstance(file, str) and file == STDIO:
+        file = sys.stdin.buffer
+    image = stdin_image(image)
+    is_path = isinstance(file, (str, os.PathLike))
+    if is_path:
+        try:
+            # Check if the file to hide exists
+            with open(file, 'rb') as f:
+                pass
+        except FileNotFoundError:
+            raise FileNotFoundError(f"File to hide not found: {file}")
 
     try:
         # Check if the cover image file exists
-        with open(image, 'rb'):
-            pass
+        if isinstance(image, (str, os.PathLike)):
+            with open(image, 'rb'):
+                pass
     except FileNotFoundError:
         raise FileNotFoundError(f"Cover image file not found: {image}")
 
-    # Get the binary data of a file to hide
-    with open(file, "rb") as f:
-        data = "".join([f"{byte:08b}" for byte in f.read()])
-        data_length = len(data)
-    
+    if stealth and adaptive:
+        raise ValueError("Stealth and adaptive modes can't be used together.")
+    generated_stealth_key = "" # Stealth key generated for this job, saved with the image
+    animation = is_animation(image)
+    if animation and (stealth or adaptive or alpha or verify or scanline):
+        raise ValueError("Stealth, adaptive, alpha, verify and scanline header modes can't be used with animations.")
+    if animation and output is not None:
+        raise ValueError("Animations can only be saved to a file, their container is completed once all the frames are written.")
+    if adaptive:
+        workers = 1 # The adaptive layout is written by a single process
+
+    # Stealth mode needs a key to scatter the data, one is generated if the user didn't give any
+    if stealth:
+        workers = 1 # The scattered layout is written by a single process
+        if not stealth_key:
+            stealth_key = generated_stealth_key = secrets.token_urlsafe(16) # Saved with the image, once it's written
+
+    # Data read from a stream is hidden while it's read, unless the layout needs all of it first
+    stream = hasattr(file, "read")
+    if stream and (stealth or adaptive or verify or animation):
+        file = file.read()
+        stream = False
+    if stream:
+        workers = 1 # The stream is read and hidden by a single process
+
+    # The encryption key is generated first, streamed data is encrypted while it's hidden, it's saved with the image
+    key = Fernet.generate_key() if encrypt else None
+    kdf = {} # Salt and parameters of the key derived from the password, stored in the header
+    if password:
+        encrypt = True
+        key, kdf = KEY_CACHE.encryption_key(password)
+    saved_key = key if not password else None # Only random keys are saved, the password is enough to derive the other ones
+
+    if stream:
+        # Chunks of the stream, compressed and encrypted on the fly, the data length is only known once they're all hidden
+        chunks = file_chunks(file)
+        if compress:
+            chunks = compress_chunks(chunks)
+        if encrypt:
+            chunks = encrypt_chunks(chunks, key)
+        data = None
+    else:
+        # Get the data of the file to hide, files are memory-mapped and buffers viewed in place, nothing is copied
+        data = load_payload(file)
+
     # Compress the data if the user wants to
-    if compress:
+    if compress and not stream:
         print('compressing data...')
         try:
-            data = zlib.compress(data.encode())
+            with metrics.stage("encode", "compress"):
+                data = zlib.compress(data)
         except Exception as e:
             raise Exception(f"Error compressing the data: {e}")
-        else:
-            data_length = len(data) # Update the data length
-            data = "".join([f"{byte:08b}" for byte in data]) # Convert the data back to binary (zlib compresses the data and converts it to bytes)
 
     # If the user wants to encrypt the data (python vangonography.py -cli -e --encrypt -f tests/input/Test.txt -o C:\Users\jizos\Desktop -c ..\img\Cat.jpg)
-    if encrypt:
+    if encrypt and not stream:
         print('encrypting data...')
-        key = Fernet.generate_key() # Generate a key for encryption
-        with open("key.key", "wb") as key_file:
-            key_file.write(f"This is your encryption key, keep it safe, you will need it to decrypt the data: {key}".encode()) # Write the key to a file
         # Encrypt the data
         try:
             f = Fernet(key) # Create a Fernet object
-            data = f.encrypt(data.encode()) # Encrypt the data
-            data = "".join([f"{byte:08b}" for byte in data]) # Convert the data back to binary (Fernet encrypts the data and converts it to bytes)
+            with metrics.stage("encode", "encrypt"):
+                data = f.encrypt(data if isinstance(data, bytes) else data.tobytes()) # Encrypt the data (Fernet only takes bytes)
         except Exception as e:
             raise Exception(f"Error encrypting the data: {e}")
 
+    # The header stores the length in bits, computed after compression and encryption since they change the size
+    data_length = len(data) * 8 if not stream else None
+
     # Get the extension of the file to hide
-    extension = os.path.splitext(file)[1][1:]
+    if is_path:
+        extension = extension or os.path.splitext(file)[1][1:]
+    elif name and "." in name:
+        extension = extension or name.rpartition(".")[2]
+    else:
+        extension = extension or "bin"
+
+    # Animations (APNG, WebP, GIF) are filled and written frame by frame, see frames.py
+    if animation:
+        with Image.open(image, 'r') as cover:
+            container = FRAME_FORMATS[cover.format]
+        output_filename = f"Cover_{extension}{'_encrypted' if encrypt else ''}.{container}"
+        if output_directory:
+            output_filename = os.path.join(output_directory, output_filename)
+
+        clear_previous_print_value()
+        print(' Hiding file across the frames...', end='\r')
+        temporary_path = temporary_name(output_path or output_filename)
+        try:
+            try:
+                with metrics.stage("encode", "frames"):
+                    encode_frames(data, image, temporary_path, extension, workers, depth, {**kdf, **({"name": name} if name else {})} or None)
+                output_filename = publish(temporary_path, output_path or output_filename, unique=not output_path)
+            except BaseException:
+                if os.path.exists(temporary_path):
+                    os.remove(temporary_path) # Not leaving half written animations behind
+                raise
+        except ValueError:
+            raise
+        except Exception as e:
+            raise Exception(f"Error hiding the file in the animation: {e}")
+        write_keys(output_filename, saved_key)
 
-    # Read the cover image and work with it
+        metrics.inc("vangonography_bytes_total", data_length // 8, operation="encode")
+        clear_previous_print_value()
+        print(f'Process Complete\n'
+              f'Animation with Hidden file "{os.path.basename(output_filename)}" '
+              f'saved succefully at "{os.path.dirname(output_filename)}"')
+        return output_filename
+
+    # Read the cover image and work with it, when using several workers the array is placed in shared memory
     try:
         with Image.open(image, 'r') as cover:
-            cover_array = np.array(cover)
+            # Modes we can't hide data in (palette, CMYK...) are converted to RGB
+            if cover.mode not in COVER_MODES:
+                cover = cover.convert("RGB")
+            mode = cover.mode
+            channels, depth = cover_layout(mode, alpha, depth)
+
+            # Checking the size from the image header, before decoding all of its pixels (streams are checked while they're hidden)
+            if not stream and layout_capacity((cover.height, cover.width), 1, channels, depth) < data_length:
+                raise ValueError("Cover image is too small to hide the data.")
+
+            with metrics.stage("encode", "load"):
+                if workers > 1:
+                    shared_cover = SharedArray.from_array(cover)
+                    cover_array = shared_cover.array
+                else:
+                    cover_array = np.array(cover)
+    except ValueError:
+        raise
     except Exception as e:
         raise Exception(f"Error opening the cover image: {e}.\nMake sure it is a valid image file.")
 
-    # Getting the width and height of the cover image
-    width = cover_array.shape[1]
-    height = cover_array.shape[0]
-    
-    # Checking if the cover image is large enough to hide the data
-    if width * height * (SINGLE_RGB_PIXEL_BIT_SIZE * 2) < data_length:
-        raise ValueError("Cover image is too small to hide the data.")
-
-    data_index = 0
-    bitmask = 0b11111100  # Used to clear the last two bits of a number
-
     clear_previous_print_value()
-    percents = range(100+1); ptrack = set()#to track printed percentages
-
-    # Looping through each pixel in the cover image
-    for i in range(1, width):  # Loop through each column
-
-        # Checking if there's still data to hide
-        if data_index >= len(data):
-            break  # Exit the outer loop if all data is processed
-
-        for j in range(height):  # Loop through each row
-
-            # Checking if there's still data to hide
-            if data_index >= len(data):
-                break  # Exit the inner loop if all data is processed
+    print(' Hiding file...', end='\r')
 
-            
-
-            # Modify the last two bits of each channel
-            for k in range(3):
-                if data_index < len(data):
-                    cover_array[j, i][k] = (cover_array[j, i][k] & bitmask) | int(data[data_index:data_index + 2], 2)
-                    data_index += 2  # Increment the data index by 2 because we're processing 2 bits at a time
-                    # print percentages
-                    percentage = int(((data_index - len(data)) / len(data)) * 100 + 100)
-                    if percentage in percents and percentage not in ptrack:
-                        ptrack.add(percentage)
-                        print(f' Hiding file...{percentage}%', end='\r')
-                else:
-                    break
-                
     # Save the modified cover image as "Cover_{extension}.png"
     output_filename = f"Cover_{extension}.png"
     if encrypt:
         output_filename = f"Cover_{extension}_encrypted.png"
     if output_directory:
         output_filename = os.path.join(output_directory, output_filename)
-    
-    try:
-        Image.fromarray(cover_array).save(output_filename, format="PNG")
-    except Exception as e:
-        raise Exception(f"Error saving the modified cover image: {e}")
 
-    # Add header to the modified cover image
     try:
+        # Hiding the data column by column, starting from column 1 (column 0 holds the header)
+        with metrics.stage("encode", "embed"):
+            if stream:
+                data_length = embed_chunks(cover_array, chunks, 1, channels, depth) * 8
+            elif workers > 1:
+                # Files hidden as they are are memory-mapped by every worker, instead of being copied to shared memory
+                payload = os.fspath(file) if is_path and not (compress or encrypt) else data
+                embed_parallel(shared_cover, payload, workers, 1, channels, depth)
+            else:
+                if stealth:
+                    embed_stealth(cover_array, data, stealth_key, channels, depth)
+                elif adaptive:
+                    embed_adaptive(cover_array, data, channels, depth)
+                else:
+                    embed(cover_array, data, 1, 0, channels, depth)
 
-        add_header(output_filename, extension, data_length)
-    except Exception as e:
-        raise Exception(f"Error adding header to the modified cover image: {e}")
-    else:
-        clear_previous_print_value()
+        # Add header to the modified cover array, the image is then saved only once
+        try:
+            metadata = {**layout_metadata(mode, channels, depth), **job_metadata(stealth, adaptive, name, kdf)}
+            with metrics.stage("encode", "header"):
+                header_size = write_header(cover_array, extension, data_length, metadata)
+        except Exception as e:
+            raise Exception(f"Error adding header to the modified cover image: {e}")
+
+        # Revealing the data from memory before anything is written, a failed check leaves no image behind
+        if verify:
+            print(' Verifying...', end='\r')
+            with metrics.stage("encode", "verify"):
+                verify_embedding(cover_array, data, mode, stealth_key, shared_cover if workers > 1 else None, workers)
+
+        # Moving the header to row 0 once everything is hidden and verified
+        if scanline:
+            move_header(cover_array, header_size, depth)
+
+        try:
+            with metrics.stage("encode", "save"):
+                if output is None:
+                    output_filename = save_png(cover_array, output_path or output_filename, unique=not output_path)
+                else:
+                    Image.fromarray(cover_array).save(output, format="PNG")
+        except Exception as e:
+            raise Exception(f"Error saving the modified cover image: {e}")
+    finally:
+        if workers > 1:
+            del cover_array
+            shared_cover.close()
+
+    write_keys(output_filename if output is None else "", saved_key, generated_stealth_key)
+
+    metrics.inc("vangonography_bytes_total", data_length // 8, operation="encode")
+    clear_previous_print_value()
+    if output is None:
         print(f'Process Complete\n'
               f'Image with Hidden file "{os.path.basename(output_filename)}" '
               f'saved succefully at "{os.path.dirname(output_filename)}"')
+        return output_filename
+    print('Process Complete')
 
                             
-def decode_image(image, output_directory: str = "", open_on_success: bool = False, decrypt: bool = False, key: str = "", compressed = False) -> None:
+@metrics.job("decode")
+def decode_image(image, output_directory: str = "", open_on_success: bool = False, decrypt: bool = False, key: str = "", compressed = False, workers: int = 1, output = None, stealth_key: str = "", output_path: str = "", password: str = "") -> str:
+    '''reveals the file hidden in `image`, the data is streamed to Output.{extension} in `output_directory`
+    (or to the name stored in the header when the file was hidden with one, Output-1.{extension}... when another
+    job already took the name), to `output_path` when it's given (replacing it),
+    or to `output` when it's given (any object with a `write` method, e.g. sys.stdout.buffer).
+    Files are written under a temporary name and renamed once complete, returns the path of the revealed file.
+    `image` can be "-" to read the image from stdin.
+    `stealth_key` is needed for images encoded in stealth mode, `password` for data encrypted with a password
+    (the derived keys are cached, see passwords.py)'''
+    image = stdin_image(image)
     try:
         # Check if the image file exists
-        with open(image, 'rb'):
-            pass
+        if isinstance(image, (str, os.PathLike)):
+            with open(image, 'rb'):
+                pass
     except FileNotFoundError:
         raise FileNotFoundError(f"Image file not found: {image}")
 
     try:
         # Get header information
-        header_info = get_header(image)
+        with metrics.stage("decode", "header"):
+            header_info = get_header(image)
         extension = header_info["extension"].replace("\x01", "_")
         data_length = header_info["data_length"]
+
+        # Fail early on images without hidden data, instead of revealing garbage from the whole image
+        with Image.open(image, 'r') as steg_image:
+            check_header(header_info, steg_image.size, steg_image.mode)
+            channels, depth = header_layout(header_info, steg_image.mode)
+        stealth = header_info["metadata"].get("stealth") == "1"
+        adaptive = header_info["metadata"].get("adaptive") == "1"
+        frames = int(header_info["metadata"].get("frames", 0))
+        kdf = kdf_parameters(header_info["metadata"])
     except Exception as e:
         raise Exception(f"Error decoding header information: {e}")
 
+    # Data encrypted with a password is decrypted with the key derived from it, with the salt of the header
+    if password:
+        key = KEY_CACHE.decryption_key(password, header_info["metadata"])
+        decrypt = True
+    elif kdf and decrypt and not key:
+        raise ValueError("The data was encrypted with a password, you must give the password to decrypt it.")
+
+    if stealth:
+        if not stealth_key:
+            raise ValueError("The file was hidden in stealth mode, you must give the stealth key to reveal it.")
+        workers = 1 # The scattered layout is read by a single process
+    if adaptive or frames:
+        workers = 1 # Animations are read frame by frame, while they are revealed
+
     try:
-        with Image.open(image, 'r') as steg_image:
-            steg_array = np.array(steg_image)
+        with Image.open(image, 'r') as steg_image, metrics.stage("decode", "load"):
+            if frames:
+                steg_array = None
+            elif workers > 1:
+                shared_steg = SharedArray.from_array(steg_image)
+                steg_array = shared_steg.array
+            else:
+                steg_array = np.array(steg_image)
     except Exception as e:
         raise Exception(f"Error opening the stego image: {e}")
 
-    width = steg_array.shape[1]
-    height = steg_array.shape[0]
+    # A header moved to row 0 goes back to column 0, the data hidden in row 0 is then back in place
+    if header_info["scanline"] and steg_array is not None:
+        move_header(steg_array, header_info["pixels"], depth)
 
-    # This is a bit hard to explain, but basically, we're getting the last two bits of each RGB value and concatenating them to form a binary string
-    binary_string = "".join([
-        f"{(steg_array[j, i][0] & 0b00000011):02b}{(steg_array[j, i][1] & 0b00000011):02b}{(steg_array[j, i][2] & 0b00000011):02b}"
-        for i in range(1, width) for j in range(height)
-        if data_length > 0
-    ])
-    binary_string = binary_string[:data_length]  # Truncate the binary string to the length of the data
-    
-    # If the initial data was compressed, decompress it (TODO: Add a way to check if the data was compressed without needing the user to specify it)
-    if compressed:
-        try:
-            binary_string = zlib.decompress(binary_string.encode())
-        except Exception as e:
-            raise Exception(f"Error decompressing the data: {e}")
-        binary_string = "".join([f"{byte:08b}" for byte in binary_string]) # Convert the data back to binary (zlib compresses the data and converts it to bytes)
-
-    # If the user wants to decrypt the data
-    if decrypt:
-        if not key:
-            # Additional error checking
-            raise ValueError("No key was given, you must give a key to decrypt the data.") # Check if the user gave a key
-        try:
-            f = Fernet(key) # Create a Fernet object
-            binary_string = f.decrypt(binary_string.encode()) # Decrypt the data
-        except Exception as e:
-            raise Exception(f"Error decrypting the data: {e}")
-
-    # Saving the file
-    output_filename = f"Output.{extension}"
+    # Saving the file under the name it was hidden with, Output.{extension} otherwise (or writing to the object given by the caller)
+    name = header_info["metadata"].get("name", "")
+    output_filename = name if is_safe_name(name) else f"Output.{extension}"
     if output_directory:
         output_filename = os.path.join(output_directory, output_filename)
-    
+
+    # Getting the last bits of each channel column by column, chunk by chunk, and passing every chunk
+    # through the decryption and decompression stages (decryption comes first, since encode_image compresses before encrypting)
+    def source():
+        if frames:
+            return extract_frame_chunks(image, -(-data_length // 8), channels, depth, frames)
+        return layout_chunks(steg_array, -(-data_length // 8), channels, depth, stealth_key if stealth else "", adaptive,
+                             shared_steg if workers > 1 else None, workers)
+
+    # Revealing, decrypting, decompressing and writing all happen in the same stream, they are timed as a single stage
     try:
-        # Make a file out of the binary string then adding the file extension
-        binary_to_file(binary_string, output_filename)
-    except Exception as e:
-        raise Exception(f"Error creating output file: {e}")
-    else:
+        chunks = reveal_chunks(source, decrypt, key, compressed)
+        if output is None:
+            output_file = AtomicFile(output_path or output_filename, unique=not output_path)
+            with output_file as f, metrics.stage("decode", "reveal"):
+                written = write_chunks(chunks, f)
+            output_filename = output_file.path # Renamed once complete, no half revealed file is ever left behind
+        else:
+            with metrics.stage("decode", "reveal"):
+                written = write_chunks(chunks, output)
+        metrics.inc("vangonography_bytes_total", written, operation="decode")
+    finally:
+        if workers > 1:
+            del steg_array
+            shared_steg.close()
+
+    if output is None:
         print(f"successfully extracted file '{os.path.basename(output_filename)}' to '{os.path.dirname(output_filename)}'")
-    
+
     # Open the file if the user wants to
-    if open_on_success:
+    if open_on_success and output is None:
         try:
             os.startfile(output_filename)
         except Exception as e:
             raise Exception(f"Error opening output file make sure you have the right program to open it: {e}")
+    return output_filename if output is None else None
 
-def differentiate_image(source, cover, output_directory: str = "") -> None:
+@metrics.job("difference")
+def differentiate_image(source, cover, output_directory: str = "") -> str:
     try:
         # Check if the source image file exists
         with open(source, 'rb'):
@@ -420,29 +811,12 @@ def differentiate_image(source, cover, output_directory: str = "") -> None:
     except Exception as e:
         raise Exception(f"Error opening source or cover image: {e}")
 
-    # We only get 1 image's width and height because we assume that the 2 images have the same dimensions
-    width = source_array.shape[1]
-    height = source_array.shape[0]
-
-    # Create a new image called "Difference.png" that will show the scaled difference between the source and cover images
-    difference_array = np.zeros((height, width, 3), dtype=np.uint8)
-
-    # Loop through each pixel in the source and cover images
-    for i in range(width):
-        for j in range(height):
-            # Get the RGB values of the current pixel at both images
-            r, g, b = source_array[j, i]
-            r2, g2, b2 = cover_array[j, i]
-
-            # Scale the differences to a visible range (e.g., 0-255)
-            scaled_difference = (
-                # Adding 128 to the difference to make it visible
-                np.uint8(min(255, max(0, np.int16(r2) - np.int16(r) + 128))),
-                np.uint8(min(255, max(0, np.int16(g2) - np.int16(g) + 128))),
-                np.uint8(min(255, max(0, np.int16(b2) - np.int16(b) + 128)))
-            )
-
-            difference_array[j, i] = scaled_difference
+    # Difference between the two images, scaled to a visible range (e.g., 0-255) by adding 128 to it
+    try:
+        with metrics.stage("difference", "compare"):
+            difference_array = difference(source_array, cover_array)
+    except ValueError as e:
+        raise ValueError(f"Error comparing the images: {e}")
 
     # Go look at the code for encode_image() to understand how this works
     output_filename = "Difference.png"
@@ -450,13 +824,16 @@ def differentiate_image(source, cover, output_directory: str = "") -> None:
         output_filename = os.path.join(output_directory, output_filename)
     
     try:
-        Image.fromarray(difference_array).save(output_filename, format="PNG")
+        # Saved as Difference-1.png... when another job already took the name
+        output_filename = save_png(difference_array, output_filename, unique=True)
     except Exception as e:
         raise Exception(f"Error saving the difference image: {e}")
+    return output_filename
                 
 def main():
     
-    os.system('cls' if os.name == 'nt' else 'clear') # Clear the terminal
+    if sys.stdout.isatty():
+        os.system('cls' if os.name == 'nt' else 'clear') # Clear the terminal, never when stdout is piped (it may carry the output)
     
     # Argument parser
     parser = argparse.ArgumentParser(description="Van Gonography is a steganography tool that hides files in images.")
@@ -466,15 +843,29 @@ def main():
     optional_group.add_argument("-ood", dest="ood", action="store_true", default=False, help="Open file after decoding from image (default: False)")
     optional_group.add_argument("-l", "--log", dest="log", action="store_true", default=False, help="Log file for the program (default: False)")
     optional_group.add_argument("-cli", dest="cli", action="store_true", default=False, help="Run the program in CLI mode, this means there's not gonna be any menu (default: False)")
-    optional_group.add_argument("-o", "--output", dest="output", type=str, metavar="OUTPUT_DIR", help="Output directory for the modified image or revealed file")
+    optional_group.add_argument("-o", "--output", dest="output", type=str, metavar="OUTPUT_DIR", help="Output directory for the modified image or revealed file, - writes it to stdout (the default when reading from stdin)")
     optional_group.add_argument("-v", "--version", action="version", version=f"VanGonography v{__version__}", help="Show the version number and exit")
     optional_group.add_argument("--encrypt", dest="encrypt", action="store_true", default=False, help="Encrypt the data before hiding it (default: False)")
     optional_group.add_argument("--decrypt", dest="decrypt", action="store_true", default=False, help="Decrypt the data after revealing it (default: False)")
     optional_group.add_argument("--key", dest="key", type=str, metavar="KEY", help="Key to decrypt the data (default: None)")
+    optional_group.add_argument("--password", dest="password", type=str, metavar="PASSWORD", help=f"Password the encryption key is derived from instead of a random key, with --encrypt or --decrypt, also read from the {PASSWORD_VARIABLE} environment variable (default: None)")
     optional_group.add_argument("--json", dest="json", type=str, metavar="JSON_FILE", help="JSON file containing the arguments (default: None)")
-    optional_group.add_argument("--stealth", dest="stealth", action="store_true", default=False, help="Hides the file in stealth mode (default: False)") # TODO: Implement this shit
-    # For anyone wondering, I have no idea how to implement the stealth mode, so if you want to share some ideas
+    optional_group.add_argument("--stealth", dest="stealth", action="store_true", default=False, help="Hides the file in stealth mode, scattered across the cover in an order derived from the stealth key (default: False)")
+    optional_group.add_argument("--stealth-key", dest="stealth_key", type=str, metavar="STEALTH_KEY", help="Key used to scatter the data in stealth mode, generated and saved next to the image when encoding without one (default: None)")
+    optional_group.add_argument("--adaptive", dest="adaptive", action="store_true", default=False, help="Hide the file in the most textured parts of the cover first, where it's harder to detect (default: False)")
     optional_group.add_argument("-z", "--zip", dest="zip", action="store_true", default=False, help="Zip or unzips the file (default: False")
+    optional_group.add_argument("--alpha", dest="alpha", action="store_true", default=False, help="Also hide data in the alpha channel of RGBA covers, 33%% more capacity (default: False)")
+    optional_group.add_argument("--depth", dest="depth", type=int, choices=[1, 2, 4, 8], metavar="BITS", help="Number of bits hidden in each channel: 1, 2 or 4, 8 for 16-bit covers (default: 2, 4 for 16-bit covers)")
+    optional_group.add_argument("--scanline-header", dest="scanline_header", action="store_true", default=False, help="Store the header in the first row of the image instead of the first column, reading it then only decodes that row, older versions can't read such images (default: False)")
+    optional_group.add_argument("--verify", dest="verify", action="store_true", default=False, help="Reveal the data from memory before saving the image, nothing is written if it differs (default: False)")
+    optional_group.add_argument("--capacity", dest="capacity", action="store_true", default=False, help="Show how many bytes the cover can hold with every layout and exit (default: False)")
+    optional_group.add_argument("--metrics", dest="metrics", type=str, metavar="METRICS_FILE", help="Write the metrics of the run (jobs, failures, bytes, stage latencies) to a file in the Prometheus text format (default: None)")
+    optional_group.add_argument("--metrics-port", dest="metrics_port", type=int, metavar="PORT", help="Serve the metrics in the Prometheus text format on http://127.0.0.1:PORT/metrics while running (default: None)")
+    optional_group.add_argument("--backend", dest="backend", type=str, choices=["auto", "numpy", "numba"], metavar="BACKEND", help="Kernel backend: numpy, numba (needs Numba installed) or auto, also set by the VANGONOGRAPHY_BACKEND environment variable (default: auto)")
+    optional_group.add_argument("--name", dest="name", type=str, metavar="NAME", help="Name of the hidden file stored in the header, it's revealed under it (default: None, useful for data read from stdin)")
+    optional_group.add_argument("--cache", dest="cache", type=str, metavar="CACHE_DIR", help="Directory of the result cache, encoding the same file in the same cover with the same options again copies the carrier from it, never used with --encrypt (default: None)")
+    optional_group.add_argument("--cache-size", dest="cache_size", type=int, default=1024, metavar="MB", help="Size limit of the result cache in megabytes, the least recently used carriers are evicted past it (default: 1024)")
+    optional_group.add_argument("-w", "--workers", dest="workers", type=int, default=1, metavar="WORKERS", help="Number of processes used to hide or reveal the data, useful for very large files (default: 1)")
     
     
     # Positional arguments group (only used in CLI mode)
@@ -482,8 +873,16 @@ def main():
     positional_group.add_argument("-s", "--show", dest="show", action="store_true", default=False, help="Show the difference between two images (default: False)")
     positional_group.add_argument("-e", "--encode", dest="encode", action="store_true", default=False, help="Encode the file in the image (default: False)")
     positional_group.add_argument("-d", "--decode", dest="decode", action="store_true", default=False, help="Decode the file hidden in the image (default: False)")
-    positional_group.add_argument("-c", "--cover", dest="cover", type=str, metavar="COVER_IMAGE", help="Image to be used for hiding or revealing, positional only when using decoding, encoding or differentiate")
-    positional_group.add_argument("-f", "--file", dest="file", type=str, metavar="HIDDEN_FILE", help="File to be hidden")
+    positional_group.add_argument("-c", "--cover", dest="cover", type=str, metavar="COVER_IMAGE", help="Image to be used for hiding or revealing, positional only when using decoding, encoding or differentiate, - reads it from stdin")
+    positional_group.add_argument("-f", "--file", dest="file", type=str, metavar="HIDDEN_FILE", help="File to be hidden, - reads it from stdin")
+    positional_group.add_argument("payload", nargs="?", type=str, metavar="FILE", help="File to be hidden, same as -f")
+    positional_group.add_argument("--shard", dest="shard", action="store_true", default=False, help="Split the file across as many covers of the pool as needed (default: False)")
+    positional_group.add_argument("--pool", dest="pool", type=str, metavar="COVER_DIR", help="Directory of cover images to choose from, when encoding without a cover the smallest one that fits is used")
+    positional_group.add_argument("--shards", dest="shards", type=str, nargs="+", metavar="SHARD_IMAGE", help="Shard images to reassemble, in any order")
+    positional_group.add_argument("--watch-encode", dest="watch_encode", type=str, nargs="+", metavar="INBOX", help="Watch directories and hide every file dropped into them, in the cover or the smallest fitting cover of the pool, until Ctrl+C")
+    positional_group.add_argument("--watch-decode", dest="watch_decode", type=str, nargs="+", metavar="CARRIER_DIR", help="Watch directories and reveal every carrier dropped into them, until Ctrl+C")
+    positional_group.add_argument("--watch-interval", dest="watch_interval", type=float, default=1.0, metavar="SECONDS", help="Seconds between two scans of the watched directories, files are picked up once unchanged for twice as long (default: 1)")
+    positional_group.add_argument("--decode-dir", dest="decode_dir", type=str, metavar="DIRECTORY", help="Reveal the files hidden in every image of a directory, each carrier gets its own sub directory in the output directory")
 
     args = parser.parse_args()
     
@@ -501,6 +900,10 @@ def main():
                 logging.error(f"Invalid argument: {key}")
                 return
     
+    # The file to hide can also be given without -f (e.g. "-" at the end of a pipeline)
+    if args.payload and not args.file:
+        args.file = args.payload
+
     # Checking for CLI mode
     if args.cli:
         # Logging setup 
@@ -518,22 +921,151 @@ def main():
             
             logging.info("Logging started")
             logging.info(f"Arguments: {args}")
+
+        # Reading from stdin writes to stdout unless an output directory is given, like any filter in a pipeline.
+        # The output is then the only thing written to stdout, the messages go to stderr
+        data_output = None
+        if args.output == STDIO or (not args.output and STDIO in (args.file, args.cover) and (args.encode or args.decode)):
+            if args.file == STDIO and args.cover == STDIO:
+                print("The file to hide and the cover image can't both be read from stdin.")
+                logging.error("The file to hide and the cover image were both given as stdin")
+                return
+            data_output = sys.stdout.buffer
+            sys.stdout = sys.stderr
+            args.output = ""
+
+        # Kernel backend, set before any worker process is started so they all use the same one
+        if args.backend:
+            try:
+                backend = set_backend(args.backend)
+                logging.info(f"Using the {backend} kernel backend")
+            except ValueError as e:
+                print(f"An error occurred: {e}")
+                logging.error(f"An error occurred: {e}")
+                return
+
+        # Password of the encryption, read from the environment when it isn't given (it then doesn't show in the process list)
+        if (args.encrypt or args.decrypt) and not args.password:
+            args.password = os.environ.get(PASSWORD_VARIABLE) or None
+
+        # Metrics setup, nothing is recorded unless the user asks for them
+        if args.metrics_port:
+            metrics.serve(args.metrics_port)
+            logging.info(f"Serving metrics on port {args.metrics_port}")
+        if args.metrics:
+            metrics.enable()
+            atexit.register(metrics.write, args.metrics) # Written whichever way the run ends
         
         # CLI mode starts here
-        if args.cover: # Checking if a cover image is given (essential for both decoding and encoding)
+        if args.encode and args.pool and not args.cover and not args.shard:
+            # Choosing the smallest cover of the pool that can hold the file, compression and encryption overhead included
+            try:
+                from coverpool import CoverPool, required_capacity
+                from passwords import kdf_metadata, SALT_SIZE
+
+                if not args.file:
+                    raise ValueError("You must insert the file to hide")
+                if args.file == STDIO:
+                    # The size of a piped file is only known once it's read, it's then hidden from memory
+                    args.file = io.BytesIO(sys.stdin.buffer.read())
+                    size = len(args.file.getbuffer())
+                    extension = args.name.rpartition(".")[2] if args.name and "." in args.name else "bin"
+                else:
+                    size = os.path.getsize(args.file)
+                    extension = os.path.splitext(args.file)[1][1:]
+
+                # Header of the job, a salt of the same length stands for the one of the password
+                metadata = job_metadata(args.stealth, args.adaptive, args.name or "", kdf_metadata(bytes(SALT_SIZE)) if args.password else None)
+                args.cover = CoverPool(args.pool).best_fit(required_capacity(size, args.zip, args.encrypt or bool(args.password)), args.depth, args.alpha, metadata, extension)
+                print(f"Using cover {args.cover} from the pool.")
+                logging.info(f"Cover {args.cover} chosen from the pool {args.pool}")
+            except Exception as e:
+                print(f"An error occurred: {e}")
+                logging.error(f"An error occurred: {e}")
+                return
+
+        if args.watch_encode or args.watch_decode: # Hiding or revealing every file dropped into the watched directories
+            try:
+                from watch import Watcher, profile_options # Imported here because watch imports this module
+
+                profile = vars(args) # The --json profile was already applied to the arguments
+                watcher = Watcher(args.watch_encode or [], args.watch_decode or [], args.output or "", args.cover or "", args.pool or "",
+                                  profile_options(profile, "encode"), profile_options(profile, "decode"), args.workers, args.watch_interval, 2 * args.watch_interval)
+                stats = watcher.run()
+                logging.info(f"Watch stopped: {stats}")
+            except Exception as e:
+                print(f"An error occurred: {e}")
+                logging.error(f"An error occurred: {e}")
+
+        elif args.decode_dir: # Revealing the files hidden in a whole directory of images
+            if args.decrypt and not args.key and not args.password:
+                print("You must give a key or a password to decrypt the data.")
+                logging.error("No key was given, you must give a key to decrypt the data.")
+                return
+            try:
+                from carriers import decode_directory # Imported here because carriers imports this module
+
+                logging.info(f"Decoding directory {args.decode_dir}")
+                stats = decode_directory(args.decode_dir, args.output or "", args.workers, args.decrypt, args.key, args.zip, stealth_key=args.stealth_key or "", password=args.password or "")
+                logging.info(f"Directory {args.decode_dir} decoded: {stats}")
+            except Exception as e:
+                print(f"An error occurred: {e}")
+                logging.error(f"An error occurred: {e}")
+
+        elif args.shard or args.shards: # Splitting a file across several covers, or reassembling it
+            from shards import encode_shards, decode_shards # Imported here because shards imports this module
+
+            workers = args.workers if args.workers > 1 else None # Shards are always processed in parallel, one process per CPU by default
+            try:
+                if args.encode:
+                    if not args.file or not args.pool:
+                        print("You must insert the file to hide and the cover pool directory (--pool).")
+                        logging.error("No file to hide or no cover pool was given for sharding")
+                        return
+                    logging.info(f"Sharding {args.file} across the covers of {args.pool}")
+                    outputs = encode_shards(args.file, args.pool, args.output or "", workers)
+                    logging.info(f"File hidden successfully in {len(outputs)} shard(s).")
+                elif args.decode:
+                    if not args.shards:
+                        print("You must insert the shard images to reassemble (--shards).")
+                        logging.error("No shard images were given")
+                        return
+                    logging.info(f"Reassembling {len(args.shards)} shard(s)")
+                    output = decode_shards(args.shards, args.output or "", workers)
+                    logging.info(f"File revealed successfully to {output}.")
+                else:
+                    print("Invalid arguments, sharding needs either encode or decode.")
+                    logging.error("Invalid arguments, sharding needs either encode or decode.")
+            except Exception as e:
+                print(f"An error occurred: {e}")
+                logging.error(f"An error occurred: {e}")
+
+        elif args.cover: # Checking if a cover image is given (essential for both decoding and encoding)
             
             # Full error checking for encryption and decryption
             if args.encrypt and args.decrypt:
                 print("You can't encrypt and decrypt at the same time, choose one.")
                 logging.error("You can't encrypt and decrypt at the same time, choose one.")
                 return
-            elif args.decrypt and not args.key:
-                print("You must give a key to decrypt the data.")
+            elif args.decrypt and not args.key and not args.password:
+                print("You must give a key or a password to decrypt the data.")
                 logging.error("No key was given, you must give a key to decrypt the data.")
                 return
             
             # Is the user choosing to encode or decode?
-            if args.encode: # Encode
+            if args.capacity: # Only showing how much data the cover can hold
+                try:
+                    from coverpool import capacity_options
+
+                    with Image.open(args.cover) as cover:
+                        print(f"Capacity of {args.cover} ({cover.width}x{cover.height}, {cover.mode}):")
+                        for description, capacity in capacity_options(cover.width, cover.height, cover.mode):
+                            print(f"  {description:<28} {capacity:>14,} bytes")
+                except Exception as e:
+                    print(f"An error occurred: {e}")
+                    logging.error(f"An error occurred: {e}")
+
+            elif args.encode: # Encode
                 # Checking if a file to hide is given
                 if not args.file:
                     print("You must insert the file to hide")
@@ -543,7 +1075,14 @@ def main():
                     logging.info("Encoding started") # Logging the start
                     logging.info(f"Encoding {args.file} in {args.cover}") # Logging the file and cover image
                     
-                    encode_image(args.file, args.cover, args.output, args.encrypt, args.zip) # Encoding the file
+                    options = dict(encrypt=args.encrypt, compress=args.zip, workers=args.workers, alpha=args.alpha, depth=args.depth, stealth=args.stealth, stealth_key=args.stealth_key or "", adaptive=args.adaptive, verify=args.verify, name=args.name or "", output=data_output, password=args.password or "", scanline=args.scanline_header)
+                    if args.cache:
+                        from cache import ResultCache # Imported here because cache imports this module
+                        result_cache = ResultCache(args.cache, args.cache_size * 1024 * 1024)
+                        result_cache.encode_image(args.file, args.cover, args.output, **options) # Encoding the file, or copying it from the cache
+                        logging.info(f"Result cache: {result_cache.stats()}")
+                    else:
+                        encode_image(args.file, args.cover, args.output, **options) # Encoding the file
                     
                     print(f"File hidden successfully in {args.cover}.") 
                     logging.info(f"File hidden successfully in {args.cover}.") # Logging the success message, this is also useful for checking the time it took to hide the file
@@ -561,7 +1100,7 @@ def main():
                     logging.info("Decoding started") # Logging the start
                     logging.info(f"Decoding {args.cover}") # Logging the cover image
                     
-                    decode_image(args.cover, args.output, args.ood, args.decrypt, args.key, args.zip) # Decoding the file
+                    decode_image(args.cover, args.output, args.ood, args.decrypt, args.key, args.zip, args.workers, output=data_output, stealth_key=args.stealth_key or "", password=args.password or "") # Decoding the file
                     
                     print(f"File revealed successfully from {args.cover}.")
                     logging.info(f"File revealed successfully from {args.cover}.") # Same as above
@@ -578,10 +1117,10 @@ def main():
                     logging.info("Differentiating started") # Logging the start
                     logging.info(f"Differentiating {args.cover} and {args.file}") # Logging the source and cover images
                     
-                    differentiate_image(args.cover, args.output)
+                    difference_path = differentiate_image(args.cover, args.output)
                     
-                    print(f"Difference image saved successfully as Difference.png.")
-                    logging.info(f"Difference image saved successfully as Difference.png.") # Again, same as above
+                    print(f"Difference image saved successfully as {difference_path}.")
+                    logging.info(f"Difference image saved successfully as {difference_path}.") # Again, same as above
                 except Exception as e:
                     print(f"An error occurred: {e}")
                     logging.error(f"An error occurred: {e}")
@@ -598,7 +1137,7 @@ def main():
     else:
         
         # Checking if any arguments are given
-        if args.show or args.encode or args.decode or args.output or args.cover or args.file:
+        if args.show or args.encode or args.decode or args.output or args.cover or args.file or args.decode_dir or args.shard or args.shards or args.pool or args.alpha or args.depth or args.capacity or args.stealth or args.stealth_key or args.adaptive or args.metrics or args.metrics_port or args.verify or args.backend or args.name or args.payload or args.cache or args.watch_encode or args.watch_decode or args.scanline_header:
             print("You can't use arguments in UI mode.")
             return
         
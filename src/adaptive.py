@@ -0,0 +1,63 @@
+'''adaptive mode: the data is hidden in the most textured pixels of the cover first\n
+Changing the last bits of a pixel in a flat area (a clear sky, a wall) is far more detectable than in a
+textured one (grass, hair, noise). The texture of every usable pixel is measured with the gradient of its
+neighbourhood, then the pixels are filled from the most textured to the least textured one.\n
+The gradient is computed from the bits above the ones we change, which hiding the data never touches, and
+column 0 (the header) is left out, so the decoder recomputes exactly the same order from the stego image
+without any side information.\n
+`python VanGonography.py -cli -e --adaptive -c cover.png -f secret.txt`'''
+
+import numpy as np
+
+from kernels import as_byte_array, as_channels, embed_scattered, extract_scattered_chunks, CHANNELS_USED, CRUMB_SIZE
+
+def texture_map(cover_array: np.ndarray, channels: int = CHANNELS_USED, depth: int = CRUMB_SIZE) -> np.ndarray:
+    """
+    Measures the texture of every usable pixel (columns 1 and up) from the bits hiding never changes.
+
+    The texture of a pixel is the sum, over the used channels, of the absolute differences with its
+    four neighbours, computed on the channels shifted right by `depth` bits.
+
+    Parameters:
+    - cover_array (np.ndarray): Array of the cover (or stego) image.
+    - channels (int): Number of channels used in each pixel.
+    - depth (int): Number of bits hidden in each channel.
+
+    Returns:
+    np.ndarray: uint16 array of shape (height, width - 1), larger values for more textured pixels.
+    """
+    cover_array = as_channels(cover_array)
+    # 8-bit covers never go past 4 channels * 4 neighbours * 127, int16 is enough and keeps the arrays small
+    work_type = np.int16 if cover_array.dtype == np.uint8 else np.int32
+
+    texture = np.zeros((cover_array.shape[0], cover_array.shape[1] - 1), dtype=work_type)
+    for channel in range(channels):
+        high = (cover_array[:, 1:, channel] >> depth).astype(work_type)
+        # Every difference counts for the two pixels it's between, vertically then horizontally
+        difference = np.abs(high[1:] - high[:-1])
+        texture[:-1] += difference
+        texture[1:] += difference
+        difference = np.abs(high[:, 1:] - high[:, :-1])
+        texture[:, :-1] += difference
+        texture[:, 1:] += difference
+    if work_type == np.int32:
+        np.minimum(texture, np.iinfo(np.uint16).max, out=texture) # 16-bit covers can go past the uint16 range
+    return texture.astype(np.uint16)
+
+def adaptive_indexes(cover_array: np.ndarray, channels: int = CHANNELS_USED, depth: int = CRUMB_SIZE) -> np.ndarray:
+    '''usable pixels (counted column by column from column 1) from the most to the least textured one, as a uint32 array.
+    Pixels with the same texture keep their column order, the sort is stable so the order is fully deterministic'''
+    texture = texture_map(cover_array, channels, depth).T.reshape(-1) # Column by column, like the pixels are counted
+    # Sorting the inverted texture, uint16 keys are sorted with a radix sort by NumPy when the sort is stable
+    return np.argsort(np.iinfo(np.uint16).max - texture, kind='stable').astype(np.uint32)
+
+def embed_adaptive(cover_array: np.ndarray, data, channels: int = CHANNELS_USED, depth: int = CRUMB_SIZE) -> None:
+    '''hides data inside the cover array starting from its most textured pixels, modifying it in place'''
+    data = as_byte_array(data)
+    indexes = adaptive_indexes(cover_array, channels, depth)
+    embed_scattered(cover_array, data, lambda first, last: indexes[first:last], channels, depth)
+
+def extract_adaptive_chunks(steg_array: np.ndarray, size: int, channels: int = CHANNELS_USED, depth: int = CRUMB_SIZE):
+    '''reveals data hidden with `embed_adaptive`, in chunks (see kernels.extract_scattered_chunks)'''
+    indexes = adaptive_indexes(steg_array, channels, depth)
+    return extract_scattered_chunks(steg_array, size, lambda first, last: indexes[first:last], channels, depth)
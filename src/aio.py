@@ -0,0 +1,110 @@
+'''asyncio API, for calling VanGonography from an event loop without blocking it\n
+The hiding and revealing work runs in an executor (a thread pool by default, or any executor given by the caller,
+e.g. a ProcessPoolExecutor for CPU heavy jobs), header and capacity reads only touch the file headers and run
+in threads. A semaphore limits how many jobs run at once, every job can be given a timeout and can be cancelled.\n
+    runner = AsyncRunner(max_jobs=4, timeout=60)
+    await runner.encode_image("secret.txt", "cover.png", "output folder", compress=True)
+    await runner.decode_image("output folder/Cover_txt.png", "revealed folder")
+    await runner.close()\n
+A job that is cancelled (or times out) before it started never runs. One that already started can't be
+interrupted, it finishes in the background and its result is dropped, its semaphore slot is only released
+then, so the executor never runs more than `max_jobs` jobs.'''
+
+import asyncio
+import functools
+
+from PIL import Image
+from concurrent.futures import ThreadPoolExecutor
+
+from utils import no_pause
+from VanGonography import encode_image, decode_image, get_header
+from coverpool import capacity_options
+
+def _call(function, *args, **kwargs):
+    '''runs function(*args, **kwargs) without the progress pauses of the CLI, also inside worker processes.
+    Only the thread running the job skips them, utils.PROGRESS_PAUSE is left as it is for the other callers'''
+    with no_pause():
+        return function(*args, **kwargs)
+
+def cover_capacity_options(image: str) -> list[tuple[str, int]]:
+    '''capacity of a cover with every layout its mode supports, read from the file header only'''
+    try:
+        with Image.open(image, "r") as cover:
+            width, height, mode = cover.width, cover.height, cover.mode
+    except FileNotFoundError:
+        raise FileNotFoundError(f"Image file not found: {image}")
+    except Exception as e:
+        raise Exception(f"Error opening the cover image: {e}")
+    return capacity_options(width, height, mode)
+
+class AsyncRunner:
+    """
+    Runs VanGonography jobs from an event loop.
+
+    Parameters:
+    - executor (Executor): Executor running the hiding and revealing work, a thread pool of `max_jobs` threads by default.
+      With a process pool, the arguments must be picklable (e.g. `output` of decode_image must stay None).
+    - max_jobs (int): Maximum number of jobs running at once, the other ones wait for a free slot.
+    - timeout (float): Default timeout of every job in seconds, None for no timeout.
+    """
+    def __init__(self, executor=None, max_jobs: int = 4, timeout: float = None):
+        if max_jobs < 1:
+            raise ValueError("max_jobs must be at least 1.")
+        self.owns_executor = executor is None
+        self.executor = executor or ThreadPoolExecutor(max_workers=max_jobs, thread_name_prefix="vangonography")
+        self.max_jobs = max_jobs
+        self.timeout = timeout
+        self.semaphore = asyncio.Semaphore(max_jobs)
+
+    async def run(self, function, *args, timeout: float = None, **kwargs):
+        '''runs function(*args, **kwargs) in the executor, waiting for a free slot first.
+        timeout defaults to the one of the runner, asyncio.TimeoutError is raised when it expires'''
+        timeout = self.timeout if timeout is None else timeout
+        loop = asyncio.get_running_loop()
+
+        await self.semaphore.acquire()
+        try:
+            future = self.executor.submit(functools.partial(_call, function, *args, **kwargs))
+        except BaseException:
+            self.semaphore.release()
+            raise
+
+        def release(_):
+            # The slot is given back when the job really stopped, not when the caller stopped waiting for it
+            try:
+                loop.call_soon_threadsafe(self.semaphore.release)
+            except RuntimeError:
+                pass # The loop is already closed
+
+        future.add_done_callback(release)
+        # Cancelling the awaited future cancels the job if it didn't start yet
+        return await asyncio.wait_for(asyncio.wrap_future(future, loop=loop), timeout)
+
+    async def encode_image(self, file, image: str, output_directory: str = "", timeout: float = None, **options) -> str:
+        '''asynchronous VanGonography.encode_image, the options are the ones of encode_image.
+        Returns the path of the carrier (None when it's written to a stream)'''
+        return await self.run(encode_image, file, image, output_directory, timeout=timeout, **options)
+
+    async def decode_image(self, image: str, output_directory: str = "", timeout: float = None, **options) -> str:
+        '''asynchronous VanGonography.decode_image, the options are the ones of decode_image.
+        Returns the path of the revealed file (None when it's written to a stream)'''
+        return await self.run(decode_image, image, output_directory, timeout=timeout, **options)
+
+    async def get_header(self, image: str, timeout: float = None) -> dict:
+        '''asynchronous VanGonography.get_header, only the first rows are decoded, in a thread'''
+        return await asyncio.wait_for(asyncio.to_thread(get_header, image), self.timeout if timeout is None else timeout)
+
+    async def capacity(self, image: str, timeout: float = None) -> list[tuple[str, int]]:
+        '''capacity of a cover with every layout its mode supports (see coverpool.capacity_options), read in a thread'''
+        return await asyncio.wait_for(asyncio.to_thread(cover_capacity_options, image), self.timeout if timeout is None else timeout)
+
+    async def close(self) -> None:
+        '''waits for the running jobs and shuts the executor down if the runner created it'''
+        if self.owns_executor:
+            await asyncio.to_thread(self.executor.shutdown)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
@@ -0,0 +1,98 @@
+'''kernel backends: the NumPy kernels of kernels.py, or fused single pass kernels compiled with Numba\n
+The NumPy kernels work on blocks of columns and go through several temporary arrays per block (the crumbs,
+the transposed window, the masked channels). The fused kernels go once over the data and write (or read)
+every crumb straight into the cover, without any temporary array. Numba is optional: when it's not installed
+everything runs on NumPy, both backends give exactly the same output.\n
+The backend is chosen with the VANGONOGRAPHY_BACKEND environment variable or the `--backend` flag:
+"auto" (Numba when it's installed, the default), "numpy" or "numba". Worker processes inherit the choice.\n
+`VANGONOGRAPHY_BACKEND=numpy python VanGonography.py -cli -e -c cover.png -f secret.txt`'''
+
+import os
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+BACKEND_VARIABLE = "VANGONOGRAPHY_BACKEND" # Environment variable choosing the backend
+BACKENDS = ("auto", "numpy", "numba")
+
+_active = None # Backend in use, resolved from the environment the first time it's needed
+
+def resolve_backend(name: str) -> str:
+    '''the backend actually used for `name`: "numpy" or "numba"'''
+    name = (name or "auto").lower()
+    if name not in BACKENDS:
+        raise ValueError(f"Invalid backend {name}, it must be one of {BACKENDS}.")
+    if name == "auto":
+        return "numba" if numba is not None else "numpy"
+    if name == "numba" and numba is None:
+        raise ValueError("The numba backend was asked for but Numba is not installed (pip install numba).")
+    return name
+
+def set_backend(name: str) -> str:
+    '''chooses the backend of this process and of the worker processes it starts, returns the backend used'''
+    global _active
+    _active = resolve_backend(name)
+    os.environ[BACKEND_VARIABLE] = _active
+    return _active
+
+def get_backend() -> str:
+    '''backend in use: "numpy" or "numba"'''
+    global _active
+    if _active is None:
+        _active = resolve_backend(os.environ.get(BACKEND_VARIABLE, "auto"))
+    return _active
+
+def available_backends() -> list[str]:
+    '''backends that can be used in this environment'''
+    return ["numpy", "numba"] if numba is not None else ["numpy"]
+
+# The fused kernels are written as plain loops, Numba compiles them to machine code.
+# The cover arrays always have a channel axis (see kernels.as_channels).
+
+def _embed_loop(cover, data, column, offset, channels, depth):
+    '''writes every crumb of `data` in the layout starting `offset` crumbs after the top of `column`'''
+    height = cover.shape[0]
+    mask = (1 << depth) - 1
+    crumb = offset
+    for index in range(data.size):
+        byte = data[index]
+        for shift in range(8 - depth, -1, -depth):
+            pixel = crumb // channels
+            plane = crumb - pixel * channels
+            row = pixel % height
+            cover_column = column + pixel // height
+            # Clearing the last `depth` bits by shifting them out and back, then setting them
+            cover[row, cover_column, plane] = (cover[row, cover_column, plane] >> depth << depth) | ((byte >> shift) & mask)
+            crumb += 1
+
+def _extract_loop(steg, out, column, offset, channels, depth):
+    '''reads `out.size` bytes from the layout starting `offset` crumbs after the top of `column`'''
+    height = steg.shape[0]
+    mask = (1 << depth) - 1
+    crumb = offset
+    for index in range(out.size):
+        byte = 0
+        for _ in range(8 // depth):
+            pixel = crumb // channels
+            plane = crumb - pixel * channels
+            byte = (byte << depth) | (steg[pixel % height, column + pixel // height, plane] & mask)
+            crumb += 1
+        out[index] = byte
+
+def _difference_loop(source, cover, out):
+    '''difference of every channel, shifted by 128 so it's visible, clipped to [0, 255]'''
+    for row in range(out.shape[0]):
+        for column in range(out.shape[1]):
+            for plane in range(out.shape[2]):
+                value = int(cover[row, column, plane]) - int(source[row, column, plane]) + 128
+                out[row, column, plane] = min(255, max(0, value))
+
+if numba is not None:
+    # nogil lets the kernels run in threads at the same time, cache keeps the compiled code between runs
+    embed_fused = numba.njit(cache=True, nogil=True)(_embed_loop)
+    extract_fused = numba.njit(cache=True, nogil=True)(_extract_loop)
+    difference_fused = numba.njit(cache=True, nogil=True)(_difference_loop)
+else:
+    embed_fused = extract_fused = difference_fused = None
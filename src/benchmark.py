@@ -0,0 +1,107 @@
+'''benchmark for the hiding and revealing kernels\n
+Generates a random cover and a random payload, then times the single process path
+and the shared memory path from 1 to N workers, making sure they all give the same output.
+The scattered layouts (stealth and adaptive) are timed against the plain one, PNG encoding included,
+and every available kernel backend (see backends.py) is timed on the same inputs.\n
+`python benchmark.py --width 8000 --height 6000 --workers 8`'''
+
+import io
+import time
+import argparse
+
+import numpy as np
+
+import kernels
+import backends
+from PIL import Image
+from parallel import SharedArray, embed_parallel, extract_parallel
+from stealth import embed_stealth
+from adaptive import embed_adaptive
+
+def timed(function, *args) -> tuple:
+    '''runs function(*args) and returns (result, seconds)'''
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+def bench_workers(cover: np.ndarray, data: bytes, max_workers: int) -> None:
+    '''prints the embed/extract time of the single process path and of the shared memory path for 1..max_workers'''
+    expected = cover.copy()
+    _, embed_time = timed(kernels.embed, expected, data)
+    _, extract_time = timed(kernels.extract, expected, len(data))
+    print(f"{'single':>10} | embed {embed_time:8.3f}s | extract {extract_time:8.3f}s")
+
+    for workers in range(1, max_workers + 1):
+        with SharedArray.from_array(cover) as shared:
+            _, embed_time = timed(embed_parallel, shared, data, workers)
+            revealed, extract_time = timed(extract_parallel, shared, len(data), workers)
+
+            # The parallel path must give exactly the same image and data as the single process one
+            if not np.array_equal(shared.array, expected) or revealed != data:
+                raise AssertionError(f"Output with {workers} workers differs from the single process output")
+
+        print(f"{workers:>10} | embed {embed_time:8.3f}s | extract {extract_time:8.3f}s")
+
+def bench_layouts(cover: np.ndarray, data: bytes) -> None:
+    '''prints the time of a whole encode (embed and PNG encoding) with the plain, stealth and adaptive layouts'''
+    layouts = {
+        "plain": lambda array: kernels.embed(array, data),
+        "stealth": lambda array: embed_stealth(array, data, "benchmark"),
+        "adaptive": lambda array: embed_adaptive(array, data),
+    }
+    plain_time = None
+    for name, embed in layouts.items():
+        array = cover.copy()
+        _, embed_time = timed(embed, array)
+        _, save_time = timed(Image.fromarray(array).save, io.BytesIO(), "PNG")
+        plain_time = plain_time or embed_time + save_time
+        print(f"{name:>10} | embed {embed_time:8.3f}s | encode {embed_time + save_time:8.3f}s | {(embed_time + save_time) / plain_time:5.2f}x")
+
+def bench_backends(cover: np.ndarray, data: bytes) -> None:
+    '''prints the embed/extract/difference time of every available backend, checking they all give the same output'''
+    previous = backends.get_backend()
+    expected = None
+    try:
+        for backend in backends.available_backends():
+            backends.set_backend(backend)
+            if backend == "numba":
+                # The first call compiles the kernels, it's left out of the timings
+                kernels.embed(cover[:8, :8].copy(), b"warm up")
+                kernels.extract(cover[:8, :8], 1)
+                kernels.difference(cover[:8, :8], cover[:8, :8])
+
+            array = cover.copy()
+            _, embed_time = timed(kernels.embed, array, data)
+            revealed, extract_time = timed(kernels.extract, array, len(data))
+            difference_array, difference_time = timed(kernels.difference, cover, array)
+
+            if expected is None:
+                expected = (array, difference_array)
+            elif not np.array_equal(array, expected[0]) or not np.array_equal(difference_array, expected[1]):
+                raise AssertionError(f"Output of the {backend} backend differs from the numpy backend")
+            if revealed.tobytes() != data:
+                raise AssertionError(f"Data revealed by the {backend} backend differs from the hidden data")
+
+            print(f"{backend:>10} | embed {embed_time:8.3f}s | extract {extract_time:8.3f}s | difference {difference_time:8.3f}s")
+        if "numba" not in backends.available_backends():
+            print(f"{'numba':>10} | not installed (pip install numba)")
+    finally:
+        backends.set_backend(previous)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark for the VanGonography kernels.")
+    parser.add_argument("--width", type=int, default=4000, help="Width of the random cover (default: 4000)")
+    parser.add_argument("--height", type=int, default=3000, help="Height of the random cover (default: 3000)")
+    parser.add_argument("--fill", type=float, default=0.9, help="Fraction of the cover capacity filled by the payload (default: 0.9)")
+    parser.add_argument("--workers", type=int, default=4, help="Maximum number of workers (default: 4)")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    cover = rng.integers(0, 256, (args.height, args.width, 3), dtype=np.uint8)
+    size = int(kernels.layout_capacity(cover.shape) // 8 * args.fill)
+    data = rng.integers(0, 256, size, dtype=np.uint8).tobytes()
+
+    print(f"Cover {args.width}x{args.height}, payload {size / 2**20:.1f} MiB")
+    bench_workers(cover, data, args.workers)
+    bench_layouts(cover, data)
+    bench_backends(cover, data)
@@ -0,0 +1,198 @@
+'''module for reusing the carriers of identical encodes instead of producing them again\n
+The cache is a directory of carriers keyed by the sha256 of the cover bytes, the payload bytes and every
+encode option that changes the output. A job asking for a carrier that was already produced gets a copy
+of it, skipping the decode, embed and PNG encoding. Every entry is a directory named after its key holding
+its own copy of the carrier under the name it was produced with (never a hard link, an output changed in place
+would change the entry), entries are added with a single rename so processes sharing the cache never see half
+written ones. The last use of an entry is the modification time of its directory, the least recently used
+entries are evicted once the cache grows past its size limit.\n
+Only deterministic encodes can be cached: encrypted encodes (random key, iv and timestamp), stealth encodes
+without a stealth key (random key) and payloads, covers or outputs that are streams are never served from
+the cache, they're encoded normally and counted as "uncacheable".\n
+`python VanGonography.py -cli -e -c cover.png -f secret.txt --cache "cache folder"`'''
+
+import os
+import json
+import shutil
+import hashlib
+
+import metrics
+from utils import load_payload, copy_file, temporary_name
+from __version__ import __version__
+from VanGonography import encode_image
+
+DEFAULT_MAX_BYTES = 1 << 30 # Size limit of the cache, 1 GiB
+HASH_CHUNK = 1 << 20 # Bytes of the cover hashed at once
+
+# Options of encode_image that change the carrier, with their defaults (workers, verify and the output don't)
+OUTPUT_OPTIONS = {
+    "compress": False,
+    "alpha": False,
+    "depth": None,
+    "extension": "",
+    "stealth": False,
+    "stealth_key": "",
+    "adaptive": False,
+    "name": "",
+    "scanline": False,
+}
+
+def file_digest(path: str) -> bytes:
+    '''sha256 of a file, read in chunks'''
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            digest.update(chunk)
+    return digest.digest()
+
+def uncacheable_reason(file, image, options: dict) -> str:
+    '''why an encode can't be served from the cache, empty when it can'''
+    if options.get("encrypt") or options.get("password"):
+        return "encryption uses a random nonce"
+    if options.get("stealth") and not options.get("stealth_key"):
+        return "stealth mode without a stealth key uses a random key"
+    if options.get("output") is not None:
+        return "the carrier is written to a stream"
+    if hasattr(file, "read") or (isinstance(file, str) and file == "-"):
+        return "the payload is a stream"
+    if not isinstance(image, (str, os.PathLike)) or image == "-":
+        return "the cover is a stream"
+    return ""
+
+class ResultCache:
+    """
+    On-disk cache of the carriers produced by encode_image.
+
+    Parameters:
+    - directory (str): Directory of the cache, created if needed. Several processes can share it.
+    - max_bytes (int): Size limit of the cache, the least recently used carriers are evicted past it.
+    """
+    def __init__(self, directory: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        if max_bytes <= 0:
+            raise ValueError("The size limit of the cache must be positive.")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.counters = {"hits": 0, "misses": 0, "uncacheable": 0, "stored": 0, "evictions": 0}
+
+    def key(self, file, image: str, options: dict) -> str:
+        '''hex sha256 of the cover bytes, the payload bytes and the options changing the carrier'''
+        parameters = {name: options.get(name, default) for name, default in OUTPUT_OPTIONS.items()}
+        # Paths give the extension of the revealed file when none is given, and the version the format of the carrier
+        parameters["payload_extension"] = os.path.splitext(file)[1] if isinstance(file, (str, os.PathLike)) else ""
+        parameters["version"] = __version__
+
+        digest = hashlib.sha256()
+        digest.update(file_digest(image))
+        digest.update(hashlib.sha256(load_payload(file)).digest())
+        digest.update(json.dumps(parameters, sort_keys=True, default=str).encode())
+        return digest.hexdigest()
+
+    def entry(self, key: str) -> str:
+        '''path of the carrier stored for `key`, None when there's none'''
+        try:
+            names = os.listdir(os.path.join(self.directory, key))
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+        return os.path.join(self.directory, key, names[0]) if names else None
+
+    def get(self, key: str, output_directory: str = "", output_path: str = "") -> str:
+        '''copies the carrier stored for `key` to `output_path`, or under its own name in `output_directory`
+        (see utils.publish for the naming), returns its path or None on a miss'''
+        carrier = self.entry(key)
+        if carrier is None:
+            return None
+        try:
+            output = copy_file(carrier, output_path or os.path.join(output_directory, os.path.basename(carrier)), unique=not output_path)
+            os.utime(os.path.dirname(carrier)) # Most recently used, the carrier itself keeps its time
+        except FileNotFoundError:
+            return None # Evicted by another process in the meantime
+        return output
+
+    def put(self, key: str, carrier: str) -> None:
+        '''stores a carrier for `key`, then evicts the least recently used entries if the cache is too large'''
+        temporary_directory = temporary_name(os.path.join(self.directory, key))
+        os.makedirs(temporary_directory)
+        try:
+            copy_file(carrier, os.path.join(temporary_directory, os.path.basename(carrier)))
+            # A single rename, fails when another process stored the same key first (the two carriers are identical)
+            os.rename(temporary_directory, os.path.join(self.directory, key))
+            self.counters["stored"] += 1
+        except OSError:
+            pass
+        finally:
+            shutil.rmtree(temporary_directory, ignore_errors=True)
+        self.evict()
+
+    def entries(self) -> list[tuple[float, int, str]]:
+        '''(last use, size, key) of every entry, oldest first'''
+        entries = []
+        for key in os.listdir(self.directory):
+            carrier = self.entry(key) if not key.startswith(".") else None
+            if not carrier:
+                continue
+            try:
+                last_use = os.stat(os.path.dirname(carrier)).st_mtime
+                size = os.stat(carrier).st_size
+            except FileNotFoundError:
+                continue
+            entries.append((last_use, size, key))
+        return sorted(entries)
+
+    def evict(self) -> int:
+        '''removes the least recently used entries until the cache fits in its size limit, returns how many were removed'''
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        evicted = 0
+        for _, size, key in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(os.path.join(self.directory, key), ignore_errors=True)
+            total -= size
+            evicted += 1
+        self.counters["evictions"] += evicted
+        return evicted
+
+    def stats(self) -> dict:
+        '''hits, misses, uncacheable encodes, carriers stored and evicted by this cache object,
+        with the number of entries and the bytes currently in the cache'''
+        entries = self.entries()
+        lookups = self.counters["hits"] + self.counters["misses"]
+        return {
+            **self.counters,
+            "hit_ratio": self.counters["hits"] / lookups if lookups else 0.0,
+            "entries": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+            "max_bytes": self.max_bytes,
+        }
+
+    def encode_image(self, file, image: str, output_directory: str = "", **options) -> str:
+        '''VanGonography.encode_image going through the cache, the options are the ones of encode_image.
+        Returns the path of the carrier (None when it's written to a stream, such encodes are never cached)'''
+        reason = uncacheable_reason(file, image, options)
+        if reason:
+            # Serving a previous carrier would hand out the same key, nonce or stealth order twice
+            self.count("uncacheable")
+            print(f"Result cache not used: {reason}.")
+            return encode_image(file, image, output_directory, **options)
+
+        try:
+            key = self.key(file, image, options)
+        except Exception as e:
+            raise Exception(f"Error hashing the cover and the payload: {e}")
+
+        output = self.get(key, output_directory, options.get("output_path", ""))
+        if output is not None:
+            self.count("hits")
+            print(f'Carrier "{os.path.basename(output)}" served from the cache at "{os.path.dirname(output)}"')
+            return output
+
+        self.count("misses")
+        output = encode_image(file, image, output_directory, **options)
+        self.put(key, output)
+        return output
+
+    def count(self, result: str) -> None:
+        '''counts a lookup in the stats and in the metrics'''
+        self.counters[result] += 1
+        metrics.inc("vangonography_cache_total", result=result)
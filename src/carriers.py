@@ -0,0 +1,169 @@
+'''module for revealing the hidden files of a whole directory of images\n
+Every image is classified as carrier or non-carrier by looking only at its header (column 0),
+so non-carriers are never fully revealed. The verdicts are kept in a persistent index
+(path, mtime, size, verdict and header fields) stored inside the directory, this way re-scans
+skip the files that didn't change. The carriers are then revealed concurrently by a pool of worker processes,
+every run reveals the carriers whose sub directory of the output directory is missing or empty (so another output
+directory, or outputs that were deleted, get them revealed again).\n
+`python VanGonography.py -cli --decode-dir "images folder" -o "output folder" -w 8`'''
+
+import os
+import json
+
+import metrics
+from PIL import Image
+from concurrent.futures import ProcessPoolExecutor
+
+from utils import AtomicFile
+from VanGonography import header_array, read_header, check_header, decode_image
+
+INDEX_NAME = ".vangonography-index.json" # Name of the index file, saved inside the scanned directory
+IMAGE_EXTENSIONS = (".png", ".bmp", ".tif", ".tiff", ".webp", ".gif") # Lossless formats, anything else can't be a carrier
+
+def load_index(index_path: str) -> dict:
+    '''loads the index of a directory, returns an empty one if it doesn't exist or is unreadable'''
+    try:
+        with open(index_path, "r") as index_file:
+            return json.load(index_file)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def save_index(index: dict, index_path: str) -> None:
+    '''saves the index, writing to a temporary file first so an interrupted scan never leaves it corrupted'''
+    with AtomicFile(index_path, text=True) as index_file:
+        json.dump(index, index_file, indent=1)
+
+def classify_image(path: str) -> dict:
+    """
+    Classifies an image as carrier or non-carrier reading only its header, from the first rows of the image.
+
+    Parameters:
+    - path (str): Path to the image.
+
+    Returns:
+    dict: "carrier" (bool), "extension" and "data_length" (None for non-carriers) and "reason" for non-carriers.
+    """
+    try:
+        with Image.open(path, "r") as image:
+            size, mode = image.size, image.mode
+        header = read_header(header_array(path)) # Only the first rows are decoded
+        check_header(header, size, mode)
+    except Exception as e:
+        return {"carrier": False, "extension": None, "data_length": None, "reason": str(e)}
+
+    return {"carrier": True, "extension": header["extension"], "data_length": header["data_length"], "reason": ""}
+
+def _decode_carrier(path: str, output_directory: str, decrypt: bool, key: str, compressed: bool, stealth_key: str = "", password: str = "") -> str:
+    '''reveals the file hidden in a single carrier, runs inside a worker process'''
+    if output_directory:
+        os.makedirs(output_directory, exist_ok=True)
+    decode_image(path, output_directory, decrypt=decrypt, key=key, compressed=compressed, stealth_key=stealth_key, password=password)
+    return path
+
+def _run(function, jobs: list[tuple], pool: ProcessPoolExecutor):
+    '''runs function(*job) for every job, in the pool if there is one, yields (job, result, error)'''
+    if pool is None:
+        for job in jobs:
+            try:
+                yield job, function(*job), None
+            except Exception as e:
+                yield job, None, e
+        return
+
+    futures = [(job, pool.submit(function, *job)) for job in jobs]
+    for job, future in futures:
+        try:
+            yield job, future.result(), None
+        except Exception as e:
+            yield job, None, e
+
+def decode_directory(directory: str, output_directory: str = "", workers: int = 1, decrypt: bool = False, key: str = "", compressed: bool = False, index_path: str = "", stealth_key: str = "", password: str = "") -> dict:
+    """
+    Reveals the files hidden in every carrier of a directory.
+
+    Parameters:
+    - directory (str): Directory containing the images.
+    - output_directory (str): Directory where the revealed files are saved, each carrier gets its own sub directory.
+    - workers (int): Number of worker processes used for classifying and revealing.
+    - decrypt (bool): Decrypt the revealed data.
+    - key (str): Key used for decrypting.
+    - compressed (bool): Decompress the revealed data.
+    - index_path (str): Path of the index file, defaults to INDEX_NAME inside the directory.
+    - stealth_key (str): Key used for carriers hidden in stealth mode.
+    - password (str): Password of the carriers encrypted with one, every worker derives each salt's key only once.
+
+    Returns:
+    dict: Statistics of the scan, "skipped" counts the carriers already revealed in the output directory.
+    """
+    if not os.path.isdir(directory):
+        raise FileNotFoundError(f"Directory not found: {directory}")
+
+    index_path = index_path or os.path.join(directory, INDEX_NAME)
+    old_index = load_index(index_path)
+    index = {}
+    unclassified = set() # Images whose classification failed, left out of the saved index so the next scan retries them
+
+    stats = {"images": 0, "unchanged": 0, "carriers": 0, "decoded": 0, "skipped": 0, "failed": 0}
+    to_classify = []
+
+    # Checking which images changed since the last scan, comparing modification time and size
+    for entry in sorted(os.scandir(directory), key=lambda entry: entry.name):
+        if not entry.is_file() or not entry.name.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        stats["images"] += 1
+
+        stat = entry.stat()
+        cached = old_index.get(entry.name)
+        if cached and cached["mtime"] == stat.st_mtime_ns and cached["size"] == stat.st_size:
+            cached.pop("decoded", None) # Kept by older indexes, whether a carrier is revealed is decided by every run
+            index[entry.name] = cached
+            stats["unchanged"] += 1
+        else:
+            index[entry.name] = {"mtime": stat.st_mtime_ns, "size": stat.st_size}
+            to_classify.append((entry.path,))
+
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        # Classifying the new or modified images from their header only
+        for (path,), verdict, error in _run(classify_image, to_classify, pool):
+            name = os.path.basename(path)
+            if error is not None:
+                # classify_image never raises, the worker itself failed (e.g. BrokenProcessPool)
+                verdict = {"carrier": False, "extension": None, "data_length": None, "reason": str(error)}
+                unclassified.add(name)
+                stats["failed"] += 1
+                print(f"Error reading the header of '{name}': {error}")
+            index[name].update(verdict)
+
+        # Revealing every carrier that isn't revealed in this output directory yet, the revealed files are written
+        # atomically so a sub directory that isn't empty holds the whole result of a previous run
+        to_decode = []
+        for name, entry in index.items():
+            if entry["carrier"]:
+                stats["carriers"] += 1
+                carrier_output = os.path.join(output_directory, os.path.splitext(name)[0])
+                if os.path.isdir(carrier_output) and any(not file.startswith(".") for file in os.listdir(carrier_output)):
+                    stats["skipped"] += 1
+                    continue
+                to_decode.append((os.path.join(directory, name), carrier_output, decrypt, key, compressed, stealth_key, password))
+
+        for job, _, error in _run(_decode_carrier, to_decode, pool):
+            name = os.path.basename(job[0])
+            if pool is not None:
+                # Jobs of the worker processes are recorded in their own registry, counting them here instead
+                metrics.inc("vangonography_jobs_total", operation="decode", result="success" if error is None else "failure")
+                if error is not None:
+                    metrics.inc("vangonography_failures_total", operation="decode", reason=metrics.failure_reason(error))
+            if error is None:
+                stats["decoded"] += 1
+            else:
+                stats["failed"] += 1
+                print(f"Error revealing the file hidden in '{name}': {error}")
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        save_index({name: entry for name, entry in index.items() if name not in unclassified}, index_path)
+
+    print(f"Scanned {stats['images']} images ({stats['unchanged']} unchanged), "
+          f"found {stats['carriers']} carriers, revealed {stats['decoded']} files ({stats['skipped']} already revealed), {stats['failed']} failed.")
+    return stats
@@ -0,0 +1,150 @@
+'''module for choosing covers automatically from a directory of images (a cover pool)\n
+The pool keeps a persisted index of every image's dimensions and mode, read from the file headers only
+(PIL doesn't decode the pixels until they're needed), and updates it incrementally: only new or modified
+files are opened again and removed files are dropped. For each job the smallest cover able to hold the payload
+is chosen, which also keeps the PNG encoding time and the output size as small as possible. Covers too short
+for the header of the job (its size depends on the metadata, see VanGonography.write_header) are never chosen.\n
+`python VanGonography.py -cli -e --pool "covers folder" -f secret.txt`'''
+
+import os
+import json
+
+from PIL import Image
+
+from utils import AtomicFile
+from kernels import COVER_MODES, VALID_DEPTHS
+from VanGonography import header_height, layout_metadata
+
+INDEX_NAME = ".vangonography-pool.json" # Name of the index file, saved inside the pool directory
+
+def compressed_size_bound(size: int) -> int:
+    '''largest size zlib can produce from `size` bytes (same formula as zlib's compressBound)'''
+    return size + (size >> 12) + (size >> 14) + (size >> 25) + 13
+
+def encrypted_size(size: int) -> int:
+    '''size of the Fernet token of `size` bytes: version, timestamp, iv, padded ciphertext and hmac, base64 encoded'''
+    return 4 * -(-(1 + 8 + 16 + (size // 16 + 1) * 16 + 32) // 3)
+
+def required_capacity(size: int, compress: bool = False, encrypt: bool = False) -> int:
+    '''number of bytes a cover must be able to hold to hide a `size` bytes file with the given options'''
+    if compress:
+        size = compressed_size_bound(size)
+    if encrypt:
+        size = encrypted_size(size)
+    return size
+
+def cover_mode(mode: str) -> str:
+    '''mode data is hidden in for a cover of `mode`, encode_image converts the other modes (palette, CMYK...) to RGB.
+    Empty modes (files that aren't images) are kept as they are'''
+    return mode if not mode or mode in COVER_MODES else "RGB"
+
+def cover_capacity(width: int, height: int, mode: str, depth: int = None, alpha: bool = False) -> int:
+    '''number of bytes that can be hidden in a cover, column 0 is reserved for the header.
+    depth defaults to the one of the mode (see kernels.COVER_MODES), covers converted to RGB get its capacity,
+    0 is returned for files that aren't images'''
+    mode = cover_mode(mode)
+    if mode not in COVER_MODES or (alpha and mode != "RGBA"):
+        return 0
+    _, channels, default_depth = COVER_MODES[mode]
+    channels = 4 if alpha else channels
+    return max(0, width - 1) * height * channels * (depth or default_depth) // 8
+
+def capacity_options(width: int, height: int, mode: str) -> list[tuple[str, int]]:
+    '''capacity of a cover with every layout its mode supports, as (description, bytes)'''
+    if mode not in COVER_MODES:
+        return [(f"{mode} converted to RGB", cover_capacity(width, height, "RGB"))]
+
+    options = []
+    depths = VALID_DEPTHS if mode == "I;16" else VALID_DEPTHS[:-1] # 8 bits out of 8 would replace the whole image
+    for alpha in ([False, True] if mode == "RGBA" else [False]):
+        for depth in depths:
+            channels = "RGBA" if alpha else ("RGB" if mode in ("RGB", "RGBA") else mode)
+            default = " (default)" if depth == COVER_MODES[mode][2] and not alpha else ""
+            options.append((f"{channels}, {depth} bit(s){default}", cover_capacity(width, height, mode, depth, alpha)))
+    return options
+
+class CoverPool:
+    """cover pool with a persisted, incrementally updated index.\n
+    `pool = CoverPool("covers")` then `pool.best_fit(size)` returns the path of the smallest cover that fits."""
+
+    def __init__(self, directory: str, index_path: str = "") -> None:
+        if not os.path.isdir(directory):
+            raise FileNotFoundError(f"Cover pool directory not found: {directory}")
+        self.directory = directory
+        self.index_path = index_path or os.path.join(directory, INDEX_NAME)
+        try:
+            with open(self.index_path, "r") as index_file:
+                self.index = json.load(index_file)
+        except (FileNotFoundError, ValueError):
+            self.index = {}
+        self.refresh()
+
+    def refresh(self) -> None:
+        '''updates the index with the files added, modified or removed since the last refresh, then saves it'''
+        index = {}
+        changed = False
+        for entry in os.scandir(self.directory):
+            if not entry.is_file() or entry.name == os.path.basename(self.index_path):
+                continue
+
+            stat = entry.stat()
+            cached = self.index.get(entry.name)
+            if cached and cached["mtime"] == stat.st_mtime_ns and cached["size"] == stat.st_size:
+                index[entry.name] = cached
+                continue
+
+            # New or modified file, reading its header (the pixels aren't decoded)
+            changed = True
+            try:
+                with Image.open(entry.path) as cover:
+                    width, height = cover.size
+                    mode = cover.mode
+            except Exception:
+                width, height, mode = 0, 0, "" # Not an image, kept in the index so it isn't opened again
+            index[entry.name] = {"mtime": stat.st_mtime_ns, "size": stat.st_size, "width": width, "height": height, "mode": mode}
+
+        changed = changed or len(index) != len(self.index) # Some files were removed
+        self.index = index
+        if changed:
+            self.save()
+
+    def save(self) -> None:
+        '''saves the index, writing to a temporary file first so it's never left half written'''
+        with AtomicFile(self.index_path, text=True) as index_file:
+            json.dump(self.index, index_file, indent=1)
+
+    def covers(self, depth: int = None, alpha: bool = False, metadata: dict = None, extension: str = "") -> list[tuple[str, int]]:
+        '''returns (path, capacity in bytes) of every usable cover of the pool, the ones too short for a header with
+        `metadata` and `extension` (the layout metadata of each cover is added) aren't usable'''
+        covers = []
+        for name, entry in sorted(self.index.items()):
+            capacity = cover_capacity(entry["width"], entry["height"], entry["mode"], depth, alpha)
+            if capacity <= 0:
+                continue
+
+            # Column 0 must hold the header, a full cover gives its longest data length
+            mode = cover_mode(entry["mode"])
+            _, channels, default_depth = COVER_MODES[mode]
+            layout = layout_metadata(mode, 4 if alpha else channels, depth or default_depth)
+            if entry["height"] >= header_height(extension, capacity * 8, {**layout, **(metadata or {})}, mode):
+                covers.append((os.path.join(self.directory, name), capacity))
+        return covers
+
+    def best_fit(self, size: int, depth: int = None, alpha: bool = False, metadata: dict = None, extension: str = "") -> str:
+        """
+        Chooses the smallest cover able to hold `size` bytes.
+
+        Parameters:
+        - size (int): Number of bytes to hide, see `required_capacity` for compression and encryption overhead.
+        - depth (int): Number of bits hidden in each channel, defaults to the one of each cover's mode.
+        - alpha (bool): Only consider RGBA covers, also hiding data in their alpha channel.
+        - metadata (dict): Header metadata of the job besides the layout (see VanGonography.job_metadata).
+        - extension (str): Extension stored in the header.
+
+        Returns:
+        str: Path of the chosen cover.
+        """
+        fitting = [cover for cover in self.covers(depth, alpha, metadata, extension) if cover[1] >= size]
+        if not fitting:
+            raise ValueError(f"No cover in the pool is large enough to hide {size} bytes.")
+        return min(fitting, key=lambda cover: (cover[1], cover[0]))[0]
@@ -0,0 +1,318 @@
+'''multi-frame carriers: the data is spread across the frames of an animation (APNG, animated WebP, GIF)\n
+Every frame holds the data the same way a still cover does, column by column from column 1. Frame 0 also
+holds the header in column 0, with the number of frames used in its metadata. APNG and WebP frames hide data
+in their R, G and B channels, GIF frames in the last bit of their palette indices. The palette of GIF animations is sorted by luminance
+first (the frames are remapped, they look exactly the same), so changing the last bit of an index picks a color
+close to the original one. GIF frames with a palette of their own are mapped to the palette of the first frame.\n
+The frames are read, filled and written one at a time: the output is written by small streaming writers
+(lossless WebP and GIF frames are encoded by PIL, then wrapped in the animation container), so the memory
+needed is bounded by the frames being processed, not by the length of the animation. With several workers,
+the frames are filled and compressed in parallel by a pool of processes.\n
+Frames are written whole and never blended, so what's read back is exactly what was written. Transparency
+of GIF animations is dropped, a transparent index would show the previous frame instead of the data.\n
+`python VanGonography.py -cli -e -c animation.png -f secret.zip -w 4`'''
+
+import io
+import struct
+import zlib
+
+import numpy as np
+
+from PIL import Image, GifImagePlugin
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+
+from kernels import embed, extract_chunks, layout_capacity
+
+# Containers we can write, by PIL format: extension of the output
+FRAME_FORMATS = {
+    "PNG": "png", # APNG
+    "WEBP": "webp",
+    "GIF": "gif",
+}
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+@contextmanager
+def gif_indexes():
+    '''makes PIL keep the palette indices of every GIF frame sharing the palette of the first one,
+    by default every frame after the first one is converted to RGB'''
+    strategy = GifImagePlugin.LOADING_STRATEGY
+    GifImagePlugin.LOADING_STRATEGY = GifImagePlugin.LoadingStrategy.RGB_AFTER_DIFFERENT_PALETTE_ONLY
+    try:
+        yield
+    finally:
+        GifImagePlugin.LOADING_STRATEGY = strategy
+
+def is_animation(image: str) -> bool:
+    '''True when `image` is an animation we can hide data in (more than one frame, in a supported container)'''
+    try:
+        with Image.open(image, "r") as animation:
+            return animation.format in FRAME_FORMATS and getattr(animation, "n_frames", 1) > 1
+    except Exception:
+        return False
+
+def frame_mode(animation: Image.Image) -> str:
+    '''mode every frame of the animation is converted to: P for GIF, RGBA for animations with transparency, RGB otherwise'''
+    if animation.format == "GIF":
+        return "P"
+    if animation.mode in ("RGBA", "LA", "PA") or "transparency" in animation.info:
+        return "RGBA"
+    return "RGB"
+
+def layout_mode(mode: str) -> str:
+    '''mode whose layout (see kernels.COVER_MODES) is used for frames of `mode`, palette indices are hidden in like a grayscale image'''
+    return "L" if mode == "P" else mode
+
+def frame_array(animation: Image.Image, mode: str, palette: Image.Image = None) -> np.ndarray:
+    '''array of the current frame in `mode`, GIF frames with another palette are mapped to `palette` (the one of the first frame)'''
+    if mode != "P":
+        return np.array(animation.convert(mode))
+    if animation.mode == "P" and (palette is None or animation.getpalette() == palette.getpalette()):
+        return np.array(animation)
+    return np.array(animation.convert("RGB").quantize(palette=palette, dither=Image.Dither.NONE))
+
+def sorted_palette(palette: list) -> tuple[list, np.ndarray]:
+    '''palette sorted by luminance and the table mapping every old index to its new one'''
+    colors = np.array(palette, dtype=np.float64).reshape(-1, 3)
+    order = np.argsort(colors @ [0.299, 0.587, 0.114], kind='stable')
+    lookup = np.empty(order.size, dtype=np.uint8)
+    lookup[order] = np.arange(order.size)
+    return colors[order].astype(np.uint8).reshape(-1).tolist(), lookup
+
+def frame_capacity(size: tuple, channels: int, depth: int) -> int:
+    '''number of bytes a single frame of `size` (width, height) can hold'''
+    return layout_capacity((size[1], size[0]), 1, channels, depth) // 8
+
+def _encode_frame(array: np.ndarray, data: bytes, channels: int, depth: int, container: str, palette: list = None) -> bytes:
+    '''hides `data` in a frame and encodes it alone in the format of the container, runs inside a worker process'''
+    if len(data):
+        embed(array, data, 1, 0, channels, depth)
+    frame = Image.fromarray(array)
+    if palette is not None:
+        frame.putpalette(palette)
+
+    encoded = io.BytesIO()
+    if container == "webp":
+        frame.save(encoded, format="WEBP", lossless=True, exact=True, quality=100, method=4)
+    elif container == "gif":
+        frame.save(encoded, format="GIF", optimize=False)
+    else:
+        frame.save(encoded, format="PNG")
+    return encoded.getvalue()
+
+def png_chunks(png: bytes):
+    '''yields the (type, data) of every chunk of a PNG file'''
+    position = len(PNG_SIGNATURE)
+    while position < len(png):
+        length, = struct.unpack(">I", png[position:position + 4])
+        yield png[position + 4:position + 8], png[position + 8:position + 8 + length]
+        position += 12 + length
+
+def riff_chunks(data: bytes, position: int = 12):
+    '''yields the (fourcc, data) of every chunk of a RIFF file (WebP), starting after the RIFF header'''
+    while position + 8 <= len(data):
+        fourcc = data[position:position + 4]
+        length, = struct.unpack("<I", data[position + 4:position + 8])
+        yield fourcc, data[position + 8:position + 8 + length]
+        position += 8 + length + (length & 1)
+
+def gif_blocks(gif: bytes) -> tuple[bytes, bytes]:
+    '''splits a single frame GIF in its screen (header, logical screen descriptor and global color table) and its image
+    (image descriptor, local color table and image data), extension blocks are dropped'''
+    flags = gif[10]
+    position = 13 + (3 << ((flags & 7) + 1) if flags & 0x80 else 0)
+    screen = gif[:position]
+    while gif[position] == 0x21: # Extension: introducer, label, then sub blocks
+        position += 2
+        while gif[position]:
+            position += gif[position] + 1
+        position += 1
+    start = position
+    flags = gif[position + 9]
+    position += 10 + (3 << ((flags & 7) + 1) if flags & 0x80 else 0) + 1 # Descriptor, local table, LZW code size
+    while gif[position]:
+        position += gif[position] + 1
+    return screen, gif[start:position + 1]
+
+class FrameWriter:
+    """
+    Writes an animation frame by frame, from frames encoded alone (see `_encode_frame`).
+
+    Parameters:
+    - path (str): Path of the animation.
+    - container (str): "png" (APNG), "webp" or "gif".
+    - frame_count (int): Number of frames of the animation.
+    - loop (int): Number of times the animation is played, 0 forever (None plays GIF animations once).
+    """
+    def __init__(self, path: str, container: str, frame_count: int, loop: int = 0):
+        self.file = open(path, "wb")
+        self.container = container
+        self.frame_count = frame_count
+        self.loop = loop
+        self.frames = 0
+        self.sequence = 0 # APNG chunks are numbered
+        self.size = None # Canvas of WebP animations
+
+    def chunk(self, kind: bytes, data: bytes) -> None:
+        if self.container == "webp":
+            self.file.write(kind + struct.pack("<I", len(data)) + data + b"\x00" * (len(data) & 1))
+        else:
+            self.file.write(struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data)))
+
+    def add(self, encoded: bytes, duration: int) -> None:
+        '''adds a frame, `duration` in milliseconds'''
+        duration = max(0, min(int(duration or 0), 0xFFFF))
+        getattr(self, f"_add_{self.container}")(encoded, duration)
+        self.frames += 1
+
+    def _add_png(self, encoded: bytes, duration: int) -> None:
+        chunks = list(png_chunks(encoded))
+        header = next(data for kind, data in chunks if kind == b"IHDR")
+        if self.frames == 0:
+            self.file.write(PNG_SIGNATURE)
+            self.chunk(b"IHDR", header)
+            self.chunk(b"acTL", struct.pack(">II", self.frame_count, self.loop))
+        # Whole frame, shown for `duration` ms, left as it is afterwards and never blended with the previous one
+        width, height = struct.unpack(">II", header[:8])
+        self.chunk(b"fcTL", struct.pack(">IIIIIHHBB", self.sequence, width, height, 0, 0, duration, 1000, 0, 0))
+        self.sequence += 1
+        for kind, data in chunks:
+            if kind != b"IDAT":
+                continue
+            if self.frames == 0:
+                self.chunk(b"IDAT", data) # The first frame is also the default image
+            else:
+                self.chunk(b"fdAT", struct.pack(">I", self.sequence) + data)
+                self.sequence += 1
+
+    def _add_webp(self, encoded: bytes, duration: int) -> None:
+        if self.frames == 0:
+            with Image.open(io.BytesIO(encoded)) as frame:
+                width, height, alpha = frame.width, frame.height, frame.mode == "RGBA"
+            self.file.write(b"RIFF\x00\x00\x00\x00WEBP") # The size is written when closing
+            self.chunk(b"VP8X", struct.pack("<B3x", 0x02 | (0x10 if alpha else 0)) + (width - 1).to_bytes(3, "little") + (height - 1).to_bytes(3, "little"))
+            self.chunk(b"ANIM", struct.pack("<IH", 0, self.loop))
+            self.size = (width, height)
+        frame_data = b"".join(kind + struct.pack("<I", len(data)) + data + b"\x00" * (len(data) & 1)
+                              for kind, data in riff_chunks(encoded) if kind in (b"VP8L", b"VP8 ", b"ALPH"))
+        # Offset 0, 0, whole canvas, `duration` ms, no blending and no disposal
+        header = bytes(6) + (self.size[0] - 1).to_bytes(3, "little") + (self.size[1] - 1).to_bytes(3, "little") + duration.to_bytes(3, "little") + b"\x02"
+        self.chunk(b"ANMF", header + frame_data)
+
+    def _add_gif(self, encoded: bytes, duration: int) -> None:
+        screen, image = gif_blocks(encoded)
+        if self.frames == 0:
+            self.file.write(b"GIF89a" + screen[6:])
+            if self.loop is not None: # Without the Netscape extension the animation is played once
+                self.file.write(b"\x21\xff\x0bNETSCAPE2.0\x03\x01" + struct.pack("<H", self.loop) + b"\x00")
+        # Graphic control extension: left in place (disposal 1), delay in hundredths of a second, no transparency
+        self.file.write(b"\x21\xf9\x04\x04" + struct.pack("<H", round(duration / 10)) + b"\x00\x00")
+        self.file.write(image)
+
+    def close(self) -> None:
+        if self.container == "gif":
+            self.file.write(b"\x3b")
+        elif self.container == "webp":
+            size = self.file.tell()
+            self.file.seek(4)
+            self.file.write(struct.pack("<I", size - 8))
+        else:
+            self.chunk(b"IEND", b"")
+        self.file.close()
+
+def encode_frames(data, animation_path: str, output_filename: str, extension: str, workers: int = 1, depth: int = None, metadata: dict = None) -> int:
+    """
+    Hides data across the frames of an animation, frame by frame.
+
+    Parameters:
+    - data (bytes-like): Data to hide (already compressed and encrypted if needed).
+    - animation_path (str): Path to the cover animation (APNG, WebP or GIF).
+    - output_filename (str): Path of the output animation, in the same container.
+    - extension (str): Extension of the hidden file, stored in the header.
+    - workers (int): Number of processes filling and compressing the frames in parallel.
+    - depth (int): Number of bits hidden in each channel (GIF frames always hide 1 bit per index).
+    - metadata (dict): Extra header fields (e.g. the name of the hidden file).
+
+    Returns:
+    int: Number of frames holding data.
+    """
+    from VanGonography import write_header, cover_layout, layout_metadata # Imported here because VanGonography imports this module
+
+    data = np.frombuffer(data, dtype=np.uint8) if not isinstance(data, np.ndarray) else data
+    with gif_indexes(), Image.open(animation_path, "r") as animation:
+        container = FRAME_FORMATS[animation.format]
+        frame_count = animation.n_frames
+        loop = animation.info.get("loop", None if container == "gif" else 0)
+        mode = frame_mode(animation)
+        if mode == "P" and depth not in (None, 1):
+            raise ValueError("GIF animations hide a single bit in each palette index, the depth can't be changed.")
+        channels, depth = cover_layout(layout_mode(mode), False, 1 if mode == "P" else depth)
+
+        capacity = frame_capacity(animation.size, channels, depth)
+        frames_used = -(-data.size // capacity) if capacity else 0
+        if not capacity or frames_used > frame_count:
+            raise ValueError("Cover animation is too small to hide the data.")
+
+        first = frame_array(animation, mode)
+        palette_image = palette = None
+        if mode == "P":
+            # Frames are mapped to the palette of the first one, then to the same palette sorted by luminance
+            palette_image = Image.fromarray(first, "P")
+            palette_image.putpalette(animation.getpalette())
+            palette, lookup = sorted_palette(palette_image.getpalette())
+            first = lookup[first]
+
+        header_metadata = layout_metadata(layout_mode(mode), channels, depth)
+        header_metadata["frames"] = frames_used
+        header_metadata.update(metadata or {})
+        write_header(first, extension, data.size * 8, header_metadata)
+
+        writer = FrameWriter(output_filename, container, frame_count, loop)
+        pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+        pending = deque() # Frames being encoded by the pool, in order, with their duration
+        try:
+            for index in range(frame_count):
+                if index:
+                    animation.seek(index)
+                    array = frame_array(animation, mode, palette_image)
+                    if mode == "P":
+                        array = lookup[array]
+                else:
+                    array = first
+                job = (array, data[index * capacity:(index + 1) * capacity].tobytes(), channels, depth, container, palette)
+                duration = animation.info.get("duration", 0)
+
+                if pool is None:
+                    writer.add(_encode_frame(*job), duration)
+                    continue
+                pending.append((pool.submit(_encode_frame, *job), duration))
+                # At most two frames per worker are waiting, the memory stays bounded
+                while len(pending) >= 2 * workers:
+                    future, duration = pending.popleft()
+                    writer.add(future.result(), duration)
+
+            while pending:
+                future, duration = pending.popleft()
+                writer.add(future.result(), duration)
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+            writer.close()
+
+    return frames_used
+
+def extract_frame_chunks(image: str, size: int, channels: int, depth: int, frames: int):
+    '''reveals `size` bytes hidden with `encode_frames`, frame by frame and in chunks (see kernels.extract_chunks)'''
+    with gif_indexes(), Image.open(image, "r") as animation:
+        if animation.format not in FRAME_FORMATS or getattr(animation, "n_frames", 1) < frames:
+            raise ValueError("Image doesn't contain the frames listed in its header.")
+        mode = frame_mode(animation)
+        capacity = frame_capacity(animation.size, channels, depth)
+
+        for index in range(frames):
+            animation.seek(index)
+            if mode == "P" and animation.mode != "P":
+                raise ValueError("Invalid image format. The palette of the GIF frames changed.")
+            array = frame_array(animation, mode)
+            yield from extract_chunks(array, min(capacity, size - index * capacity), 1, 0, channels, depth)
@@ -0,0 +1,277 @@
+'''vectorized kernels for hiding and revealing data inside a cover array\n
+The layout is the same one `encode_image`/`decode_image` have always used:
+the data is split in crumbs (2 bits each by default, most significant first), then the crumbs
+are written column by column starting from column 1, top to bottom, in the last bits
+of the R, G and B channels of each pixel. Column 0 is never touched because it holds the header.\n
+The number of channels used (1 for grayscale, 3 for RGB, 4 to also use the alpha channel) and the number
+of bits hidden in each channel (the depth: 1, 2, 4 or 8, 16-bit images can afford more) can be changed,
+a crumb is always `depth` bits long.\n
+Instead of looping pixel by pixel we work on whole blocks of columns at once, the blocks are
+small enough to keep the temporary arrays bounded no matter how big the payload is.
+With the numba backend (see backends.py) the plain layout goes through fused kernels instead, without temporary arrays.'''
+
+import numpy as np
+
+import backends
+
+CRUMB_SIZE = 2 # Default number of bits hidden in each channel
+CHANNELS_USED = 3 # By default we only hide data in the R, G and B channels
+VALID_DEPTHS = (1, 2, 4, 8) # A byte must be made of a whole number of crumbs
+CHUNK_BYTES = 1 << 20 # Number of data bytes processed at once, keeps the temporary arrays small
+SCATTER_CHUNK = 1 << 17 # Same for scattered layouts, every crumb needs its own index so the chunks are smaller
+
+# Supported cover modes: number of channels of the array, channels used by default and default depth
+COVER_MODES = {
+    "RGB": (3, 3, 2),
+    "RGBA": (4, 3, 2), # The alpha channel is only used when asked
+    "L": (1, 1, 2),
+    "I;16": (1, 1, 4), # 16-bit grayscale, changing 4 low bits out of 16 is far less visible than 2 out of 8
+}
+
+def as_byte_array(data) -> np.ndarray:
+    '''returns a flat uint8 view of `data` (bytes, bytearray, memoryview or numpy array), no copy is made when possible'''
+    if isinstance(data, np.ndarray):
+        return data.reshape(-1).view(np.uint8)
+    return np.frombuffer(data, dtype=np.uint8)
+
+def crumb_shifts(depth: int = CRUMB_SIZE) -> np.ndarray:
+    '''shifts used to get the crumbs of a byte, most significant first'''
+    if depth not in VALID_DEPTHS:
+        raise ValueError(f"Invalid depth {depth}, it must be one of {VALID_DEPTHS}.")
+    return np.arange(8 - depth, -1, -depth, dtype=np.uint8)
+
+def bytes_to_crumbs(data, depth: int = CRUMB_SIZE) -> np.ndarray:
+    '''splits every byte in 8 / depth crumbs, most significant first'''
+    data = as_byte_array(data)
+    return ((data[:, None] >> crumb_shifts(depth)) & ((1 << depth) - 1)).reshape(-1)
+
+def crumbs_to_bytes(crumbs: np.ndarray, depth: int = CRUMB_SIZE) -> np.ndarray:
+    '''joins groups of 8 / depth crumbs back in bytes, the opposite of `bytes_to_crumbs`'''
+    shifts = crumb_shifts(depth)
+    return np.bitwise_or.reduce(crumbs.astype(np.uint8).reshape(-1, shifts.size) << shifts, axis=1).astype(np.uint8)
+
+def as_channels(cover_array: np.ndarray) -> np.ndarray:
+    '''view of the array with a channel axis, single channel images have shape (height, width)'''
+    return cover_array[..., None] if cover_array.ndim == 2 else cover_array
+
+def crumbs_per_column(shape: tuple, channels: int = CHANNELS_USED) -> int:
+    '''number of crumbs a single column of the cover can hold'''
+    return shape[0] * channels
+
+def layout_capacity(shape: tuple, column: int = 1, channels: int = CHANNELS_USED, depth: int = CRUMB_SIZE) -> int:
+    '''number of bits that can be hidden starting from `column`'''
+    return max(0, shape[1] - column) * crumbs_per_column(shape, channels) * depth
+
+def columns_needed(shape: tuple, size: int, channels: int = CHANNELS_USED, depth: int = CRUMB_SIZE) -> int:
+    '''number of columns needed to hide `size` bytes'''
+    return -(-size * (8 // depth) // crumbs_per_column(shape, channels))
+
+def _windows(shape: tuple, size: int, column: int, offset: int, channels: int, depth: int):
+    '''
+    Splits the hiding of `size` bytes in blocks of columns.
+
+    Yields tuples (start, stop, first_column, last_column, skip), where [start, stop) is the range of data bytes
+    handled by the block, [first_column, last_column) the columns it touches and skip the number of crumbs
+    to skip at the beginning of the first column (it's only non zero when `offset` doesn't fall on a column boundary).
+    '''
+    per_column = crumbs_per_column(shape, channels)
+    per_byte = 8 // depth
+    for start in range(0, size, CHUNK_BYTES):
+        stop = min(start + CHUNK_BYTES, size)
+        first_crumb = offset + start * per_byte
+        last_crumb = offset + stop * per_byte
+        first = first_crumb // per_column
+        last = -(-last_crumb // per_column) # Ceil division
+        yield start, stop, column + first, column + last, first_crumb - first * per_column
+
+def embed(cover_array: np.ndarray, data, column: int = 1, offset: int = 0, channels: int = CHANNELS_USED, depth: int = CRUMB_SIZE) -> None:
+    """
+    Hides data inside the cover array, modifying it in place.
+
+    Parameters:
+    - cover_array (np.ndarray): Array of the cover image, shape (height, width, channels) or (height, width).
+    - data (bytes-like): Data to be hidden.
+    - column (int): First column of the layout, column 0 is reserved for the header.
+    - offset (int): Number of crumbs of the layout to skip before writing (used by workers writing a slice of the data).
+    - channels (int): Number of channels used in each pixel.
+    - depth (int): Number of bits hidden in each channel.
+
+    Returns:
+    None
+    """
+    data = as_byte_array(data)
+    cover_array = as_channels(cover_array)
+
+    # Checking if the cover image is large enough to hide the data
+    if (offset + data.size * (8 // depth)) * depth > layout_capacity(cover_array.shape, column, channels, depth):
+        raise ValueError("Cover image is too small to hide the data.")
+
+    if backends.get_backend() == "numba":
+        backends.embed_fused(cover_array, data, column, offset, channels, depth)
+        return
+
+    # Used to clear the last `depth` bits of a number, whatever the bit depth of the image is
+    clear_mask = cover_array.dtype.type(np.iinfo(cover_array.dtype).max ^ ((1 << depth) - 1))
+
+    for start, stop, first, last, skip in _windows(cover_array.shape, data.size, column, offset, channels, depth):
+        crumbs = bytes_to_crumbs(data[start:stop], depth)
+
+        # Columns are written top to bottom, so we put the column axis first before flattening
+        window = cover_array[:, first:last, :channels].transpose(1, 0, 2)
+        flat = window.reshape(-1)
+        flat[skip:skip + crumbs.size] = (flat[skip:skip + crumbs.size] & clear_mask) | crumbs
+        window[...] = flat.reshape(window.shape) # Writing the block back (no-op if reshape returned a view)
+
+def embed_chunks(cover_array: np.ndarray, chunks, column: int = 1, channels: int = CHANNELS_USED, depth: int = CRUMB_SIZE) -> int:
+    '''hides a stream of chunks one after the other, for data whose size isn't known before it's all read (e.g. stdin).
+    Returns the number of bytes hidden'''
+    size = 0
+    for chunk in chunks:
+        embed(cover_array, chunk, column, size * (8 // depth), channels, depth)
+        size += len(chunk)
+    return size
+
+def extract_chunks(steg_array: np.ndarray, size: int, column: int = 1, offset: int = 0, channels: int = CHANNELS_USED, depth: int = CRUMB_SIZE):
+    """
+    Reveals data hidden inside a stego array in chunks of at most CHUNK_BYTES bytes.
+
+    Only one chunk is held in memory at a time, so the memory needed doesn't grow with the payload size.
+
+    Parameters:
+    - steg_array (np.ndarray): Array of the image with the hidden data.
+    - size (int): Number of bytes to reveal.
+    - column (int): First column of the layout.
+    - offset (int): Number of crumbs of the layout to skip before reading.
+    - channels (int): Number of channels used in each pixel.
+    - depth (int): Number of bits hidden in each channel.
+
+    Yields:
+    np.ndarray: uint8 arrays with the revealed data, in order.
+    """
+    steg_array = as_channels(steg_array)
+    if (offset + size * (8 // depth)) * depth > layout_capacity(steg_array.shape, column, channels, depth):
+        raise ValueError("Image is too small to contain the data, header information is probably corrupted.")
+
+    if backends.get_backend() == "numba":
+        for start in range(0, size, CHUNK_BYTES):
+            chunk = np.empty(min(CHUNK_BYTES, size - start), dtype=np.uint8)
+            backends.extract_fused(steg_array, chunk, column, offset + start * (8 // depth), channels, depth)
+            yield chunk
+        return
+
+    for start, stop, first, last, skip in _windows(steg_array.shape, size, column, offset, channels, depth):
+        window = steg_array[:, first:last, :channels].transpose(1, 0, 2).reshape(-1)
+        crumbs = window[skip:skip + (stop - start) * (8 // depth)] & ((1 << depth) - 1)
+        yield crumbs_to_bytes(crumbs, depth)
+
+def extract(steg_array: np.ndarray, size: int, column: int = 1, offset: int = 0, out: np.ndarray = None, channels: int = CHANNELS_USED, depth: int = CRUMB_SIZE) -> np.ndarray:
+    """
+    Reveals data hidden inside a stego array.
+
+    Parameters:
+    - steg_array (np.ndarray): Array of the image with the hidden data.
+    - size (int): Number of bytes to reveal.
+    - column (int): First column of the layout.
+    - offset (int): Number of crumbs of the layout to skip before reading.
+    - out (np.ndarray): Optional uint8 array of `size` elements to write the data to.
+    - channels (int): Number of channels used in each pixel.
+    - depth (int): Number of bits hidden in each channel.
+
+    Returns:
+    np.ndarray: uint8 array with the revealed data.
+    """
+    if out is None:
+        out = np.empty(size, dtype=np.uint8)
+
+    if backends.get_backend() == "numba":
+        # Revealing straight into `out`, no chunk is needed
+        steg_array = as_channels(steg_array)
+        if (offset + size * (8 // depth)) * depth > layout_capacity(steg_array.shape, column, channels, depth):
+            raise ValueError("Image is too small to contain the data, header information is probably corrupted.")
+        backends.extract_fused(steg_array, out[:size], column, offset, channels, depth)
+        return out
+
+    position = 0
+    for chunk in extract_chunks(steg_array, size, column, offset, channels, depth):
+        out[position:position + chunk.size] = chunk
+        position += chunk.size
+
+    return out
+
+def difference(source_array: np.ndarray, cover_array: np.ndarray) -> np.ndarray:
+    '''difference of the R, G and B channels of two images of the same size, shifted by 128 so it's visible
+    and clipped to [0, 255], as a uint8 array of shape (height, width, 3). Single channel images are shown in gray'''
+    source_array = as_channels(source_array)[..., :3]
+    cover_array = as_channels(cover_array)[..., :3]
+    if source_array.shape != cover_array.shape:
+        raise ValueError("The images must have the same size and mode.")
+
+    if backends.get_backend() == "numba":
+        difference_array = np.empty(source_array.shape, dtype=np.uint8)
+        backends.difference_fused(source_array, cover_array, difference_array)
+    else:
+        difference_array = np.clip(cover_array.astype(np.int32) - source_array + 128, 0, 255).astype(np.uint8)
+    return np.repeat(difference_array, 3, axis=2) if difference_array.shape[2] == 1 else difference_array
+
+# Scattered layouts (stealth and adaptive modes) don't fill the columns in order, pixel `i` of the data goes to
+# pixel `pixel_order(i)` of the cover instead. Cover pixels are numbered column by column starting from column 1,
+# `pixel_order(first, last)` returns the cover pixels of the data pixels [first, last) as an integer array.
+
+def scattered_positions(shape: tuple, start: int, stop: int, pixel_order, channels: int = CHANNELS_USED) -> tuple:
+    '''rows, columns and channels of the crumbs [start, stop) of the data in a scattered layout'''
+    crumbs = np.arange(start, stop, dtype=np.int64)
+    pixels = crumbs // channels
+    first = int(pixels[0])
+    scattered = np.asarray(pixel_order(first, int(pixels[-1]) + 1)).astype(np.int64)[pixels - first]
+    return scattered % shape[0], 1 + scattered // shape[0], crumbs % channels
+
+def embed_scattered(cover_array: np.ndarray, data, pixel_order, channels: int = CHANNELS_USED, depth: int = CRUMB_SIZE) -> None:
+    """
+    Hides data inside the cover array in the order given by `pixel_order`, modifying it in place.
+
+    Parameters:
+    - cover_array (np.ndarray): Array of the cover image, shape (height, width, channels) or (height, width).
+    - data (bytes-like): Data to be hidden.
+    - pixel_order (callable): Returns the cover pixels of the data pixels [first, last).
+    - channels (int): Number of channels used in each pixel.
+    - depth (int): Number of bits hidden in each channel.
+
+    Returns:
+    None
+    """
+    data = as_byte_array(data)
+    cover_array = as_channels(cover_array)
+    if data.size * 8 > layout_capacity(cover_array.shape, 1, channels, depth):
+        raise ValueError("Cover image is too small to hide the data.")
+
+    clear_mask = cover_array.dtype.type(np.iinfo(cover_array.dtype).max ^ ((1 << depth) - 1))
+    per_byte = 8 // depth
+    for start in range(0, data.size, SCATTER_CHUNK):
+        stop = min(start + SCATTER_CHUNK, data.size)
+        crumbs = bytes_to_crumbs(data[start:stop], depth)
+        rows, columns, planes = scattered_positions(cover_array.shape, start * per_byte, stop * per_byte, pixel_order, channels)
+        cover_array[rows, columns, planes] = (cover_array[rows, columns, planes] & clear_mask) | crumbs
+
+def extract_scattered_chunks(steg_array: np.ndarray, size: int, pixel_order, channels: int = CHANNELS_USED, depth: int = CRUMB_SIZE):
+    """
+    Reveals data hidden with `embed_scattered`, in chunks of at most SCATTER_CHUNK bytes.
+
+    Parameters:
+    - steg_array (np.ndarray): Array of the image with the hidden data.
+    - size (int): Number of bytes to reveal.
+    - pixel_order (callable): Same order used to hide the data.
+    - channels (int): Number of channels used in each pixel.
+    - depth (int): Number of bits hidden in each channel.
+
+    Yields:
+    np.ndarray: uint8 arrays with the revealed data, in order.
+    """
+    steg_array = as_channels(steg_array)
+    if size * 8 > layout_capacity(steg_array.shape, 1, channels, depth):
+        raise ValueError("Image is too small to contain the data, header information is probably corrupted.")
+
+    per_byte = 8 // depth
+    for start in range(0, size, SCATTER_CHUNK):
+        stop = min(start + SCATTER_CHUNK, size)
+        rows, columns, planes = scattered_positions(steg_array.shape, start * per_byte, stop * per_byte, pixel_order, channels)
+        yield crumbs_to_bytes(steg_array[rows, columns, planes] & ((1 << depth) - 1), depth)
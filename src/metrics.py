@@ -0,0 +1,204 @@
+'''in-process metrics (counters, gauges and latency histograms) for monitoring VanGonography in production\n
+The encode, decode and difference code paths feed a single registry: jobs per operation and result, failure
+reasons, bytes hidden and revealed, jobs in progress and the latency of every stage. The registry can be dumped
+in the Prometheus text format to a file (`--metrics metrics.prom`) or served on a local endpoint (`--metrics-port 9100`,
+or `metrics.serve(9100)` from a long running process).\n
+The registry is disabled by default, every call then returns right away, so the overhead is a single attribute lookup.
+Jobs running in worker processes are recorded in the registry of their own process.'''
+
+import time
+import threading
+import functools
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Latency buckets in seconds, from small files in small covers to huge covers
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# Every metric fed by the code paths: name -> (type, help)
+METRICS = {
+    "vangonography_jobs_total": ("counter", "Jobs finished, by operation and result"),
+    "vangonography_failures_total": ("counter", "Failed jobs, by operation and reason"),
+    "vangonography_bytes_total": ("counter", "Bytes hidden (encode) or revealed (decode), after compression and encryption"),
+    "vangonography_jobs_in_progress": ("gauge", "Jobs currently running, by operation"),
+    "vangonography_job_seconds": ("histogram", "Duration of whole jobs, by operation"),
+    "vangonography_stage_seconds": ("histogram", "Duration of every stage of a job, by operation and stage"),
+    "vangonography_cache_total": ("counter", "Result cache lookups, by result (hits, misses, uncacheable)"),
+}
+
+class Registry:
+    '''thread safe store of the metric values, keyed by name and sorted label pairs'''
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS):
+        self.enabled = False
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.values = {} # (name, labels) -> value for counters and gauges, [bucket counts, sum, count] for histograms
+
+    def add(self, name: str, value: float, labels: dict, replace: bool = False) -> None:
+        '''adds `value` to a counter or gauge (sets it when `replace` is True)'''
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.values[key] = value if replace else self.values.get(key, 0) + value
+
+    def observe(self, name: str, value: float, labels: dict) -> None:
+        '''records `value` in a histogram'''
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.values.get(key)
+            if histogram is None:
+                histogram = self.values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram[0][index] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def reset(self) -> None:
+        with self.lock:
+            self.values.clear()
+
+    def render(self) -> str:
+        '''the registry in the Prometheus text exposition format'''
+        with self.lock:
+            values = sorted(self.values.items())
+
+        lines = []
+        for name, (kind, description) in METRICS.items():
+            samples = [(labels, value) for (metric, labels), value in values if metric == name]
+            if not samples:
+                continue
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                if kind != "histogram":
+                    lines.append(f"{name}{format_labels(labels)} {value:g}")
+                    continue
+                bucket_counts, total, count = value
+                for bound, bucket_count in zip(self.buckets, bucket_counts):
+                    lines.append(f"{name}_bucket{format_labels(labels + (('le', f'{bound:g}'),))} {bucket_count}")
+                lines.append(f"{name}_bucket{format_labels(labels + (('le', '+Inf'),))} {count}")
+                lines.append(f"{name}_sum{format_labels(labels)} {total:g}")
+                lines.append(f"{name}_count{format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+def format_labels(labels: tuple) -> str:
+    '''label pairs as {name="value",...}, with the characters Prometheus needs escaped'''
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, value in labels)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + "}"
+
+def enable(enabled: bool = True) -> None:
+    '''turns the recording on (or off), nothing is recorded until this is called'''
+    REGISTRY.enabled = enabled
+
+def inc(name: str, value: float = 1, **labels) -> None:
+    '''increments a counter'''
+    if REGISTRY.enabled:
+        REGISTRY.add(name, value, labels)
+
+def set_gauge(name: str, value: float, **labels) -> None:
+    '''sets a gauge'''
+    if REGISTRY.enabled:
+        REGISTRY.add(name, value, labels, replace=True)
+
+def observe(name: str, value: float, **labels) -> None:
+    '''records a value (a latency in seconds) in a histogram'''
+    if REGISTRY.enabled:
+        REGISTRY.observe(name, value, labels)
+
+class _Timer:
+    '''context manager recording the time spent inside it in a histogram'''
+    __slots__ = ("name", "labels", "start")
+
+    def __init__(self, name: str, labels: dict):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        REGISTRY.observe(self.name, time.perf_counter() - self.start, self.labels)
+
+class _NoTimer:
+    '''context manager doing nothing, used while the registry is disabled'''
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        pass
+
+_NO_TIMER = _NoTimer()
+
+def stage(operation: str, name: str):
+    '''times a stage of a job: `with stage("encode", "embed"): ...`'''
+    if not REGISTRY.enabled:
+        return _NO_TIMER
+    return _Timer("vangonography_stage_seconds", {"operation": operation, "stage": name})
+
+def failure_reason(error: Exception) -> str:
+    '''short and stable reason of a failure, the error message up to its first ":" (paths and details come after it)'''
+    reason = str(error).partition(":")[0].strip().rstrip(".")
+    return reason[:80] or type(error).__name__
+
+def job(operation: str):
+    '''decorator recording the jobs of a function: count, result, failure reason, duration and jobs in progress'''
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not REGISTRY.enabled:
+                return function(*args, **kwargs)
+
+            inc("vangonography_jobs_in_progress", 1, operation=operation)
+            start = time.perf_counter()
+            try:
+                result = function(*args, **kwargs)
+            except BaseException as e:
+                inc("vangonography_jobs_total", operation=operation, result="failure")
+                inc("vangonography_failures_total", operation=operation, reason=failure_reason(e))
+                raise
+            else:
+                inc("vangonography_jobs_total", operation=operation, result="success")
+                return result
+            finally:
+                observe("vangonography_job_seconds", time.perf_counter() - start, operation=operation)
+                inc("vangonography_jobs_in_progress", -1, operation=operation)
+        return wrapper
+    return decorator
+
+def write(path: str) -> None:
+    '''writes the registry to a file in the Prometheus text format (e.g. for the node exporter textfile collector),
+    through a temporary file so a scraper never reads half of it'''
+    from utils import AtomicFile # Imported here so the registry can be used without the image dependencies
+
+    with AtomicFile(path, text=True) as metrics_file:
+        metrics_file.write(REGISTRY.render())
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args) -> None:
+        pass # Scrapes would flood the terminal
+
+def serve(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    '''serves the registry on http://host:port/metrics from a background thread and enables the recording.
+    Returns the server, call its `shutdown` method to stop it'''
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="vangonography-metrics", daemon=True).start()
+    enable()
+    return server
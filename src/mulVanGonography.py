@@ -5,16 +5,84 @@ How it works: Initialize the VanGons class\n
 `v.encode(["files to hide"], "cover image", "output directory")`\n
 # to decode files from an encoded image
 `v.decode("encoded_cover_image", "output directory")`\n
-`Note:`\n
-rgba images, i.e images with shape(row, colomn, 4) doesn't work currently and will result in the error:\n
-`could not broadcast input array from shape (3,) into shape (4,)`'''
+Files with identical content are hidden only once (pass `dedup=False` to `encode_files` to disable it),
+their header entries all point to the same data and `decode_files` hard-links the copies.\n
+The header is a compact binary table (varint lengths and offsets, then the names of the files) stored right
+after the last file, so there is no limit on the number of files beyond the capacity of the cover, and
+the files are revealed under their own name. Carriers made by older versions can still be read.\n
+# to hide files as one solid archive, compressed as a whole, then list them or reveal only one of them
+`v.encode_files(["files to hide"], "cover image", "output directory", solid=True)`,
+`v.list_files("encoded_cover_image")`, `v.extract_file("encoded_cover_image", "name.txt", "output directory")`\n
+# to add files to an image that already contains hidden files, or remove some of them
+`v.append_files(["new files"], "encoded_cover_image")`, `v.delete_files("encoded_cover_image", [2])`\n
+RGB, RGBA, L and I;16 covers are supported with the default layout of their mode (see VanGonography.cover_layout),
+the alpha channel of RGBA covers is left untouched.\n
+# to list the files by reading only the top rows of the image (see scanlines.py)
+`v.encode_files(["files"], "cover_image", "output directory", scanline=True)`\n
+Files are hidden and revealed concurrently by a pool of threads (`workers`, one per CPU by default), every file
+has its own place in the cover so the threads never write to the same columns (see `embed_blobs`).'''
 
 import os
 from PIL import Image
 import numpy as np
 import shutil
+import hashlib
 from utils import *
+from kernels import embed, extract, extract_chunks, columns_needed, layout_capacity, crumbs_per_column, bytes_to_crumbs, crumbs_to_bytes, as_channels, CHUNK_BYTES, COVER_MODES
+from scanlines import RowReader
+from streams import write_file, decompress_chunks, ChunkReader
 import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+TABLE_MAGIC = (ord("V"), ord("G")) # R and G of pixel (0,0), older carriers always have a multiple of 8 in G
+TABLE_VERSION = 1 # B of pixel (0,0)
+SOLID_VERSION = 2 # B of pixel (0,0) of solid archives, the table starts with the size of the compressed archive
+SCANLINE_TABLE = 4 # Added to the version when a copy of the table is in the top rows of the image (see write_headers)
+TABLE_POINTER_ROWS = 13 # Rows of column 0 of RGB covers holding the table offset (48 bits), length (32 bits) and crc32 (32 bits), 9 bits per row
+# Values of column 0 holding the magic, the version and the pointer (3 bits in each value): the R, G and B of the first
+# 14 pixels of RGB covers, the first 42 pixels of single channel covers
+HEADER_VALUES = 3 + TABLE_POINTER_ROWS * 3
+
+def array_layout(cover_array: np.ndarray) -> tuple[int, int]:
+    '''(channels, depth) the files are hidden with in a cover array, the default layout of its mode:
+    the R, G and B channels of RGB and RGBA covers, the only channel of L and I;16 ones'''
+    mode = "RGB" if cover_array.ndim == 3 else ("I;16" if cover_array.dtype == np.uint16 else "L")
+    _, channels, depth = COVER_MODES[mode]
+    return channels, depth
+
+def header_column(cover_array: np.ndarray) -> np.ndarray:
+    '''view of the pixels of column 0 holding the magic, the version and the table pointer, one row per pixel
+    with the values used in it (3 for RGB and RGBA covers, 1 for single channel ones), see HEADER_VALUES'''
+    if cover_array.ndim == 2:
+        return cover_array[:HEADER_VALUES, 0, None]
+    return cover_array[:HEADER_VALUES // 3, 0, :3]
+
+def read_pointer(values: np.ndarray) -> tuple[int, int, int]:
+    '''offset (in crumbs), length (in bytes) and crc32 of the table, from the values of column 0 (see header_column)'''
+    bits = (((values[3:HEADER_VALUES] & 0b111)[:, None] >> np.array([2, 1, 0], dtype=np.uint8)) & 1).reshape(-1)[:14 * 8]
+    pointer = np.packbits(bits.astype(np.uint8)).tobytes()
+    return int.from_bytes(pointer[:6], 'big'), int.from_bytes(pointer[6:10], 'big'), int.from_bytes(pointer[10:14], 'big')
+
+def table_rows(shape: tuple, table_offset: int, crumbs: int, channels: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    '''positions of the scanline copy of a table of `crumbs` crumbs hidden at `table_offset`, as indexes of the
+    values of columns 1 and after taken row by row (the first `crumbs` of them, see write_headers).
+    Returns the positions of the copy, those of them outside the table and the positions of the table outside the copy'''
+    height, width = shape[0], shape[1] - 1
+    per_column = height * channels
+    layout = np.arange(table_offset, table_offset + crumbs, dtype=np.int64) # Column after column, top to bottom
+    column, rest = np.divmod(layout, per_column)
+    row, channel = np.divmod(rest, channels)
+    table = (row * width + column) * channels + channel
+    copy = np.arange(crumbs, dtype=np.int64)
+    return copy, np.setdiff1d(copy, table), np.setdiff1d(table, copy)
+
+def move_crumbs(layout_values: np.ndarray, targets: np.ndarray, sources: np.ndarray, depth: int) -> None:
+    '''copies the crumbs of the values at `sources` to the values at `targets` (positions row by row, see table_rows)'''
+    crumb_mask = (1 << depth) - 1
+    clear_mask = layout_values.dtype.type(np.iinfo(layout_values.dtype).max ^ crumb_mask)
+    targets, sources = np.unravel_index(targets, layout_values.shape), np.unravel_index(sources, layout_values.shape)
+    layout_values[targets] = (layout_values[targets] & clear_mask) | (layout_values[sources] & crumb_mask)
 
 class VanGons:
     """class for handling multiple files, 
@@ -24,15 +92,17 @@ class VanGons:
         self.SINGLE_RGB_BIT_SIZE = 8
         self.SINGLE_RGB_PIXEL_BIT_SIZE = self.SINGLE_RGB_BIT_SIZE * 3
 
-    def add_headers(self, image: str, extensions: list[str], data_lengths: list[int]) -> None:
+    def add_headers(self, image: str, names: list[str], data_lengths: list[int], offsets: list[int]) -> None:
         """
-        Adds header to the cover image before hiding data.\n
+        Adds header to the cover image after hiding data.\n
         For VanGons extention
 
         Parameters:
         - image (str): Path to the cover image.
-        - extension (list): List of file extension to be hidden.
-        - data_length (list): List with lengths of the data to be hidden.
+        - names (list): Names of the hidden files.
+        - data_lengths (list): Lengths of the hidden files, in bits.
+        - offsets (list): Position of each file in the layout, in crumbs from the top of column 1.
+          Several entries can point to the same data (duplicated files are hidden once).
 
         Returns:
         None
@@ -45,20 +115,6 @@ class VanGons:
         except FileNotFoundError:
             raise FileNotFoundError(f"Image file not found: {image}")
 
-        # Check if the extension is a non-empty string
-        if not extensions:
-            raise ValueError("Invalid extension. It should be a non-empty list of strings.")
-
-        # Check if data_length is a positive integer
-
-        if not data_lengths:
-            raise ValueError("Invalid data length. It should be a list of positive integer.")
-        
-        # check if len of extensions length and data_lengths are the same
-        if len(extensions) != len(data_lengths):
-            raise IndexError(f"Number of elements in extensions '{len(extensions)}'"
-                             f" and data_lengths '{len(data_lengths)}' should match.")
-
         # Read the cover image
         try:
             with Image.open(image, "r") as cover:
@@ -66,94 +122,93 @@ class VanGons:
         except Exception as e:
             raise Exception(f"Error opening the cover image: {e}")
 
-        # Getting the height of the cover image (we will write the header vertically)
-        height = cover_array.shape[0]
-
-        
-        total_bits_needed = 0 #intial value
-        max_bits_available = (height - 1) * self.SINGLE_RGB_PIXEL_BIT_SIZE # Height - 1 pixels, 3 channels (RGB), 8 bits per channel
-        row_count = 0 #intial value
-        for extension, data_length in zip(extensions, data_lengths):
-            # Convert extension and data_length to binary and get their lengths
-            extension_binary = text_to_binary(extension)
-            extension_length = len(extension_binary)
-
-            data_length_binary = text_to_binary(str(data_length))
-            data_length_length = len(data_length_binary)
-
-            total_bits_needed += (extension_length + data_length_length) # increment total_bits_needed
-
-            # Writing the extension length and data length length to the number of required horizontal pixels
-            cover_array[row_count, 0] = [extension_length, data_length_length, 0]
-            row_count += 1 # to move to the next row; first column
-        else: # runs after the for loop; should be modified to take ext length and data length length into account
-            # Check if the data to be hidden is small enough to fit in the image
-            cover_array[0, 0][2] = len(data_lengths) # store number of files hidden in the B of the first pixel
-            if total_bits_needed > max_bits_available:
-                raise ValueError("Data to be hidden is too large for the given image.")
-        
-        # we initialize the starting index to hide the bits of the extension_binary and data_length_binary
-        # outside the loop at to increment it in the loop to index each file binary bits properly
-        starting_index_r = row_count
-        starting_index_g = row_count
-        pixel_bits_used = 3 # Number of bits we will use in each pixel
+        self.write_headers(cover_array, names, data_lengths, offsets)
 
-        for extension, data_length in zip(extensions, data_lengths):
-            # Convert extension and data_length to binary
-            extension_binary = text_to_binary(extension)
-            extension_length = len(extension_binary)
+        # save modified image, replacing it in a single step
+        try:
+            save_png(cover_array, image)
+        except Exception as e:
+            raise Exception(f"Error saving the modified cover image: {e}")
 
-            data_length_binary = text_to_binary(str(data_length))
-            data_length_length = len(data_length_binary)
+    def write_headers(self, cover_array: np.ndarray, names: list[str], data_lengths: list[int], offsets: list[int],
+                      archive_size: int=0, scanline: bool=False) -> None:
+        """
+        Writes the directory table of the hidden files, modifying the cover array in place.
+
+        The table is binary and column oriented: the number of files, then the lengths of the names, the lengths
+        of the files (in bytes) and their offsets as varints, then the names (utf-8). It's hidden in the data area
+        right after the last file, and column 0 only holds the magic "VG" and the version in pixel (0,0)
+        and where the table is, its length and its crc32 in the last 3 bits of the pixels below.
+        There's no limit on the number of files other than the capacity of the image.
+        Solid archives (`archive_size` given) have their own version, the table starts with the size of the
+        compressed archive and the offsets are in bytes in the decompressed archive.
+        With `scanline`, a copy of the table is also hidden in the first values of columns 1 and after taken
+        row by row, so listing the files only decodes the top rows of the image (see get_headers). The data
+        hidden in those values is moved to the values of the table the copy doesn't cover (both hold the
+        same number of crumbs), `restore_rows` puts it back before the files are revealed.
 
-            # Writing the extension to the next pixels, we will use the 3 red channel bits of each pixel
-            pixels_needed_r = np.ceil(extension_length / pixel_bits_used).astype(int) # Number of pixels needed to store the extension
+        Parameters:
+        - cover_array (np.ndarray): Array of the cover image, with the files already hidden.
+        - names (list): Names of the hidden files.
+        - data_lengths (list): Lengths of the hidden files, in bits.
+        - offsets (list): Position of each file in the layout, in crumbs from the top of column 1
+          (in bytes from the start of the decompressed archive for solid archives).
+        - archive_size (int): Size of the compressed archive hidden at the top of column 1, 0 when the files are hidden one by one.
+        - scanline (bool): Also hide a copy of the table in the top rows.
 
-            for i in range(pixels_needed_r):
-                # Get the RGB values of the current pixel
-                # We start at what row_count currently is because that is where the pixel we haven't used starts
-                r, g, b = cover_array[i + starting_index_r, 0]
-                
-                # Get the bits of the extension that will be stored in the current pixel
-                extension_bits = extension_binary[i * pixel_bits_used : (i + 1) * pixel_bits_used].ljust(pixel_bits_used, '0')
-                # Convert the bits to an integer
-                extension_int = int(extension_bits, 2)
-                
-                # Modify the last 3 bits of the red channel
-                r = (r & 0b11111000) | extension_int # 0b11111000 is used to clear the last 3 bits of the red channel
-                
-                # Replace the RGB values of the current pixel with the modified RGB values
-                cover_array[i + starting_index_r, 0] = [r, g, b]
-            
-            # Writing the data length to the next pixels, we will use the 3 green channel bits of each pixel
-            # We start at what row_count currently is because that is where the pixel we haven't used starts
-            pixels_needed_g = np.ceil(data_length_length / pixel_bits_used).astype(int)
+        Returns:
+        None
+        """
+        if len(names) != len(data_lengths) or len(names) != len(offsets):
+            raise IndexError(f"Number of elements in names '{len(names)}', data_lengths '{len(data_lengths)}'"
+                             f" and offsets '{len(offsets)}' should match.")
+        if any(data_length % 8 for data_length in data_lengths):
+            raise ValueError("Invalid data length. Only whole bytes can be hidden.")
+        column = header_column(cover_array)
+        if column.size < HEADER_VALUES:
+            raise ValueError("Cover image is too small to hold the header.")
+        channels, depth = array_layout(cover_array)
+        crumbs_per_byte = 8 // depth
+
+        # Building the table, every column of numbers is encoded at once
+        encoded_names = [name.encode() for name in names]
+        table = b"".join([
+            encode_varints([archive_size]).tobytes() if archive_size else b"",
+            encode_varints([len(names)]).tobytes(),
+            encode_varints([len(name) for name in encoded_names]).tobytes(),
+            encode_varints([data_length // 8 for data_length in data_lengths]).tobytes(),
+            encode_varints(offsets).tobytes(),
+            *encoded_names
+        ])
+
+        # The table goes right after the last file (or the archive), on a byte boundary
+        if archive_size:
+            end = archive_size * crumbs_per_byte
+        else:
+            end = max((offset + data_length // depth for offset, data_length in zip(offsets, data_lengths)), default=0)
+        table_offset = -(-end // crumbs_per_byte) * crumbs_per_byte
+        if (table_offset + len(table) * crumbs_per_byte) * depth > layout_capacity(cover_array.shape, 1, channels, depth):
+            raise ValueError("Data to be hidden is too large for the given image.")
+        embed(cover_array, table, 1, table_offset, channels, depth)
+
+        if scanline:
+            copy, displaced, free = table_rows(cover_array.shape, table_offset, len(table) * crumbs_per_byte, channels)
+            layout_values = as_channels(cover_array)[:, 1:, :channels]
+            move_crumbs(layout_values, free, displaced, depth)
+            rows = np.unravel_index(copy, layout_values.shape)
+            clear_mask = layout_values.dtype.type(np.iinfo(layout_values.dtype).max ^ ((1 << depth) - 1))
+            layout_values[rows] = (layout_values[rows] & clear_mask) | bytes_to_crumbs(table, depth)
+
+        # Magic and version in the first 3 values of column 0 (pixel (0,0) of RGB covers), then the pointer to the table
+        # in the last 3 bits of the values below
+        values = column.reshape(-1) # Copy of the values, written back at once
+        values[:3] = [*TABLE_MAGIC, (SOLID_VERSION if archive_size else TABLE_VERSION) | (SCANLINE_TABLE if scanline else 0)]
+        pointer = table_offset.to_bytes(6, 'big') + len(table).to_bytes(4, 'big') + zlib.crc32(table).to_bytes(4, 'big')
+        bits = np.zeros((HEADER_VALUES - 3) * 3, dtype=np.uint8)
+        bits[:len(pointer) * 8] = np.unpackbits(np.frombuffer(pointer, dtype=np.uint8))
+        values[3:] = (values[3:] >> 3 << 3) | (bits.reshape(-1, 3) @ np.array([4, 2, 1], dtype=np.uint8))
+        column[...] = values.reshape(column.shape)
 
-            for i in range(pixels_needed_g):
-                # Get the RGB values of the current pixel
-                r, g, b = cover_array[i + starting_index_g, 0]
-                
-                # Get the bits of the data length that will be stored in the current pixel
-                data_length_bits = data_length_binary[i * pixel_bits_used : (i + 1) * pixel_bits_used].ljust(pixel_bits_used, '0')
-
-                # Convert the bits to an integer
-                data_length_int = int(data_length_bits, 2)
-                
-                # Modify the last 3 bits of the green channel
-                g = (g & 0b11111000) | data_length_int
-                
-                # Replace the RGB values of the current pixel with the modified RGB values
-                cover_array[i + starting_index_g, 0] = [r, g, b]
-            
-            starting_index_r += pixels_needed_r
-            starting_index_g += pixels_needed_g
-            
-        # save modified image        
-        try:
-            Image.fromarray(cover_array).save(image, format="PNG")
-        except Exception as e:
-            raise Exception(f"Error saving the modified cover image: {e}")
-        
     def get_headers(self, image: str) -> dict[str, list]:
         '''creates a dict of the haeaders of the cover image'''
         try:
@@ -163,20 +218,126 @@ class VanGons:
         except FileNotFoundError:
             raise FileNotFoundError(f"Image file not found: {image}")
 
+        # Only the rows holding the header are decoded when the table has a scanline copy, the whole image otherwise
         try:
-            with Image.open(image, "r") as cover:
-                cover_array = np.array(cover)
+            with RowReader(image) as reader:
+                cover_array = reader.read(HEADER_VALUES) # Rows of the header in every mode
+                values = header_column(cover_array).reshape(-1)
+                if tuple(values[:2]) == TABLE_MAGIC and values[2] & SCANLINE_TABLE and values.size == HEADER_VALUES:
+                    channels, depth = array_layout(cover_array)
+                    _, table_length, _ = read_pointer(values)
+                    rows = -(-table_length * (8 // depth) // max(1, (reader.width - 1) * channels))
+                    if rows > len(cover_array):
+                        cover_array = reader.read(rows)
+                else:
+                    cover_array = reader.read(reader.height)
+                shape = (reader.height, *cover_array.shape[1:])
         except Exception as e:
             raise Exception(f"Error opening the cover image: {e}")
-        else: # get no of files hidden in the image
-            hfiles = int(cover_array[0,0][2])
+
+        return self.read_headers(cover_array, shape)
+
+    def read_headers(self, cover_array: np.ndarray, shape: tuple=None) -> dict[str, list]:
+        '''reads the header of a cover array, see `get_headers`.
+        shape: Shape of the image when the array only holds its top rows (carriers with a scanline copy of the table)\n
+        Returns the "names", "extensions", "data_lengths" (in bits) and "offsets" (in crumbs) of the hidden files,
+        and the "archive_size" of solid archives (0 for the other carriers), their offsets are in bytes in the archive.
+        "scanline" tells if the table has a copy in the top rows, the data it displaced is put back by `restore_rows`
+        from the "table_offset" and "table_length"'''
+        shape = shape or cover_array.shape
+        column = header_column(cover_array)
+        values = column.reshape(-1)
+        if tuple(values[:2]) != TABLE_MAGIC:
+            if cover_array.ndim == 2:
+                raise ValueError("Invalid image format. Header information not found.") # Older versions only made RGB carriers
+            # Carrier made by an older version, converting its columns to offsets
+            header_info = self.read_legacy_headers(cover_array)
+            per_column = cover_array.shape[0] * 3
+            return {
+                "names": ["." + extension for extension in header_info["extensions"]], # Unnamed, only the extension is known
+                "extensions": header_info["extensions"],
+                "data_lengths": header_info["data_lengths"],
+                "offsets": [(column - 1) * per_column for column in header_info["columns"]],
+                "archive_size": 0,
+                "scanline": False
+            }
+
+        scanline = bool(values[2] & SCANLINE_TABLE)
+        version = int(values[2]) & ~SCANLINE_TABLE
+        if version not in (TABLE_VERSION, SOLID_VERSION):
+            raise ValueError(f"Unsupported header version {values[2]}.")
+        if values.size < HEADER_VALUES:
+            raise ValueError("Invalid image format. Header information not found.")
+        channels, depth = array_layout(cover_array)
+
+        # Reading the pointer to the table from column 0
+        table_offset, table_length, crc = read_pointer(values)
+        crumbs = table_length * (8 // depth)
+        if (table_offset + crumbs) * depth > layout_capacity(shape, 1, channels, depth):
+            raise ValueError("Invalid image format. Header information not found.")
+
+        if scanline:
+            # The copy of the table in the top rows, the table itself may have been moved by `restore_rows`
+            layout_values = as_channels(cover_array)[:, 1:, :channels]
+            if crumbs > layout_values.size:
+                raise ValueError("Invalid image format. Header information not found.")
+            rows = np.unravel_index(np.arange(crumbs, dtype=np.int64), layout_values.shape)
+            table = crumbs_to_bytes(layout_values[rows] & ((1 << depth) - 1), depth).tobytes()
+        elif cover_array.shape != tuple(shape):
+            raise ValueError("Invalid image format. The table is not in the top rows.")
+        else:
+            table = extract(cover_array, table_length, 1, table_offset, channels=channels, depth=depth).tobytes()
+        if zlib.crc32(table) != crc:
+            raise ValueError("Invalid image format. The header is corrupted.")
+
+        try:
+            archive_size, position = 0, 0
+            if version == SOLID_VERSION:
+                (archive_size,), position = decode_varints(table, 1)
+            (count,), position = decode_varints(table, 1, position)
+            count = int(count)
+            name_lengths, position = decode_varints(table, count, position)
+            sizes, position = decode_varints(table, count, position)
+            offsets, position = decode_varints(table, count, position)
+            boundaries = np.concatenate(([position], position + np.cumsum(name_lengths, dtype=np.int64)))
+            names = [table[first:last].decode() for first, last in zip(boundaries[:-1].tolist(), boundaries[1:].tolist())]
+        except Exception as e:
+            raise ValueError(f"Invalid image format. The header is corrupted: {e}")
+
+        return {
+            "names": names,
+            "extensions": [name.rpartition(".")[2] if "." in name else "" for name in names],
+            "data_lengths": [int(size) * 8 for size in sizes],
+            "offsets": offsets.astype(np.int64).tolist(),
+            "archive_size": int(archive_size),
+            "scanline": scanline,
+            "table_offset": table_offset,
+            "table_length": table_length
+        }
+
+    def restore_rows(self, cover_array: np.ndarray, header_info: dict) -> None:
+        '''puts back the data displaced by the scanline copy of the table (see write_headers), modifying the
+        array of the whole image in place, the data of the files is then where the offsets of the header say.
+        Does nothing for carriers without a scanline copy'''
+        if not header_info.get("scanline"):
+            return
+        channels, depth = array_layout(cover_array)
+        _, displaced, free = table_rows(cover_array.shape, header_info["table_offset"],
+                                        header_info["table_length"] * (8 // depth), channels)
+        move_crumbs(as_channels(cover_array)[:, 1:, :channels], displaced, free, depth)
+
+    def read_legacy_headers(self, cover_array: np.ndarray) -> dict[str, list]:
+        '''reads the text header of carriers made by older versions: the number of files in the B of pixel (0,0),
+        one row of column 0 per file for the bit lengths of the extension and of the length text, then the texts'''
+        # get no of files hidden in the image
+        hfiles = int(cover_array[0,0][2])
 
         # list for storing list of extension_length and data_length_length for each file hidden
         ext_data_lengths = list() 
 
         for nfile in range(hfiles):
             try:
-                *ext_data_lengths_list, _ = cover_array[nfile, 0]
+                *ext_data_lengths_list, _ = cover_array[nfile, 0, :3]
             except IndexError:
                 raise ValueError("Invalid image format. Header information not found.")
             else:
@@ -199,7 +360,7 @@ class VanGons:
                 try:# We start at start_index_r = hfiles because it is the same with no of used pixels
                     # i.e, the row we start at should be after the rows we used for storing extension_length/data_length_length
                     # for the no of hidden files(hfiles)
-                    r, _, _ = cover_array[i + start_index_r, 0]  
+                    r, _, _ = cover_array[i + start_index_r, 0, :3]  
                 except IndexError:
                     raise ValueError("Invalid image format. Insufficient pixels for extension.")
                 else:
@@ -227,7 +388,7 @@ class VanGons:
             for i in range(start_index_g, start_index_g + pixels_needed_g):
                 # Get the RGB values of the current pixel
                 try:
-                    _, g, _ = cover_array[i, 0]
+                    _, g, _ = cover_array[i, 0, :3]
                 except IndexError:
                     raise ValueError("Invalid image format. Insufficient pixels for data length.")
                 else:
@@ -251,16 +412,33 @@ class VanGons:
             start_index_r += pixels_needed_r
             start_index_g += pixels_needed_g
 
+        # The columns aren't stored, every file starts one column after the one following the previous file
+        columns = list()
+        next_column = 1
+        for data_length in data_lengths:
+            columns.append(next_column)
+            next_column += columns_needed(cover_array.shape, data_length // 8) + 1
+
         return {
             "extensions": extensions,
-            "data_lengths": data_lengths
+            "data_lengths": data_lengths,
+            "columns": columns
         }
         
-    def encode_files(self, files: list[str], image: str, output_directory: str='') -> None:
+    def encode_files(self, files: list[str], image: str, output_directory: str='', dedup: bool=True, solid: bool=False, output_path: str='', workers: int=None,
+                     scanline: bool=False) -> dict:
         '''for encoding multiple files to an image.\n
-        output_directory: Dir to save image'''
+        output_directory: Dir to save image, as Cover.png (Cover-1.png... when another job already took the name)
+        output_path: Path of the image, replaced if it exists (default: a new file in output_directory)
+        dedup: hide files with identical content only once, all their header entries point to the same data
+        solid: stream all the files into a single archive compressed as a whole (similar files compress much better
+        together than one by one) and hide the archive once, the header keeps the position of every file in it
+        workers: Number of threads hiding the files concurrently (default: one per CPU), a solid archive is hidden by one
+        scanline: also hide a copy of the header table in the top rows, so `list_files` doesn't decode the whole image\n
+        Returns a dict with the number of files, of unique files, the capacity/time saved by dedup
+        and the size of the compressed archive in solid mode, and the "path" of the image'''
         print('please wait, cheking files...', end='')
-        time.sleep(1)
+        pause()
         try:
             # Check if the cover image file exists
             with open(image, 'rb'):
@@ -268,115 +446,346 @@ class VanGons:
         except FileNotFoundError:
             raise FileNotFoundError(f"Cover image file not found: {image}")
         
-        # Read the cover image and work with it
+        # Read the cover image and work with it, modes we can't hide data in (palette, CMYK...) are converted to RGB
         try:
             with Image.open(image, 'r') as cover:
-                cover_array = np.array(cover)
+                cover_array = np.array(cover if cover.mode in COVER_MODES else cover.convert("RGB"))
         except Exception as e:
             raise Exception(f"Error opening the cover image: {e}.\nMake sure it is a valid image file.")
-
-        # Getting the width and height of the cover image
-        width = cover_array.shape[1]
-        height = cover_array.shape[0]
-        size_needed = width * height * (self.SINGLE_RGB_PIXEL_BIT_SIZE * 2)
+        channels, depth = array_layout(cover_array)
 
         data_lengths = [] # initialize list to contain data_length
-        extensions = [] # initialize list for the extension
+        names = [] # initialize list for the name of each file
+        blobs = [] # data of each unique file, hidden once
+        blob_index = {} # sha256 digest -> index of the blob in blobs
+        entry_blobs = [] # index of the blob of each file
 
-        # Get the binary data of a file to hide to check if size fits
+        # Reading every file once, files with the same content are only kept once
         for file in files:
             try:
-                # Check if the file to hide exists
-                with open(file, 'rb') as f:
-                    mdata = "".join([f"{byte:08b}" for byte in f.read()])
+                # Check if the file to hide exists, it's memory-mapped instead of being read in memory
+                data = load_payload(file)
             except FileNotFoundError:
                 raise FileNotFoundError(f"File to hide not found: {file}")
-            else:
-                data_lengths.append(len(mdata))
-                # Get the extension of the file to hide
-                extension = os.path.splitext(file)[1][1:]
-                extensions.append(extension) # add extension to list
 
-        # Checking if the cover image is large enough to hide the data
-        if size_needed < sum(data_lengths):
-            raise ValueError("Cover image is too small to hide the data.")
-    
-        file_index = 0 # to track/verify which file that is being written
-        r_track = -1 # tracks the row each bit is hidden for each file
-        c_track = 0 # tracks the column each bit is hidden for each file
+            digest = hashlib.sha256(data).digest() if dedup else len(blobs) # Without dedup every file gets its own blob
+            if digest not in blob_index:
+                blob_index[digest] = len(blobs)
+                blobs.append(data)
+            entry_blobs.append(blob_index[digest])
 
-        for ind, file in enumerate(files):
-        
-            # Get the binary data of a file to hide
-            with open(file, "rb") as f:
-                data = "".join([f"{byte:08b}" for byte in f.read()])
-
-            bitmask = 0b11111100  # Used to clear the last two bits of a number
-            data_index = 0
-    
-            clear_previous_print_value()
-            percents = range(100+1); ptrack = set()#to track printed percentages
-
-            # Looping through each pixel in the cover image
-            if ind == file_index: # makes sure it loops per file
-
-                # Looping through each pixel in the cover image
-                for i in range(1, width):  # Loop through each column
-                    c_track += 1
-                    r_track = -1 # resets row for every column loop
-
-                    # Checking if there's still data to hide
-                    if data_index >= len(data):
-                        break  # Exit the outer loop if all data is processed
-
-                    for j in range(height):  # Loop through each row
-                        r_track += 1
-
-                        # Checking if there's still data to hide
-                        if data_index >= len(data):
-                            break  # Exit the inner loop if all data is processed
-
-                        # Modify the last two bits of each channel
-                        for k in range(3):
-                            if data_index < len(data):
-                                cover_array[r_track, c_track][k] = (cover_array[r_track, c_track][k] & bitmask) | int(data[data_index:data_index + 2], 2)
-                                data_index += 2  # Increment the data index by 2 because we're processing 2 bits at a time
-                                # print percentages
-                                percentage = int(((data_index - len(data)) / len(data)) * 100 + 100)
-                                if percentage in percents and percentage not in ptrack:
-                                    ptrack.add(percentage)
-                                    print(f' Hiding file {ind+1}...{percentage}%', end='\r')
-                            else:
-                                break
-
-                # Save the modified cover image as "Cover_{extension}.png"
-                output_filename = f"Cover.png"
-                if output_directory:
-                    output_filename = os.path.join(output_directory, output_filename)
-                
-                try:
-                    Image.fromarray(cover_array).save(output_filename, format="PNG")
-                except Exception as e:
-                    raise Exception(f"Error saving the modified cover image: {e}")
-                      
-            # increment to next file index checker
-            file_index += 1
+            data_lengths.append(len(data) * 8)
+            names.append(os.path.basename(file)) # add name to list
+
+        clear_previous_print_value()
+        start = time.perf_counter()
+        archive_size = 0
+        if solid:
+            blob_offsets, archive_size = self.embed_archive(cover_array, blobs)
         else:
-            clear_previous_print_value()
-            print(f'Process Complete!!!\n'
-                  f'Image with Hidden file(s) "{os.path.basename(output_filename)}" '
-                  f'saved succefully at "{os.path.dirname(output_filename)}"')
+            # Placing the unique blobs one right after the other, the header table gives the offset of each one
+            blob_offsets = []
+            next_offset = 0
+            for data in blobs:
+                blob_offsets.append(next_offset)
+                next_offset += len(data) * (8 // depth)
+
+            # Checking if the cover image is large enough to hide the data
+            if next_offset * depth > layout_capacity(cover_array.shape, 1, channels, depth):
+                raise ValueError("Cover image is too small to hide the data.")
+
+            self.embed_blobs(cover_array, blobs, blob_offsets, workers)
+        embed_time = time.perf_counter() - start
+        offsets = [blob_offsets[blob] for blob in entry_blobs]
+
+        # Save the modified cover image as "Cover.png"
+        output_filename = f"Cover.png"
+        if output_directory:
+            output_filename = os.path.join(output_directory, output_filename)
+
+        # Add header to the modified cover image, then saving it once
+        try:
+            self.write_headers(cover_array, names, data_lengths, offsets, archive_size, scanline)
+        except Exception as e:
+            raise Exception(f"Error adding header to the modified cover image: {e}")
 
-        # Add header to the modified cover image(outside for loop)
         try:
-            self.add_headers(output_filename, extensions, data_lengths)
+            output_filename = save_png(cover_array, output_path or output_filename, unique=not output_path)
+        except Exception as e:
+            raise Exception(f"Error saving the modified cover image: {e}")
+
+        # Reporting what dedup saved, the time is estimated from the speed of the embedding we actually did
+        total_bits = sum(data_lengths)
+        hidden_bits = sum(len(data) * 8 for data in blobs)
+        saved_bits = total_bits - hidden_bits
+        saved_time = embed_time * saved_bits / hidden_bits if hidden_bits else 0.0
+        stats = {
+            "files": len(files),
+            "unique_files": len(blobs),
+            "saved_bits": saved_bits,
+            "saved_columns": columns_needed(cover_array.shape, saved_bits // 8, channels, depth),
+            "saved_seconds": saved_time,
+            "archive_size": archive_size,
+            "path": output_filename
+        }
+
+        clear_previous_print_value()
+        print(f'Process Complete!!!\n'
+              f'Image with Hidden file(s) "{os.path.basename(output_filename)}" '
+              f'saved succefully at "{os.path.dirname(output_filename)}"')
+        if saved_bits:
+            print(f'{len(files) - len(blobs)} duplicated file(s) hidden only once, '
+                  f'saved {saved_bits // 8} bytes ({saved_bits / total_bits:.1%}) of capacity '
+                  f'and about {saved_time:.3f}s of embedding')
+        if solid and hidden_bits:
+            print(f'Solid archive of {hidden_bits // 8} bytes compressed to {archive_size} bytes '
+                  f'({archive_size * 8 / hidden_bits:.1%})')
+        return stats
+
+    def thread_count(self, workers: int, jobs: int) -> int:
+        '''number of threads used for `jobs` jobs, `workers` defaults to one per CPU'''
+        return max(1, min(workers or os.cpu_count() or 1, jobs))
+
+    def owned_range(self, shape: tuple, offset: int, size: int, channels: int = 3, depth: int = 2) -> tuple[int, int]:
+        '''[start, stop) range of the bytes of a file hidden at `offset` lying in whole columns no other file touches.
+        The range is made of blocks of 8 / depth columns, which always hold a whole number of bytes (see parallel.split_columns),
+        it's empty when the file doesn't cover a whole block'''
+        crumbs_per_byte = 8 // depth
+        step = crumbs_per_column(shape, channels) * crumbs_per_byte
+        first = -(-offset // step) * step
+        last = (offset + size * crumbs_per_byte) // step * step
+        if first >= last:
+            return 0, 0
+        return (first - offset) // crumbs_per_byte, (last - offset) // crumbs_per_byte
+
+    def embed_blobs(self, cover_array: np.ndarray, blobs: list, offsets: list[int], workers: int=None) -> None:
+        '''hides every blob at its offset with a pool of threads, modifying the cover array in place.\n
+        The kernels write back whole columns, so two files sharing a column can't be written at the same time:
+        the threads only write the columns owned by their file (see `owned_range`), then the few columns at the
+        boundaries between files are written one file at a time. The result is the same as hiding the files one by one'''
+        channels, depth = array_layout(cover_array)
+        crumbs_per_byte = 8 // depth
+        parts = []
+        for data, offset in zip(blobs, offsets):
+            start, stop = self.owned_range(cover_array.shape, offset, len(data), channels, depth)
+            parts.append((data, offset, start, stop))
+
+        def hide_owned(part: tuple) -> None:
+            data, offset, start, stop = part
+            if stop > start:
+                embed(cover_array, data[start:stop], 1, offset + start * crumbs_per_byte, channels, depth)
+
+        with ThreadPoolExecutor(max_workers=self.thread_count(workers, len(parts))) as pool:
+            for ind, _ in enumerate(pool.map(hide_owned, parts)):
+                print(f' Hiding file {ind+1}/{len(parts)}...', end='\r')
+
+        # The boundaries, before and after the owned columns (the whole file when it owns none)
+        for data, offset, start, stop in parts:
+            if stop <= start:
+                start = stop = len(data)
+            if start:
+                embed(cover_array, data[:start], 1, offset, channels, depth)
+            if stop < len(data):
+                embed(cover_array, data[stop:], 1, offset + stop * crumbs_per_byte, channels, depth)
+
+    def embed_archive(self, cover_array: np.ndarray, blobs: list) -> tuple[list[int], int]:
+        """
+        Hides the blobs as a single solid archive at the top of column 1, modifying the cover array in place.
+
+        The blobs are streamed one after the other through one zlib stream, the compressed data is hidden
+        as soon as it comes out of the compressor, so neither the archive nor the compressed data is ever held whole.
+
+        Parameters:
+        - cover_array (np.ndarray): Array of the cover image.
+        - blobs (list): Data of the files, bytes-like objects or uint8 arrays (memory-mapped files).
+
+        Returns:
+        tuple: The offset of every blob in the decompressed archive (in bytes) and the size of the compressed archive.
+        """
+        channels, depth = array_layout(cover_array)
+        capacity = layout_capacity(cover_array.shape, 1, channels, depth) // depth
+        compressor = zlib.compressobj(9)
+        blob_offsets = []
+        position = 0 # Bytes of the decompressed archive written so far
+        archive_size = 0 # Bytes of the compressed archive hidden so far
+
+        def hide(compressed: bytes) -> None:
+            nonlocal archive_size
+            if not compressed:
+                return
+            offset = archive_size * (8 // depth)
+            if offset + len(compressed) * (8 // depth) > capacity:
+                raise ValueError("Cover image is too small to hide the data.")
+            embed(cover_array, compressed, 1, offset, channels, depth)
+            archive_size += len(compressed)
+
+        for ind, data in enumerate(blobs):
+            print(f' Compressing file {ind+1}/{len(blobs)}...', end='\r')
+            blob_offsets.append(position)
+            for first in range(0, len(data), CHUNK_BYTES):
+                hide(compressor.compress(data[first:first + CHUNK_BYTES]))
+            position += len(data)
+        hide(compressor.flush())
+        return blob_offsets, archive_size
+
+    def used_ranges(self, data_lengths: list[int], offsets: list[int], depth: int = 2) -> list[tuple[int, int]]:
+        '''sorted [first, last) crumb ranges holding data, entries sharing the same data are counted once'''
+        blobs = set(zip(offsets, data_lengths))
+        return sorted((offset, offset + data_length // depth) for offset, data_length in blobs)
+
+    def allocate(self, shape: tuple, used: list[tuple[int, int]], size: int, channels: int = 3, depth: int = 2) -> int:
+        '''offset of the first free space able to hold `size` bytes (first fit), `used` is updated with the new range'''
+        crumbs_per_byte = 8 // depth
+        needed = size * crumbs_per_byte
+        capacity = layout_capacity(shape, 1, channels, depth) // depth
+        free_start = 0
+        for first, last in used + [(capacity, capacity)]:
+            if first - free_start >= needed:
+                break
+            free_start = max(free_start, -(-last // crumbs_per_byte) * crumbs_per_byte) # Files start on a byte boundary
+        else:
+            raise ValueError("Cover image is too small to hide the data.")
+        used.append((free_start, free_start + needed))
+        used.sort()
+        return free_start
+
+    def append_files(self, files: list[str], image: str, output_path: str='', dedup: bool=True, workers: int=None) -> dict:
+        '''for adding files to an image already containing hidden files, without re-hiding the files it contains.\n
+        The new files are hidden in the free space (space left by deleted files first, then after the last file),
+        then the header is rewritten and the image saved once.
+        output_path: Path of the modified image (default: modify `image` in place)
+        dedup: new files identical to a file already hidden (or to another new file) point to the same data
+        workers: Number of threads hiding the files concurrently (default: one per CPU)\n
+        Returns a dict with the number of files appended and of files actually hidden'''
+        try:
+            # Check if the image file exists
+            with open(image, 'rb'):
+                pass
+        except FileNotFoundError:
+            raise FileNotFoundError(f"Image file not found: {image}")
+
+        try:
+            with Image.open(image, 'r') as steg_image:
+                cover_array = np.array(steg_image)
+            header_info = self.read_headers(cover_array)
+            self.restore_rows(cover_array, header_info)
+        except Exception as e:
+            raise Exception(f"Error decoding header information: {e}")
+
+        if header_info["archive_size"]:
+            raise ValueError("Files can't be appended to a solid archive, hide all the files again instead.")
+
+        names = header_info["names"]
+        data_lengths = header_info["data_lengths"]
+        offsets = header_info["offsets"]
+        channels, depth = array_layout(cover_array)
+        used = self.used_ranges(data_lengths, offsets, depth)
+
+        # Existing data is only revealed (and hashed) when a new file has the same length, to find duplicates
+        known = {} # sha256 digest -> offset of the data
+        existing = set(zip(offsets, data_lengths))
+
+        new_blobs = [] # data of the files actually hidden
+        new_offsets = []
+        for file in files:
+            try:
+                data = load_payload(file)
+            except FileNotFoundError:
+                raise FileNotFoundError(f"File to hide not found: {file}")
+
+            offset = None
+            if dedup:
+                for blob_offset, blob_length in [blob for blob in existing if blob[1] == len(data) * 8]:
+                    known[hashlib.sha256(extract(cover_array, blob_length // 8, 1, blob_offset, channels=channels, depth=depth)).digest()] = blob_offset
+                    existing.discard((blob_offset, blob_length))
+                offset = known.get(hashlib.sha256(data).digest())
+
+            if offset is None:
+                offset = self.allocate(cover_array.shape, used, len(data), channels, depth)
+                new_blobs.append(data)
+                new_offsets.append(offset)
+                if dedup:
+                    known[hashlib.sha256(data).digest()] = offset
+
+            names.append(os.path.basename(file))
+            data_lengths.append(len(data) * 8)
+            offsets.append(offset)
+
+        # Every new file has its own free space, they are all hidden at once
+        self.embed_blobs(cover_array, new_blobs, new_offsets, workers)
+
+        try:
+            self.write_headers(cover_array, names, data_lengths, offsets, scanline=header_info["scanline"])
         except Exception as e:
             raise Exception(f"Error adding header to the modified cover image: {e}")
 
-    def decode_files(self, image: str, output_directory: str='') -> None:
+        try:
+            save_png(cover_array, output_path or image)
+        except Exception as e:
+            raise Exception(f"Error saving the modified cover image: {e}")
+
+        return {"appended": len(files), "hidden": len(new_blobs)}
+
+    def delete_files(self, image: str, entries: list[int], output_path: str='') -> None:
+        '''for removing files from an image containing hidden files.\n
+        entries: Numbers of the files to remove, in the order of the header starting from 1 (as numbered by `decode_files`)
+        output_path: Path of the modified image (default: modify `image` in place)\n
+        Only the header is rewritten, the space of the removed files is free again for `append_files`
+        (solid archives keep their data, the removed files are only dropped from the header)'''
+        try:
+            # Check if the image file exists
+            with open(image, 'rb'):
+                pass
+        except FileNotFoundError:
+            raise FileNotFoundError(f"Image file not found: {image}")
+
+        try:
+            with Image.open(image, 'r') as steg_image:
+                cover_array = np.array(steg_image)
+            header_info = self.read_headers(cover_array)
+            self.restore_rows(cover_array, header_info)
+        except Exception as e:
+            raise Exception(f"Error decoding header information: {e}")
+
+        count = len(header_info["names"])
+        invalid = [entry for entry in entries if not 1 <= entry <= count]
+        if invalid:
+            raise IndexError(f"Invalid file number(s) {invalid}, the image contains {count} file(s).")
+
+        kept = [index for index in range(count) if index + 1 not in entries]
+        try:
+            self.write_headers(cover_array,
+                               [header_info["names"][index] for index in kept],
+                               [header_info["data_lengths"][index] for index in kept],
+                               [header_info["offsets"][index] for index in kept],
+                               header_info["archive_size"], header_info["scanline"])
+        except Exception as e:
+            raise Exception(f"Error adding header to the modified cover image: {e}")
+
+        try:
+            save_png(cover_array, output_path or image)
+        except Exception as e:
+            raise Exception(f"Error saving the modified cover image: {e}")
+
+    def output_name(self, name: str, number: int, taken: set) -> str:
+        '''name of the revealed file: the hidden name when it's usable and not taken yet, "Output-{number}.{extension}" otherwise'''
+        stem, dot, extension = name.rpartition(".")
+        extension = (extension if dot else "").replace("\x01", "_")
+        safe = os.path.basename(name) == name and name not in ("", ".", "..") and (stem or not dot)
+        if not safe or name in taken:
+            name = f"Output-{number}.{extension}"
+        taken.add(name)
+        return name
+
+    def decode_files(self, image: str, output_directory: str='', workers: int=None) -> list[str]:
         '''for decoding multiple files from a cover image.\n
         image: Cover image
-        output_directory: Dir to save image'''
+        output_directory: Dir to save image
+        workers: Number of threads revealing the files concurrently, each one to its own output file (default: one per CPU),
+        a solid archive is decompressed by one\n
+        files sharing the same hidden data are revealed once, the others are hard-linked (or copied) to it.
+        Every file is written under a temporary name and renamed once complete, existing files are never replaced
+        (name-1.ext... is used instead). Returns the paths of the revealed files, in the order of the header'''
         try:
             # Check if the image file exists
             with open(image, 'rb'):
@@ -385,81 +794,138 @@ class VanGons:
             raise FileNotFoundError(f"Image file not found: {image}")
         else:
             print('Image with hidden file(s) is being processed...')
-            time.sleep(1)
+            pause()
 
         try:
             # Get header information
             header_info = self.get_headers(image)
-            extensions = [ext.replace("\x01", "_") for ext in header_info["extensions"]]
+            names = header_info["names"]
             data_lengths = header_info["data_lengths"]
+            offsets = header_info["offsets"]
+            archive_size = header_info["archive_size"]
         except Exception as e:
             raise Exception(f"Error decoding header information: {e}")
 
         try:
             with Image.open(image, 'r') as steg_image:
                 steg_array = np.array(steg_image)
+            self.restore_rows(steg_array, header_info)
         except Exception as e:
             raise Exception(f"Error opening the stego image: {e}")
+        channels, depth = array_layout(steg_array)
 
-        width = steg_array.shape[1]
-        height = steg_array.shape[0]
+        taken = set() # names already given to a revealed file
 
-        unmask_bit = 0b00000011 # used to get the last two bits of a number
-        
-        r_track = -1 # tracks the row each bit is hidden for each file
-        c_track = 0 # tracks the column each bit is hidden for each file
-
-        for hfile in range(len(extensions)):
-            data_index = 0
-            binary_string = ''
-
-            clear_previous_print_value()
-            percents = range(100+1); ptrack = set()#to track printed percentages
-
-            for i in range(1, width):  # Loop through each column, skips first(will contain header)
-
-                c_track += 1
-                r_track = -1 # resets row each coloumn
-
-                # Checking if there's still data to hide
-                if data_index >= data_lengths[hfile]:
-                    break  # Exit the outer loop if all data is processed
-
-                for j in range(height):  # Loop through each row
-
-                    r_track += 1
-
-                    # Checking if there's still data to hide
-                    if data_index >= data_lengths[hfile]:
-                        break  # Exit the outer loop if all data is processed
-                    
-                    for k in range(3):
-                        if data_index < data_lengths[hfile]:
-                            binary = f"{(steg_array[r_track, c_track][k] & unmask_bit):02b}"
-                            binary_string += binary
-                            data_index += 2
-
-                            # print percentages
-                            percentage = int(((data_index - data_lengths[hfile]) / data_lengths[hfile]) * 100 + 100)
-                            if percentage in percents and percentage not in ptrack:
-                                ptrack.add(percentage)
-                                print(f' Decoding file {hfile+1}...{percentage}%', end='\r')
-                        else:
-                            break
-            binary_string = binary_string[:data_lengths[hfile]]
-            
-            # Saving the file
-            output_filename = f"Output-{hfile+1}.{extensions[hfile]}"
-            
-            if output_directory:
-                output_filename = os.path.join(output_directory, output_filename)
-            
-            try:
-                # Make a file out of the binary string then adding the file extension
-                binary_to_file(binary_string, output_filename)
-            except Exception as e:
-                raise Exception(f"Error creating output file: {e}")
+        # Saving the files under their hidden name
+        output_filenames = [self.output_name(name, hfile + 1, taken) for hfile, name in enumerate(names)]
+        if output_directory:
+            output_filenames = [os.path.join(output_directory, output_filename) for output_filename in output_filenames]
+
+        # Files sharing the same data are revealed once (the first of them), the others are linked to it afterwards
+        firsts = {} # (offset, data_length) -> first file holding that data
+        for hfile in range(len(names)):
+            firsts.setdefault((offsets[hfile], data_lengths[hfile]), hfile)
+        unique_files = list(firsts.values())
+
+        def reveal(hfile: int) -> str:
+            '''streams a file straight from the stego array to its output file, runs in a thread'''
+            return write_file(extract_chunks(steg_array, data_lengths[hfile] // 8, 1, offsets[hfile], channels, depth), output_filenames[hfile], unique=True)
+
+        clear_previous_print_value()
+        try:
+            if archive_size:
+                # The archive is decompressed once, from start to end, so the files are revealed in the order of their data
+                reader = ChunkReader(decompress_chunks(extract_chunks(steg_array, archive_size, 1, 0, channels, depth)))
+                for hfile in sorted(unique_files, key=lambda hfile: (offsets[hfile], data_lengths[hfile])):
+                    print(f' Decoding file {hfile+1}...', end='\r')
+                    reader.skip(offsets[hfile] - reader.position) # Data of files deleted from the header
+                    output_filenames[hfile] = write_file(reader.read_chunks(data_lengths[hfile] // 8), output_filenames[hfile], unique=True)
+            else:
+                # The threads only read the stego array, each one writes its own file
+                with ThreadPoolExecutor(max_workers=self.thread_count(workers, len(unique_files))) as pool:
+                    for ind, (hfile, output_filename) in enumerate(zip(unique_files, pool.map(reveal, unique_files))):
+                        print(f' Decoding file {ind+1}/{len(unique_files)}...', end='\r')
+                        output_filenames[hfile] = output_filename
+
+            # Same data as a file we already revealed, no need to reveal it again
+            for hfile in range(len(names)):
+                first = firsts[(offsets[hfile], data_lengths[hfile])]
+                if first != hfile:
+                    output_filenames[hfile] = link_or_copy(output_filenames[first], output_filenames[hfile], unique=True)
+        except Exception as e:
+            raise Exception(f"Error creating output file: {e}")
+
+        clear_previous_print_value()
+        for output_filename in output_filenames:
+            print(f"successfully extracted file '{os.path.basename(output_filename)}' to '{os.path.dirname(output_filename)}'")
+        return output_filenames
+
+    def list_files(self, image: str) -> list[tuple[str, int]]:
+        '''lists the files hidden in an image without revealing them, numbered as by `decode_files`.\n
+        Returns the name and the size (in bytes) of every file'''
+        try:
+            header_info = self.get_headers(image)
+        except FileNotFoundError:
+            raise
+        except Exception as e:
+            raise Exception(f"Error decoding header information: {e}")
+
+        files = [(name, data_length // 8) for name, data_length in zip(header_info["names"], header_info["data_lengths"])]
+        for number, (name, size) in enumerate(files, 1):
+            print(f"{number}: {name} ({size} bytes)")
+        if header_info["archive_size"]:
+            print(f"solid archive of {header_info['archive_size']} bytes")
+        return files
+
+    def extract_file(self, image: str, member, output_directory: str='') -> str:
+        '''for revealing a single file of an image, without revealing the other ones.\n
+        member: Name of the hidden file, or its number (as numbered by `list_files`)
+        output_directory: Dir to save the file\n
+        In a solid archive the decompressed archive is read up to the end of the file, the data before it
+        is dropped as it comes out of the decompressor and nothing after it is decompressed.
+        Returns the path of the revealed file'''
+        try:
+            # Check if the image file exists
+            with open(image, 'rb'):
+                pass
+        except FileNotFoundError:
+            raise FileNotFoundError(f"Image file not found: {image}")
+
+        try:
+            with Image.open(image, 'r') as steg_image:
+                steg_array = np.array(steg_image)
+            header_info = self.read_headers(steg_array)
+            self.restore_rows(steg_array, header_info)
+        except Exception as e:
+            raise Exception(f"Error decoding header information: {e}")
+
+        names = header_info["names"]
+        if isinstance(member, int):
+            if not 1 <= member <= len(names):
+                raise IndexError(f"Invalid file number {member}, the image contains {len(names)} file(s).")
+            hfile = member - 1
+        elif member in names:
+            hfile = names.index(member)
+        else:
+            raise FileNotFoundError(f"File not found in the image: {member}")
+
+        output_filename = self.output_name(names[hfile], hfile + 1, set())
+        if output_directory:
+            output_filename = os.path.join(output_directory, output_filename)
+
+        size = header_info["data_lengths"][hfile] // 8
+        offset = header_info["offsets"][hfile]
+        channels, depth = array_layout(steg_array)
+        archive_size = header_info["archive_size"]
+        try:
+            if archive_size:
+                reader = ChunkReader(decompress_chunks(extract_chunks(steg_array, archive_size, 1, 0, channels, depth)))
+                reader.skip(offset)
+                output_filename = write_file(reader.read_chunks(size), output_filename, unique=True)
             else:
-                hfile+=1
-                print(f"successfully extracted file '{os.path.basename(output_filename)}' to '{os.path.dirname(output_filename)}'")
-    
+                output_filename = write_file(extract_chunks(steg_array, size, 1, offset, channels, depth), output_filename, unique=True)
+        except Exception as e:
+            raise Exception(f"Error creating output file: {e}")
+
+        print(f"successfully extracted file '{os.path.basename(output_filename)}' to '{os.path.dirname(output_filename)}'")
+        return output_filename
@@ -0,0 +1,203 @@
+'''multi process hiding and revealing for very large single jobs\n
+The cover array is placed in a `multiprocessing.shared_memory` block and every worker process attaches
+to it by name, so the image is never pickled or copied between processes. The columns of the layout
+used by `kernels.embed`/`kernels.extract` are split in contiguous ranges, one per worker, and each worker
+writes (or reads) only its own columns. The output is identical to the single process path.'''
+
+import os
+import numpy as np
+
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor
+
+import kernels
+
+class SharedArray:
+    """numpy array stored in a shared memory block, can be used as a context manager.\n
+    Worker processes attach to it with `SharedArray.attach(*shared.spec)`."""
+
+    def __init__(self, shape: tuple, dtype=np.uint8, name: str = None) -> None:
+        self.owner = name is None # Only the process creating the block is allowed to unlink it
+        nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=max(1, nbytes)) # Size 0 blocks are not allowed
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.array = np.ndarray(shape, dtype=dtype, buffer=self.shm.buf)
+
+    @classmethod
+    def from_array(cls, array) -> 'SharedArray':
+        '''creates a shared array holding a copy of `array`'''
+        array = np.asarray(array)
+        shared = cls(array.shape, array.dtype)
+        shared.array[...] = array
+        return shared
+
+    @classmethod
+    def attach(cls, name: str, shape: tuple, dtype: str) -> 'SharedArray':
+        '''attaches to a shared array created by another process'''
+        return cls(shape, np.dtype(dtype), name)
+
+    @property
+    def spec(self) -> tuple:
+        '''everything a worker needs to attach to this array'''
+        return (self.shm.name, self.array.shape, self.array.dtype.str)
+
+    def close(self) -> None:
+        del self.array # The numpy view must be released before closing the block
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+    def __enter__(self) -> 'SharedArray':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+def split_columns(shape: tuple, size: int, workers: int, channels: int = kernels.CHANNELS_USED, depth: int = kernels.CRUMB_SIZE) -> list[tuple[int, int]]:
+    '''
+    Splits the columns needed to hide `size` bytes in at most `workers` ranges of data bytes.
+
+    The boundaries are multiples of 8 / depth columns (4 columns with the default depth), this way every range starts
+    on a byte boundary (that many columns always hold a whole number of bytes) and no two workers ever share a byte or a column.
+    '''
+    per_column = kernels.crumbs_per_column(shape, channels)
+    per_byte = 8 // depth
+    needed = kernels.columns_needed(shape, size, channels, depth)
+    step = -(-needed // max(1, workers)) # Ceil division
+    step = -(-step // per_byte) * per_byte # Round up to a multiple of 8 / depth columns
+
+    ranges = []
+    for first in range(0, needed, step):
+        start = first * per_column // per_byte
+        stop = min((first + step) * per_column // per_byte, size)
+        ranges.append((start, stop))
+    return ranges
+
+def _embed_worker(cover_spec: tuple, data_spec: tuple, start: int, stop: int, column: int, channels: int, depth: int) -> None:
+    '''hides data[start:stop] in the shared cover, runs inside a worker process.
+    `data_spec` is either the spec of a SharedArray or ("file", path) for data memory-mapped straight from a file'''
+    cover = SharedArray.attach(*cover_spec)
+    try:
+        if data_spec[0] == "file":
+            data = np.memmap(data_spec[1], dtype=np.uint8, mode='r', offset=start, shape=(stop - start,))
+            kernels.embed(cover.array, data, column, start * (8 // depth), channels, depth)
+            del data
+        else:
+            data = SharedArray.attach(*data_spec)
+            try:
+                kernels.embed(cover.array, data.array[start:stop], column, start * (8 // depth), channels, depth)
+            finally:
+                data.close()
+    finally:
+        cover.close()
+
+def _extract_worker(steg_spec: tuple, out_spec: tuple, start: int, stop: int, column: int, channels: int, depth: int, position: int) -> None:
+    '''reveals data[start:stop] from the shared stego array straight into the shared output at `position`, runs inside a worker process'''
+    steg = SharedArray.attach(*steg_spec)
+    out = SharedArray.attach(*out_spec)
+    try:
+        kernels.extract(steg.array, stop - start, column, start * (8 // depth), out.array[position:position + stop - start], channels, depth)
+    finally:
+        out.close()
+        steg.close()
+
+def embed_parallel(cover: SharedArray, data, workers: int, column: int = 1, channels: int = kernels.CHANNELS_USED, depth: int = kernels.CRUMB_SIZE) -> None:
+    """
+    Hides data inside a shared cover array using several worker processes.
+
+    Parameters:
+    - cover (SharedArray): Cover image placed in shared memory, it's modified in place.
+    - data (bytes-like or str): Data to be hidden, or the path of a file every worker memory-maps its own part of (no copy at all).
+    - workers (int): Number of worker processes.
+    - column (int): First column of the layout.
+    - channels (int): Number of channels used in each pixel.
+    - depth (int): Number of bits hidden in each channel.
+
+    Returns:
+    None
+    """
+    if isinstance(data, str):
+        size = os.path.getsize(data)
+    else:
+        data = kernels.as_byte_array(data)
+        size = data.size
+
+    # Checking the size here so the error is raised once instead of once per worker
+    if size * 8 > kernels.layout_capacity(cover.array.shape, column, channels, depth):
+        raise ValueError("Cover image is too small to hide the data.")
+
+    shared_data = None if isinstance(data, str) else SharedArray.from_array(data)
+    try:
+        data_spec = ("file", data) if shared_data is None else shared_data.spec
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            jobs = [
+                pool.submit(_embed_worker, cover.spec, data_spec, start, stop, column, channels, depth)
+                for start, stop in split_columns(cover.array.shape, size, workers, channels, depth)
+            ]
+            for job in jobs:
+                job.result() # Re-raises any error that happened inside a worker
+    finally:
+        if shared_data is not None:
+            shared_data.close()
+
+def extract_parallel(steg: SharedArray, size: int, workers: int, column: int = 1, channels: int = kernels.CHANNELS_USED, depth: int = kernels.CRUMB_SIZE) -> bytes:
+    """
+    Reveals data hidden inside a shared stego array using several worker processes.
+
+    Parameters:
+    - steg (SharedArray): Image with the hidden data placed in shared memory.
+    - size (int): Number of bytes to reveal.
+    - workers (int): Number of worker processes.
+    - column (int): First column of the layout.
+    - channels (int): Number of channels used in each pixel.
+    - depth (int): Number of bits hidden in each channel.
+
+    Returns:
+    bytes: The revealed data.
+    """
+    if size * 8 > kernels.layout_capacity(steg.array.shape, column, channels, depth):
+        raise ValueError("Image is too small to contain the data, header information is probably corrupted.")
+
+    with SharedArray((size,), np.uint8) as out, ProcessPoolExecutor(max_workers=workers) as pool:
+        jobs = [
+            pool.submit(_extract_worker, steg.spec, out.spec, start, stop, column, channels, depth, start)
+            for start, stop in split_columns(steg.array.shape, size, workers, channels, depth)
+        ]
+        for job in jobs:
+            job.result()
+        return out.array.tobytes()
+
+def extract_chunks_parallel(steg: SharedArray, size: int, workers: int, column: int = 1, channels: int = kernels.CHANNELS_USED, depth: int = kernels.CRUMB_SIZE):
+    """
+    Reveals data hidden inside a shared stego array using several worker processes, in batches.
+
+    Every batch is made of one chunk of `kernels.CHUNK_BYTES` bytes per worker, revealed in parallel into a shared
+    buffer that is reused for the next batch, so the memory needed doesn't grow with the payload size.
+
+    Parameters:
+    - steg (SharedArray): Image with the hidden data placed in shared memory.
+    - size (int): Number of bytes to reveal.
+    - workers (int): Number of worker processes.
+    - column (int): First column of the layout.
+    - channels (int): Number of channels used in each pixel.
+    - depth (int): Number of bits hidden in each channel.
+
+    Yields:
+    bytes: The revealed data, one batch at a time.
+    """
+    if size * 8 > kernels.layout_capacity(steg.array.shape, column, channels, depth):
+        raise ValueError("Image is too small to contain the data, header information is probably corrupted.")
+
+    batch = workers * kernels.CHUNK_BYTES
+    with SharedArray((min(size, batch),), np.uint8) as out, ProcessPoolExecutor(max_workers=workers) as pool:
+        for batch_start in range(0, size, batch):
+            batch_stop = min(batch_start + batch, size)
+            jobs = [
+                pool.submit(_extract_worker, steg.spec, out.spec, start, min(start + kernels.CHUNK_BYTES, batch_stop), column, channels, depth, start - batch_start)
+                for start in range(batch_start, batch_stop, kernels.CHUNK_BYTES)
+            ]
+            for job in jobs:
+                job.result()
+            yield out.array[:batch_stop - batch_start].tobytes() # Copied, the buffer is overwritten by the next batch
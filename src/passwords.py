@@ -0,0 +1,139 @@
+'''module for encrypting with a password instead of a random key\n
+The Fernet key is derived from the password with scrypt, a memory-hard function (every guess costs about
+100 ms and 32 MB, which slows down brute-forcing). The salt and the scrypt parameters are stored in the header
+metadata of the carrier, so only the password is needed to reveal it, there's no key file to keep.\n
+Deriving a key is slow on purpose, derived keys are therefore cached per (password, salt and parameters) by
+the process, and a process hiding several files uses a single salt for all of them. A batch of thousands of
+carriers made with one password is revealed with a single derivation. The cache is bounded, the keys it drops
+(or clears) are overwritten with zeros, and it never keeps the passwords or a plain hash of them: entries are
+found by an HMAC keyed with a random secret of the cache.\n
+`python VanGonography.py -cli -e -c cover.png -f secret.txt --encrypt --password "correct horse battery staple"`'''
+
+import os
+import base64
+import hmac
+import hashlib
+import threading
+from collections import OrderedDict
+
+from cryptography.hazmat.primitives.kdf.scrypt import Scrypt
+
+PASSWORD_VARIABLE = "VANGONOGRAPHY_PASSWORD" # Environment variable the CLI reads the password from when --password isn't given
+KDF_NAME = "scrypt"
+SALT_SIZE = 16
+SCRYPT_N = 2 ** 15 # CPU and memory cost, 128 * N * r bytes of memory (32 MB)
+SCRYPT_R = 8
+SCRYPT_P = 1
+MAX_SCRYPT_MEMORY = 64 * 1024 * 1024 # Largest scrypt memory (128 * n * r bytes) accepted from a header, twice the default
+MAX_SCRYPT_PR = 32 # Largest p * r accepted from a header, bounds the time of a derivation with the memory
+CACHE_SIZE = 32 # Derived keys kept by the cache of the process
+
+def derive_key(password: str, salt: bytes, n: int = SCRYPT_N, r: int = SCRYPT_R, p: int = SCRYPT_P) -> bytearray:
+    '''raw 32 bytes key derived from the password with scrypt, in a bytearray so it can be zeroed once used'''
+    if not password:
+        raise ValueError("The password can't be empty.")
+    try:
+        return bytearray(Scrypt(salt=salt, length=32, n=n, r=r, p=p).derive(password.encode()))
+    except Exception as e:
+        raise Exception(f"Error deriving the key from the password: {e}")
+
+def fernet_key(raw_key) -> bytes:
+    '''Fernet key (url-safe base64) of a raw 32 bytes key'''
+    return base64.urlsafe_b64encode(bytes(raw_key))
+
+def kdf_metadata(salt: bytes, n: int = SCRYPT_N, r: int = SCRYPT_R, p: int = SCRYPT_P) -> dict:
+    '''header metadata fields describing how the key was derived, the salt is stored in hex'''
+    return {"kdf": KDF_NAME, "salt": salt.hex(), "n": n, "r": r, "p": p}
+
+def kdf_parameters(metadata: dict) -> tuple[bytes, int, int, int]:
+    '''(salt, n, r, p) from the header metadata, None when the data wasn't encrypted with a password'''
+    if "kdf" not in metadata:
+        return None
+    try:
+        if metadata["kdf"] != KDF_NAME:
+            raise ValueError(f"unknown key derivation function {metadata['kdf']}")
+        salt, n, r, p = bytes.fromhex(metadata["salt"]), int(metadata["n"]), int(metadata["r"]), int(metadata["p"])
+    except (KeyError, ValueError) as e:
+        raise ValueError(f"Invalid key derivation parameters in the header: {e}")
+    # A crafted image can't make a derivation take gigabytes of memory or minutes
+    if n < 2 or n & (n - 1) or r < 1 or p < 1 or 128 * n * r > MAX_SCRYPT_MEMORY or p * r > MAX_SCRYPT_PR:
+        raise ValueError("Invalid key derivation parameters in the header.")
+    return salt, n, r, p
+
+class KeyCache:
+    """
+    Bounded cache of derived keys, least recently used keys are dropped first and zeroed. Thread safe.
+
+    Parameters:
+    - size (int): Maximum number of keys kept.
+    """
+    def __init__(self, size: int = CACHE_SIZE):
+        if size < 1:
+            raise ValueError("The key cache must hold at least one key.")
+        self.size = size
+        self.keys = OrderedDict() # (password digest, salt, n, r, p) -> raw key
+        self.secret = os.urandom(32) # Key of the password digests, they can't be checked against guesses without it
+        self.salt = os.urandom(SALT_SIZE) # Salt of every key used for hiding, the batches of a password need a single derivation
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def password_digest(self, password: str, salt: bytes) -> bytes:
+        '''the cache never keeps the password itself, only an HMAC of it keyed with the secret of the cache'''
+        return hmac.new(self.secret, salt + password.encode(), hashlib.sha256).digest()
+
+    def key(self, password: str, salt: bytes, n: int = SCRYPT_N, r: int = SCRYPT_R, p: int = SCRYPT_P) -> bytes:
+        '''Fernet key of the password with this salt and parameters, derived only the first time it's asked for'''
+        entry = (self.password_digest(password, salt), salt, n, r, p)
+        with self.lock:
+            raw_key = self.keys.get(entry)
+            if raw_key is not None:
+                self.keys.move_to_end(entry)
+                self.hits += 1
+                return fernet_key(raw_key)
+
+        raw_key = derive_key(password, salt, n, r, p) # Outside the lock, other keys can be served meanwhile
+        with self.lock:
+            self.misses += 1
+            if entry in self.keys:
+                self.wipe(raw_key) # Derived by another thread in the meantime
+                raw_key = self.keys[entry]
+            else:
+                self.keys[entry] = raw_key
+                while len(self.keys) > self.size:
+                    self.wipe(self.keys.popitem(last=False)[1])
+            return fernet_key(raw_key)
+
+    def encryption_key(self, password: str) -> tuple[bytes, dict]:
+        '''Fernet key and header metadata for hiding data with the password. The salt of the cache is chosen
+        randomly when it's created (or cleared), so hiding a batch of files with a password needs a single derivation'''
+        with self.lock:
+            salt = self.salt
+        return self.key(password, salt), kdf_metadata(salt)
+
+    def decryption_key(self, password: str, metadata: dict) -> bytes:
+        '''Fernet key for revealing data hidden with the password, from the parameters stored in the header metadata'''
+        parameters = kdf_parameters(metadata)
+        if parameters is None:
+            raise ValueError("The data wasn't encrypted with a password, use its key instead.")
+        return self.key(password, *parameters)
+
+    @staticmethod
+    def wipe(raw_key: bytearray) -> None:
+        '''overwrites a key with zeros'''
+        raw_key[:] = bytes(len(raw_key))
+
+    def clear(self) -> None:
+        '''drops and zeroes every key, then changes the salt and the secret'''
+        with self.lock:
+            for raw_key in self.keys.values():
+                self.wipe(raw_key)
+            self.keys.clear()
+            self.secret = os.urandom(32)
+            self.salt = os.urandom(SALT_SIZE)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "keys": len(self.keys), "size": self.size}
+
+KEY_CACHE = KeyCache() # Cache of the process, used by encode_image and decode_image
@@ -0,0 +1,130 @@
+'''module for reading only the first rows of an image, where the headers are stored\n
+PIL decodes the whole image as soon as any pixel is asked for, even for a crop of a single row. PNG images are
+stored row by row (scanlines) in a single zlib stream split in IDAT chunks, so the rows at the top of the image are
+the first bytes of the stream. `RowReader` parses the chunks itself and inflates the stream only up to the rows
+asked for, the rest of the file isn't even read. The rows are then unfiltered by PIL, from a small PNG holding
+only them. Other formats and interlaced PNGs (their first rows are spread across the whole stream) are decoded
+whole by PIL, the result is the same.\n
+`first_rows = read_rows("Cover_txt.png", 20)`'''
+
+import os
+import io
+import zlib
+import struct
+
+import numpy as np
+from PIL import Image
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+PNG_CHANNELS = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4} # Samples per pixel of every PNG color type
+PNG_KEPT_CHUNKS = (b"PLTE", b"tRNS") # Chunks before the image data that change the decoded pixels
+READ_SIZE = 1 << 16 # Bytes of compressed data read from the file at once
+
+def png_chunk(chunk_type: bytes, data: bytes) -> bytes:
+    '''a PNG chunk: length, type, data and crc32'''
+    return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", zlib.crc32(chunk_type + data))
+
+class RowReader:
+    """
+    Reads the first rows of an image, decoding as little of it as possible. Can be used as a context manager.
+
+    Parameters:
+    - image (str or file object): Path to the image, or a seekable binary file object (its position is restored when closed).
+    """
+    def __init__(self, image):
+        self.owns_file = isinstance(image, (str, os.PathLike))
+        self.file = open(image, "rb") if self.owns_file else image
+        self.start = self.file.tell()
+        try:
+            with Image.open(self.file) as probe: # Only reads the header of the file
+                self.width, self.height, self.mode = probe.width, probe.height, probe.mode
+            self.file.seek(self.start)
+            self.partial = self.open_png()
+        except BaseException:
+            self.close()
+            raise
+        self.array = None # Whole image, when it can't be read partially
+        self.raw = bytearray() # Inflated scanlines read so far, each one starts with its filter type
+        self.decompressor = zlib.decompressobj()
+
+    def open_png(self) -> bool:
+        '''reads the chunks of a PNG up to its image data, returns False when its rows can't be read partially'''
+        if self.file.read(8) != PNG_SIGNATURE:
+            return False
+        self.chunks = [] # Chunks copied to the PNG of the rows
+        while True:
+            length, chunk_type = struct.unpack(">I4s", self.file.read(8))
+            if chunk_type == b"IHDR":
+                data = self.file.read(length)
+                self.file.seek(4, os.SEEK_CUR) # crc
+                width, height, self.bit_depth, self.color_type, _, _, interlace = struct.unpack(">IIBBBBB", data)
+                if interlace or self.color_type not in PNG_CHANNELS:
+                    return False
+                self.stride = -(-width * PNG_CHANNELS[self.color_type] * self.bit_depth // 8) # Bytes of a scanline, without its filter type
+            elif chunk_type == b"IDAT":
+                self.remaining = length # Bytes of the current IDAT chunk not read yet
+                return True
+            elif chunk_type == b"IEND":
+                return False
+            elif chunk_type in PNG_KEPT_CHUNKS:
+                self.chunks.append(png_chunk(chunk_type, self.file.read(length)))
+                self.file.seek(4, os.SEEK_CUR)
+            else:
+                self.file.seek(length + 4, os.SEEK_CUR)
+
+    def compressed_data(self) -> bytes:
+        '''next piece of the zlib stream, from the current IDAT chunk or the following one'''
+        if not self.remaining:
+            self.file.seek(4, os.SEEK_CUR) # crc of the previous chunk
+            header = self.file.read(8)
+            length, chunk_type = struct.unpack(">I4s", header) if len(header) == 8 else (0, b"")
+            if chunk_type != b"IDAT":
+                raise ValueError("Invalid PNG image, its data ended before all of its rows.")
+            self.remaining = length
+        data = self.file.read(min(self.remaining, READ_SIZE))
+        if not data:
+            raise ValueError("Invalid PNG image, the file is truncated.")
+        self.remaining -= len(data)
+        return data
+
+    def read(self, rows: int) -> np.ndarray:
+        '''the first `rows` rows of the image, as np.array(image)[:rows] would give them'''
+        rows = max(1, min(rows, self.height))
+        if not self.partial:
+            if self.array is None:
+                self.file.seek(self.start)
+                with Image.open(self.file) as image:
+                    self.array = np.array(image)
+            return self.array[:rows]
+
+        # Inflating just enough of the stream, what's left of the compressed data stays in the decompressor
+        needed = rows * (1 + self.stride)
+        while len(self.raw) < needed:
+            if self.decompressor.eof:
+                raise ValueError("Invalid PNG image, its data ended before all of its rows.")
+            data = self.decompressor.unconsumed_tail or self.compressed_data()
+            self.raw += self.decompressor.decompress(data, needed - len(self.raw))
+
+        # PIL unfilters the rows from a PNG holding only them, stored uncompressed so it's built quickly
+        header = struct.pack(">IIBBBBB", self.width, rows, self.bit_depth, self.color_type, 0, 0, 0)
+        png = b"".join([PNG_SIGNATURE, png_chunk(b"IHDR", header), *self.chunks,
+                        png_chunk(b"IDAT", zlib.compress(bytes(self.raw[:needed]), 0)), png_chunk(b"IEND", b"")])
+        with Image.open(io.BytesIO(png)) as image:
+            return np.array(image)
+
+    def close(self) -> None:
+        if self.owns_file:
+            self.file.close()
+        else:
+            self.file.seek(self.start)
+
+    def __enter__(self) -> 'RowReader':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+def read_rows(image, rows: int) -> np.ndarray:
+    '''the first `rows` rows of an image (path or file object), see RowReader'''
+    with RowReader(image) as reader:
+        return reader.read(rows)
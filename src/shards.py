@@ -0,0 +1,200 @@
+'''module for hiding a single payload across several cover images\n
+When the payload doesn't fit in one cover it's split in shards, the number of covers is chosen
+automatically from a cover pool (see coverpool.py), taking the largest covers first and the smallest one
+that fits the rest. The shards are hidden in parallel, and the header of every shard carries its id,
+the total count and a digest of the whole payload.\n
+Reassembly accepts the shard images in any order, reveals them concurrently straight into the output
+file (each worker writes its own range of it) and verifies the digest at the end.\n
+`python VanGonography.py -cli -e --shard --pool "covers folder" -f big.zip -o out`\n
+`python VanGonography.py -cli -d --shards out/Shard_*.png -o revealed`'''
+
+import os
+import hashlib
+
+import numpy as np
+
+from PIL import Image
+from concurrent.futures import ProcessPoolExecutor
+
+from utils import load_payload, save_png, temporary_name, publish
+from kernels import embed, extract, COVER_MODES
+from coverpool import CoverPool
+from VanGonography import write_header, get_header, cover_layout, layout_metadata, header_layout
+
+DIGEST_LENGTH = 32 # Number of hex characters of the sha256 digest stored in each shard header
+READ_CHUNK = 1 << 20 # Chunk size used when hashing files
+
+def file_digest(path: str) -> str:
+    '''sha256 of a file read in chunks, truncated to DIGEST_LENGTH hex characters'''
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(READ_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:DIGEST_LENGTH]
+
+def choose_covers(covers: list[tuple[str, int]], size: int) -> list[tuple[str, int]]:
+    '''chooses the smallest number of covers able to hold `size` bytes: the largest covers are taken
+    until the rest fits in a single one, then the smallest cover that fits the rest is taken'''
+    available = sorted(covers, key=lambda cover: cover[1])
+    if sum(capacity for _, capacity in available) < size:
+        raise ValueError(f"The covers in the pool are too small to hide the data, {size} bytes needed but only "
+                         f"{sum(capacity for _, capacity in available)} available.")
+
+    chosen = []
+    remaining = size
+    while remaining > available[-1][1]:
+        chosen.append(available.pop())
+        remaining -= chosen[-1][1]
+
+    # Best fit for what's left, the list is sorted so the first cover that fits is the smallest one
+    chosen.append(next(cover for cover in available if cover[1] >= remaining))
+    return chosen
+
+def split_payload(size: int, capacities: list[int]) -> list[tuple[int, int]]:
+    '''splits `size` bytes in ranges proportional to the capacities, so every worker gets a similar share of the work'''
+    total = sum(capacities)
+    ranges = []
+    start = 0
+    for index, capacity in enumerate(capacities):
+        stop = size if index == len(capacities) - 1 else start + size * capacity // total
+        ranges.append((start, stop))
+        start = stop
+    return ranges
+
+def _encode_shard(file: str, start: int, stop: int, cover: str, output_filename: str, extension: str, metadata: dict) -> str:
+    '''hides file[start:stop] in a cover, runs inside a worker process, returns the path of the shard image'''
+    data = load_payload(file)[start:stop] # Only the pages of this shard are read
+
+    with Image.open(cover, 'r') as cover_image:
+        # Modes we can't hide data in (palette, CMYK...) are converted to RGB, like encode_image does
+        if cover_image.mode not in COVER_MODES:
+            cover_image = cover_image.convert("RGB")
+        mode = cover_image.mode
+        cover_array = np.array(cover_image)
+
+    channels, depth = cover_layout(mode)
+    embed(cover_array, data, channels=channels, depth=depth)
+    write_header(cover_array, extension, len(data) * 8, {**metadata, **layout_metadata(mode, channels, depth)})
+    return save_png(cover_array, output_filename, unique=True) # Saved once, under a name no other job uses
+
+def encode_shards(file: str, pool_directory: str, output_directory: str = "", workers: int = None) -> list[str]:
+    """
+    Hides a file across as many covers of the pool as needed.
+
+    Parameters:
+    - file (str): Path to the file to hide.
+    - pool_directory (str): Directory containing the cover images.
+    - output_directory (str): Directory where the shard images are saved.
+    - workers (int): Number of worker processes (default: one per CPU).
+
+    Returns:
+    list: Paths of the shard images.
+    """
+    if not os.path.isfile(file):
+        raise FileNotFoundError(f"File to hide not found: {file}")
+
+    size = os.path.getsize(file)
+    if size == 0:
+        raise ValueError("File to hide is empty.")
+
+    # Covers too short for the header of a shard are left out before choosing, the longest shard id the pool allows is counted
+    extension = os.path.splitext(file)[1][1:]
+    pool = CoverPool(pool_directory)
+    most = max(len(pool.index), 1)
+    covers = choose_covers(pool.covers(metadata={"shard": f"{most}/{most}", "digest": "0" * DIGEST_LENGTH}, extension=extension), size)
+    ranges = split_payload(size, [capacity for _, capacity in covers])
+    digest = file_digest(file)
+    count = len(covers)
+
+    print(f"Hiding {size} bytes in {count} shard(s)...")
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        jobs = []
+        for index, ((cover, _), (start, stop)) in enumerate(zip(covers, ranges)):
+            output_filename = os.path.join(output_directory, f"Shard_{index + 1}_of_{count}_{extension}.png")
+            metadata = {"shard": f"{index + 1}/{count}", "digest": digest}
+            jobs.append(pool.submit(_encode_shard, file, start, stop, cover, output_filename, extension, metadata))
+        outputs = [job.result() for job in jobs]
+
+    print(f"Process Complete\nFile hidden in {count} shard(s) saved at \"{output_directory or os.getcwd()}\"")
+    return outputs
+
+def _decode_shard(image: str, header: dict, output_filename: str, offset: int, size: int) -> None:
+    '''reveals a shard and writes it at its offset of the output file, runs inside a worker process'''
+    with Image.open(image, 'r') as steg_image:
+        channels, depth = header_layout(header, steg_image.mode)
+        steg_array = np.array(steg_image)
+
+    data = extract(steg_array, size, channels=channels, depth=depth)
+    with open(output_filename, 'r+b') as f:
+        f.seek(offset)
+        f.write(data)
+
+def decode_shards(images: list[str], output_directory: str = "", workers: int = None) -> str:
+    """
+    Reassembles a file hidden across several shard images.
+
+    Parameters:
+    - images (list): Paths to all the shard images, in any order.
+    - output_directory (str): Directory where the revealed file is saved.
+    - workers (int): Number of worker processes (default: one per CPU).
+
+    Returns:
+    str: Path of the revealed file.
+    """
+    # Reading only the headers first, to find the order of the shards and check none is missing
+    shards = {}
+    digests = set()
+    counts = set()
+    extension = ""
+    for image in images:
+        try:
+            header = get_header(image)
+            index, count = (int(number) for number in header["metadata"]["shard"].split("/"))
+            digests.add(header["metadata"]["digest"])
+        except Exception as e:
+            raise ValueError(f"'{image}' is not a valid shard image: {e}")
+        if index in shards:
+            raise ValueError(f"Shard {index} was given twice: '{shards[index][0]}' and '{image}'.")
+        shards[index] = (image, header, header["data_length"] // 8)
+        counts.add(count)
+        extension = header["extension"].replace("\x01", "_")
+
+    if len(digests) != 1 or len(counts) != 1:
+        raise ValueError("The shard images don't belong to the same file.")
+    count = counts.pop()
+    missing = sorted(set(range(1, count + 1)) - set(shards))
+    if missing:
+        raise ValueError(f"Missing shard(s): {', '.join(map(str, missing))} of {count}.")
+
+    # The output is allocated first (under a temporary name, renamed once it's verified), then every worker
+    # writes its shard straight to its offset
+    output_filename = f"Output.{extension}"
+    if output_directory:
+        output_filename = os.path.join(output_directory, output_filename)
+    temporary_path = temporary_name(output_filename)
+    total = sum(size for _, _, size in shards.values())
+    with open(temporary_path, 'xb') as f:
+        f.truncate(total)
+
+    print(f"Revealing {count} shard(s)...")
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            jobs = []
+            offset = 0
+            for index in range(1, count + 1):
+                image, header, size = shards[index]
+                jobs.append(pool.submit(_decode_shard, image, header, temporary_path, offset, size))
+                offset += size
+            for job in jobs:
+                job.result()
+
+        # Making sure the reassembled file is exactly the one that was hidden
+        if file_digest(temporary_path) != digests.pop():
+            raise ValueError("Digest of the reassembled file doesn't match, the shard images are corrupted.")
+        output_filename = publish(temporary_path, output_filename, unique=True)
+    except BaseException:
+        os.remove(temporary_path)
+        raise
+
+    print(f"successfully extracted file '{os.path.basename(output_filename)}' to '{os.path.dirname(output_filename)}'")
+    return output_filename
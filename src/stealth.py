@@ -0,0 +1,95 @@
+'''stealth mode: the data is scattered across the cover in a pseudo-random order derived from a key\n
+Instead of filling the columns one after the other, the crumbs of the data are spread over all the usable pixels
+(every column except column 0, which holds the header). Pixel `i` of the payload goes to pixel `permute(i)`
+of the cover, where `permute` is a keyed permutation: a small Feistel network whose round keys are drawn from
+a NumPy Generator seeded with the key. Without the key the order can't be recomputed.\n
+The permutation can be evaluated for any range of indexes, so the index array (uint32, 4 bytes per used pixel)
+is either computed once for the whole payload or chunk by chunk, which keeps the memory bounded.
+Both give exactly the same layout.\n
+`python VanGonography.py -cli -e --stealth --stealth-key "my key" -c cover.png -f secret.txt`'''
+
+import hashlib
+
+import numpy as np
+
+from kernels import as_byte_array, embed_scattered, extract_scattered_chunks, CHANNELS_USED, CRUMB_SIZE
+
+ROUNDS = 4 # Number of rounds of the Feistel network
+MULTIPLIER = np.uint32(0x9E3779B1) # Odd constant used to mix the bits in the round function
+
+def round_keys(key: str, rounds: int = ROUNDS) -> np.ndarray:
+    '''round keys of the permutation, drawn from a NumPy Generator seeded with the sha256 of the key'''
+    if not key:
+        raise ValueError("Stealth mode needs a key.")
+    seed = int.from_bytes(hashlib.sha256(key.encode()).digest(), 'big')
+    return np.random.default_rng(seed).integers(0, np.iinfo(np.uint32).max, rounds, dtype=np.uint32, endpoint=True)
+
+def _feistel(values: np.ndarray, keys: np.ndarray, half_bits: int) -> np.ndarray:
+    '''balanced Feistel network on numbers of 2 * half_bits bits, a permutation of [0, 2 ** (2 * half_bits)).
+    Everything stays uint32 and is computed in place, the index arrays can be tens of millions of elements long'''
+    half = np.uint32(half_bits)
+    left = values >> half
+    right = values & np.uint32((1 << half_bits) - 1)
+    mixed = np.empty_like(left)
+    for key in keys:
+        # Multiply-shift of the right half, the high bits of the product are the best mixed ones
+        np.bitwise_xor(right, key, out=mixed)
+        np.multiply(mixed, MULTIPLIER, out=mixed)
+        np.right_shift(mixed, np.uint32(32 - half_bits), out=mixed)
+        np.bitwise_xor(left, mixed, out=left)
+        left, right = right, left
+    np.left_shift(left, half, out=left)
+    np.bitwise_or(left, right, out=left)
+    return left
+
+def permute(indexes: np.ndarray, size: int, keys: np.ndarray) -> np.ndarray:
+    """
+    Keyed permutation of [0, size), evaluated for the given indexes only.
+
+    The Feistel network works on a power of 4 at most 4 times larger than `size`, results falling outside
+    [0, size) are passed through it again until they fall inside (cycle walking), which keeps it a permutation.
+
+    Parameters:
+    - indexes (np.ndarray): Indexes to permute, all smaller than `size`.
+    - size (int): Size of the permuted range, at most 2 ** 32.
+    - keys (np.ndarray): Round keys, see `round_keys`.
+
+    Returns:
+    np.ndarray: uint32 array with the permuted indexes.
+    """
+    if size > 1 << 32:
+        raise ValueError("Cover image is too large for stealth mode.")
+    half_bits = max(1, ((size - 1).bit_length() + 1) // 2)
+
+    permuted = _feistel(np.asarray(indexes, dtype=np.uint32), keys, half_bits)
+    outside = np.flatnonzero(permuted >= size)
+    while outside.size:
+        permuted[outside] = _feistel(permuted[outside], keys, half_bits)
+        outside = outside[permuted[outside] >= size]
+    return permuted
+
+def pixel_indexes(shape: tuple, size: int, key: str, channels: int = CHANNELS_USED, depth: int = CRUMB_SIZE) -> np.ndarray:
+    '''cover pixel (counted column by column from column 1) of every pixel used to hide `size` bytes, as a uint32 array'''
+    pixels = -(-size * (8 // depth) // channels)
+    return permute(np.arange(pixels, dtype=np.uint32), (shape[1] - 1) * shape[0], round_keys(key))
+
+def stealth_order(shape: tuple, size: int, key: str, channels: int = CHANNELS_USED, depth: int = CRUMB_SIZE, chunked: bool = True):
+    '''pixel order of the stealth layout (see kernels.embed_scattered), computed chunk by chunk or all at once (same result)'''
+    if not chunked:
+        indexes = pixel_indexes(shape, size, key, channels, depth)
+        return lambda first, last: indexes[first:last]
+
+    keys = round_keys(key)
+    usable = (shape[1] - 1) * shape[0]
+    return lambda first, last: permute(np.arange(first, last, dtype=np.uint32), usable, keys)
+
+def embed_stealth(cover_array: np.ndarray, data, key: str, channels: int = CHANNELS_USED, depth: int = CRUMB_SIZE, chunked: bool = True) -> None:
+    '''hides data inside the cover array in the order given by the key, modifying it in place.
+    `chunked` computes the pixel order chunk by chunk instead of all at once (same layout, bounded memory)'''
+    pixel_order = stealth_order(cover_array.shape, as_byte_array(data).size, key, channels, depth, chunked)
+    embed_scattered(cover_array, data, pixel_order, channels, depth)
+
+def extract_stealth_chunks(steg_array: np.ndarray, size: int, key: str, channels: int = CHANNELS_USED, depth: int = CRUMB_SIZE, chunked: bool = True):
+    '''reveals data hidden with `embed_stealth`, in chunks (see kernels.extract_scattered_chunks)'''
+    pixel_order = stealth_order(steg_array.shape, size, key, channels, depth, chunked)
+    return extract_scattered_chunks(steg_array, size, pixel_order, channels, depth)
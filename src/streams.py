@@ -0,0 +1,244 @@
+'''streaming stages used when hiding and revealing data\n
+The revealed data flows through the stages in chunks (see `kernels.extract_chunks`), from the image to
+the decryption, the decompression and finally the output, which can be a file, stdout or any object
+with a `write` method. No stage holds more than a few chunks at a time, so the memory needed
+doesn't grow with the size of the hidden file and the output is written while it's being revealed.\n
+Every stage takes an iterable of bytes-like chunks and returns a generator of bytes chunks:\n
+`write_chunks(decompress_chunks(extract_chunks(steg_array, size)), "Output.txt")`\n
+Data read from a stream (e.g. stdin) goes the other way, through the compression and encryption stages
+while it's being hidden: `embed_chunks(cover_array, encrypt_chunks(compress_chunks(file_chunks(sys.stdin.buffer)), key))`'''
+
+import os
+import time
+import zlib
+import base64
+
+from cryptography.hazmat.primitives import hashes, padding
+from cryptography.hazmat.primitives.hmac import HMAC
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+
+from kernels import CHUNK_BYTES
+from utils import AtomicFile
+
+FERNET_VERSION = 0x80 # First byte of every Fernet token
+FERNET_PREFIX = 1 + 8 + 16 # Version, timestamp and iv, they come before the ciphertext
+FERNET_HMAC_SIZE = 32 # The hmac of the token is stored at its end
+
+def file_chunks(file):
+    '''yields the data of a binary file object (e.g. sys.stdin.buffer) in chunks of at most CHUNK_BYTES bytes, until its end'''
+    return iter(lambda: file.read(CHUNK_BYTES), b"")
+
+def rechunk(chunks, multiple: int):
+    '''yields the data of `chunks` in pieces whose size is a multiple of `multiple`, except the last one'''
+    pending = b""
+    for chunk in chunks:
+        pending += bytes(chunk)
+        usable = len(pending) - len(pending) % multiple
+        if usable:
+            yield pending[:usable]
+            pending = pending[usable:]
+    if pending:
+        yield pending
+
+def split_tail(chunks, size: int, tail: bytearray):
+    '''yields the data of `chunks` without its last `size` bytes, which are stored in `tail` once the chunks are exhausted'''
+    pending = b""
+    for chunk in chunks:
+        pending += bytes(chunk)
+        if len(pending) > size:
+            yield pending[:-size]
+            pending = pending[-size:]
+    tail[:] = pending
+
+class ChunkReader:
+    '''reads consecutive slices of a stream of chunks, for splitting a stream without holding it in memory'''
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.pending = memoryview(b"")
+        self.position = 0 # Bytes of the stream already read (or skipped)
+
+    def read_chunks(self, size: int):
+        '''yields the next `size` bytes of the stream in chunks, the generator must be exhausted before the next read'''
+        while size > 0:
+            if not self.pending:
+                chunk = next(self.chunks, None)
+                if chunk is None:
+                    raise ValueError("Invalid data. The stream ended before all of it was read.")
+                self.pending = memoryview(bytes(chunk))
+            piece = self.pending[:size]
+            self.pending = self.pending[len(piece):]
+            self.position += len(piece)
+            size -= len(piece)
+            yield piece
+
+    def skip(self, size: int) -> None:
+        '''drops the next `size` bytes of the stream'''
+        for _ in self.read_chunks(size):
+            pass
+
+def compress_chunks(chunks):
+    '''compresses chunks into a single zlib stream, the opposite of decompress_chunks'''
+    compressor = zlib.compressobj()
+    try:
+        for chunk in chunks:
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.flush()
+    except zlib.error as e:
+        raise Exception(f"Error compressing the data: {e}")
+
+def decompress_chunks(chunks):
+    '''decompresses a zlib stream chunk by chunk, never producing more than CHUNK_BYTES bytes at once'''
+    decompressor = zlib.decompressobj()
+    try:
+        for chunk in chunks:
+            data = decompressor.decompress(chunk, CHUNK_BYTES)
+            while data:
+                yield data
+                # Whatever didn't fit in CHUNK_BYTES is kept in unconsumed_tail
+                data = decompressor.decompress(decompressor.unconsumed_tail, CHUNK_BYTES)
+        data = decompressor.flush()
+        if data:
+            yield data
+        if not decompressor.eof:
+            raise zlib.error("incomplete or truncated stream")
+    except zlib.error as e:
+        raise Exception(f"Error decompressing the data: {e}")
+
+def encrypt_chunks(chunks, key):
+    """
+    Encrypts chunks into a Fernet token chunk by chunk, the opposite of decrypt_chunks.
+
+    The token is the one Fernet(key).encrypt would give for the whole data (base64 encoded), the hmac
+    is computed while the token is produced and added at its end.
+
+    Parameters:
+    - chunks (iterable): Chunks of the data to encrypt.
+    - key (str or bytes): Fernet key.
+
+    Yields:
+    bytes: The token.
+    """
+    try:
+        key = base64.urlsafe_b64decode(key)
+        if len(key) != 32:
+            raise ValueError("Fernet key must be 32 url-safe base64-encoded bytes.")
+        signing_key, encryption_key = key[:16], key[16:]
+
+        iv = os.urandom(16)
+        encryptor = Cipher(algorithms.AES(encryption_key), modes.CBC(iv)).encryptor()
+        padder = padding.PKCS7(algorithms.AES.block_size).padder()
+        hmac = HMAC(signing_key, hashes.SHA256())
+
+        def token():
+            prefix = bytes([FERNET_VERSION]) + int(time.time()).to_bytes(8, 'big') + iv
+            hmac.update(prefix)
+            yield prefix
+            for chunk in chunks:
+                data = encryptor.update(padder.update(bytes(chunk)))
+                hmac.update(data)
+                yield data
+            data = encryptor.update(padder.finalize()) + encryptor.finalize()
+            hmac.update(data)
+            yield data
+            yield hmac.finalize()
+
+        # The token is base64 encoded 3 bytes at a time, so only its end is padded
+        for piece in rechunk(token(), 3):
+            yield base64.urlsafe_b64encode(piece)
+    except Exception as e:
+        raise Exception(f"Error encrypting the data: {e}")
+
+def decrypt_chunks(source, key: str):
+    """
+    Decrypts a Fernet token chunk by chunk.
+
+    Fernet authenticates the whole token before any plaintext can be trusted, the token is therefore read
+    twice: a first pass checks the hmac, a second one decrypts it. Nothing is released if the token was tampered with.
+
+    Parameters:
+    - source (callable): Returns a new iterable over the chunks of the token every time it's called.
+    - key (str): Fernet key used to encrypt the data.
+
+    Yields:
+    bytes: The decrypted data.
+    """
+    try:
+        key = base64.urlsafe_b64decode(key)
+        if len(key) != 32:
+            raise ValueError("Fernet key must be 32 url-safe base64-encoded bytes.")
+        signing_key, encryption_key = key[:16], key[16:]
+
+        # First pass, the token is base64 encoded so it's decoded 4 characters at a time
+        hmac = HMAC(signing_key, hashes.SHA256())
+        expected = bytearray()
+        for chunk in split_tail((base64.urlsafe_b64decode(piece) for piece in rechunk(source(), 4)), FERNET_HMAC_SIZE, expected):
+            hmac.update(chunk)
+        hmac.verify(bytes(expected))
+
+        # Second pass, the token is authentic
+        prefix = b""
+        decryptor = None
+        unpadder = padding.PKCS7(algorithms.AES.block_size).unpadder()
+        for chunk in split_tail((base64.urlsafe_b64decode(piece) for piece in rechunk(source(), 4)), FERNET_HMAC_SIZE, bytearray()):
+            if decryptor is None:
+                prefix += chunk
+                if len(prefix) < FERNET_PREFIX:
+                    continue
+                if prefix[0] != FERNET_VERSION:
+                    raise ValueError("Invalid token version.")
+                decryptor = Cipher(algorithms.AES(encryption_key), modes.CBC(prefix[9:FERNET_PREFIX])).decryptor()
+                chunk = prefix[FERNET_PREFIX:]
+            data = unpadder.update(decryptor.update(chunk))
+            if data:
+                yield data
+        if decryptor is None:
+            raise ValueError("Token is too short.")
+        data = unpadder.update(decryptor.finalize()) + unpadder.finalize()
+        if data:
+            yield data
+    except Exception as e:
+        raise Exception(f"Error decrypting the data: {e if str(e) else 'invalid token'}")
+
+def reveal_chunks(source, decrypt: bool = False, key: str = "", compressed: bool = False):
+    """
+    Chains the stages needed to get back the hidden file from the revealed data.
+
+    Parameters:
+    - source (callable): Returns a new iterable over the revealed chunks every time it's called (decryption reads them twice).
+    - decrypt (bool): The data was encrypted with `key`.
+    - key (str): Fernet key used to encrypt the data.
+    - compressed (bool): The data was compressed (encode_image compresses before encrypting).
+
+    Returns:
+    generator: Chunks of the hidden file.
+    """
+    if decrypt and not key:
+        raise ValueError("No key was given, you must give a key to decrypt the data.")
+
+    chunks = decrypt_chunks(source, key) if decrypt else source()
+    if compressed:
+        chunks = decompress_chunks(chunks)
+    return chunks
+
+def write_chunks(chunks, output) -> int:
+    '''writes the chunks to `output`, a path or an object with a `write` method (e.g. sys.stdout.buffer), returns the number of bytes written.
+    Paths are written through a temporary file, see `write_file`'''
+    if isinstance(output, str):
+        with AtomicFile(output) as f:
+            return write_chunks(chunks, f)
+
+    written = 0
+    for chunk in chunks:
+        output.write(chunk)
+        written += len(chunk)
+    return written
+
+def write_file(chunks, path: str, unique: bool = False) -> str:
+    '''writes the chunks to a temporary file renamed to `path` once complete (see utils.AtomicFile), returns the final path.
+    With `unique` an existing file is never replaced, the data goes to "name-1.ext"... instead'''
+    output_file = AtomicFile(path, unique)
+    with output_file as f:
+        write_chunks(chunks, f)
+    return output_file.path
@@ -0,0 +1,98 @@
+'''tests of the asyncio API (aio.py): many small concurrent jobs run without blocking the event loop\n
+`python -m pytest tests/test_aio.py` or `python -m unittest tests.test_aio` from the src folder'''
+
+import os
+import sys
+import time
+import asyncio
+import tempfile
+import unittest
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # The modules of src import each other by name
+
+import utils
+from aio import AsyncRunner
+
+JOBS = 24 # Small jobs hidden and revealed concurrently
+MAX_JOBS = 4 # Jobs running at once
+TICK = 0.01 # Seconds between two ticks of the loop lag probe
+MAX_LAG = 0.5 # Seconds a tick may be late, a job blocking the loop would delay it by the whole job
+
+async def measure_lag(stop: asyncio.Event) -> float:
+    '''largest delay of a sleep of TICK seconds on the loop, until `stop` is set'''
+    lag = 0.0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lag = max(lag, time.perf_counter() - start - TICK)
+    return lag
+
+class AsyncRunnerTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cover = os.path.join(self.directory.name, "cover.png")
+        random = np.random.default_rng(0)
+        Image.fromarray(random.integers(0, 256, (160, 160, 3), dtype=np.uint8)).save(self.cover)
+
+        self.payloads = []
+        for index in range(JOBS):
+            path = os.path.join(self.directory.name, f"payload_{index}.txt")
+            with open(path, "wb") as f:
+                f.write(random.bytes(500 + index * 37))
+            self.payloads.append(path)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_concurrent_jobs_dont_block_the_loop(self):
+        async def scenario():
+            stop = asyncio.Event()
+            probe = asyncio.create_task(measure_lag(stop))
+            async with AsyncRunner(max_jobs=MAX_JOBS, timeout=60) as runner:
+                carriers = await asyncio.gather(*(
+                    runner.encode_image(payload, self.cover, os.path.join(self.directory.name, f"carrier_{index}"), name=f"revealed_{index}.txt")
+                    for index, payload in enumerate(self.payloads)))
+                revealed = await asyncio.gather(*(
+                    runner.decode_image(carrier, os.path.dirname(carrier)) for carrier in carriers))
+                headers = await asyncio.gather(*(runner.get_header(carrier) for carrier in carriers))
+            stop.set()
+            return carriers, revealed, headers, await probe
+
+        for index in range(JOBS):
+            os.makedirs(os.path.join(self.directory.name, f"carrier_{index}"))
+
+        start = time.perf_counter()
+        carriers, revealed, headers, lag = asyncio.run(scenario())
+        elapsed = time.perf_counter() - start
+
+        for payload, output, header in zip(self.payloads, revealed, headers):
+            with open(payload, "rb") as original, open(output, "rb") as result:
+                self.assertEqual(original.read(), result.read())
+            self.assertEqual(header["data_length"], os.path.getsize(payload) * 8)
+        self.assertEqual(len(set(carriers)), JOBS)
+        self.assertLess(lag, MAX_LAG)
+        # Every job pausing for the progress messages would take JOBS * 2 / MAX_JOBS seconds at least
+        self.assertLess(elapsed, JOBS * 2 * utils.PROGRESS_PAUSE / MAX_JOBS)
+
+    def test_progress_pause_is_left_to_other_callers(self):
+        async def scenario():
+            async with AsyncRunner(max_jobs=2) as runner:
+                await runner.encode_image(self.payloads[0], self.cover, self.directory.name)
+
+        pause = utils.PROGRESS_PAUSE
+        asyncio.run(scenario())
+        self.assertEqual(utils.PROGRESS_PAUSE, pause)
+
+    def test_timeout(self):
+        async def scenario():
+            async with AsyncRunner(max_jobs=1) as runner:
+                await runner.run(time.sleep, 0.5, timeout=0.05)
+
+        with self.assertRaises(asyncio.TimeoutError):
+            asyncio.run(scenario())
+
+if __name__ == "__main__":
+    unittest.main()
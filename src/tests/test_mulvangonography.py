@@ -0,0 +1,117 @@
+'''tests of the multiple files mode (mulVanGonography.py): files hidden in every supported cover mode are revealed unchanged\n
+`python -m pytest tests/test_mulvangonography.py` or `python -m unittest tests.test_mulvangonography` from the src folder'''
+
+import os
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # The modules of src import each other by name
+
+import scanlines
+import mulVanGonography
+from utils import no_pause
+from mulVanGonography import VanGons
+
+SIZE = 200 # Width and height of the covers
+SHAPES = {"RGB": (SIZE, SIZE, 3), "RGBA": (SIZE, SIZE, 4), "L": (SIZE, SIZE)}
+
+class VanGonsTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.random = np.random.default_rng(0)
+        self.payloads = []
+        for index, size in enumerate((700, 1500, 700)):
+            path = os.path.join(self.directory.name, f"payload_{index}.txt")
+            with open(path, "wb") as f:
+                f.write(self.random.bytes(size) if index < 2 else b"text " * (size // 5))
+            self.payloads.append(path)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def cover(self, mode: str) -> str:
+        '''random cover image of the given mode'''
+        path = os.path.join(self.directory.name, f"cover_{mode.replace(';', '')}.png")
+        if mode == "I;16":
+            Image.fromarray(self.random.integers(0, 65536, (SIZE, SIZE), dtype=np.uint16)).save(path)
+        else:
+            Image.fromarray(self.random.integers(0, 256, SHAPES[mode], dtype=np.uint8), mode).save(path)
+        return path
+
+    def round_trip(self, mode: str, solid: bool=False, scanline: bool=False) -> None:
+        output = os.path.join(self.directory.name, "revealed")
+        os.makedirs(output, exist_ok=True)
+        v = VanGons()
+        with no_pause():
+            carrier = v.encode_files(self.payloads, self.cover(mode), self.directory.name, solid=solid, scanline=scanline)["path"]
+            with Image.open(carrier) as image:
+                self.assertEqual(image.mode, mode)
+            self.assertEqual(v.list_files(carrier), [(os.path.basename(path), os.path.getsize(path)) for path in self.payloads])
+            revealed = v.decode_files(carrier, output)
+
+        self.assertEqual(len(revealed), len(self.payloads))
+        for payload, result in zip(self.payloads, revealed):
+            with open(payload, "rb") as original, open(result, "rb") as f:
+                self.assertEqual(original.read(), f.read())
+
+    def test_rgb(self):
+        self.round_trip("RGB")
+
+    def test_rgba(self):
+        self.round_trip("RGBA")
+
+    def test_grayscale(self):
+        self.round_trip("L")
+
+    def test_grayscale_solid(self):
+        self.round_trip("L", solid=True)
+
+    def test_16_bit_grayscale(self):
+        self.round_trip("I;16")
+
+    def test_scanline(self):
+        self.round_trip("RGB", scanline=True)
+
+    def test_grayscale_scanline_solid(self):
+        self.round_trip("L", solid=True, scanline=True)
+
+    def test_scanline_list_reads_top_rows(self):
+        rows_read = []
+        class CountingReader(scanlines.RowReader):
+            def read(self, rows: int):
+                rows_read.append(rows)
+                return super().read(rows)
+
+        v = VanGons()
+        with no_pause():
+            carrier = v.encode_files(self.payloads, self.cover("RGB"), self.directory.name, scanline=True)["path"]
+        mulVanGonography.RowReader = CountingReader
+        try:
+            files = v.list_files(carrier)
+        finally:
+            mulVanGonography.RowReader = scanlines.RowReader
+        self.assertEqual([size for _, size in files], [os.path.getsize(path) for path in self.payloads])
+        self.assertLess(max(rows_read), SIZE // 2)
+
+    def test_scanline_append_and_delete(self):
+        output = os.path.join(self.directory.name, "revealed")
+        os.makedirs(output)
+        v = VanGons()
+        with no_pause():
+            carrier = v.encode_files(self.payloads[:2], self.cover("RGB"), self.directory.name, scanline=True)["path"]
+            v.append_files(self.payloads[2:], carrier)
+            v.delete_files(carrier, [1])
+            self.assertTrue(v.get_headers(carrier)["scanline"])
+            revealed = v.decode_files(carrier, output)
+
+        self.assertEqual(len(revealed), 2)
+        for payload, result in zip(self.payloads[1:], revealed):
+            with open(payload, "rb") as original, open(result, "rb") as f:
+                self.assertEqual(original.read(), f.read())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,17 @@
 import os
+import io
+import sys
 from PIL import Image
+import numpy as np
 import shutil
+import time
+import secrets
+import threading
+from contextlib import contextmanager
+
+PROGRESS_PAUSE = 1 # Seconds the progress messages stay on screen before the work starts, 0 in worker processes (see watch.py)
+_pauses = threading.local() # Threads running library calls skip the pauses, see `no_pause`
+STDIO = "-" # Path standing for stdin (payload and cover) or stdout (output)
 
 def get_file_size(file_path: str) -> int:
     size = os.path.getsize(file_path)
@@ -27,6 +38,181 @@ def binary_to_int(binary: str) -> int:
     integer = int(binary, 2)
     return integer
 
+def format_metadata(metadata: dict) -> str:
+    '''turns a dict in "key=value;key=value" text, the format used for the header metadata'''
+    for key, value in metadata.items():
+        if any(char in f"{key}{value}" for char in "=;"):
+            raise ValueError(f"Invalid metadata '{key}={value}', keys and values can't contain '=' or ';'.")
+    return ";".join(f"{key}={value}" for key, value in metadata.items())
+
+def parse_metadata(text: str) -> dict:
+    '''opposite of format_metadata, values are always returned as strings'''
+    if not text:
+        return {}
+    metadata = {}
+    for field in text.split(";"):
+        key, separator, value = field.partition("=")
+        if not separator or not key:
+            raise ValueError(f"Invalid metadata field: {field!r}")
+        metadata[key] = value
+    return metadata
+
+def temporary_name(path: str) -> str:
+    '''name of a temporary file next to `path`, unique to the job asking for it (hidden, ends with .tmp)'''
+    directory, name = os.path.split(path)
+    return os.path.join(directory, f".{name}.{secrets.token_hex(8)}.tmp")
+
+def numbered_name(path: str, number: int) -> str:
+    '''"name.ext" for number 0, "name-1.ext", "name-2.ext"... otherwise'''
+    stem, extension = os.path.splitext(path)
+    return f"{stem}-{number}{extension}" if number else path
+
+def publish(temporary_path: str, path: str, unique: bool = False) -> str:
+    '''moves a completely written temporary file to `path` in a single step, returns the final path.\n
+    With `unique` an existing file is never replaced, the first free name among "name.ext", "name-1.ext",
+    "name-2.ext"... is used: the name is taken with a hard link, which fails if another job took it first'''
+    if not unique:
+        os.replace(temporary_path, path)
+        return path
+
+    number = 0
+    while True:
+        candidate = numbered_name(path, number)
+        number += 1
+        try:
+            os.link(temporary_path, candidate)
+        except FileExistsError:
+            continue
+        except OSError:
+            # No hard links on this file system (FAT...), the name is taken by creating the file exclusively
+            try:
+                open(candidate, 'xb').close()
+            except FileExistsError:
+                continue
+            os.replace(temporary_path, candidate)
+            return candidate
+        os.remove(temporary_path)
+        return candidate
+
+class AtomicFile:
+    '''file written under a temporary name and moved to `path` once it's complete, so jobs running side by side
+    never see (or write to) a half written file and a failed job leaves nothing behind.\n
+    `with AtomicFile("Cover.png", unique=True) as f: image.save(f)`, the final path is then in the `path` attribute'''
+    def __init__(self, path: str, unique: bool = False, text: bool = False):
+        self.path = path
+        self.unique = unique
+        self.mode = "x" if text else "xb" # Exclusive creation, the temporary name is never shared
+        self.temporary_path = temporary_name(path)
+
+    def __enter__(self):
+        self.file = open(self.temporary_path, self.mode)
+        return self.file
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.file.close()
+        if exc_type is not None:
+            os.remove(self.temporary_path)
+            return
+        try:
+            self.path = publish(self.temporary_path, self.path, self.unique)
+        except BaseException:
+            os.remove(self.temporary_path)
+            raise
+
+def save_png(array: np.ndarray, path: str, unique: bool = False) -> str:
+    '''saves an array as a PNG image through a temporary file (see AtomicFile), returns the final path'''
+    image_file = AtomicFile(path, unique)
+    with image_file as f:
+        Image.fromarray(array).save(f, format="PNG")
+    return image_file.path
+
+def link_or_copy(source: str, destination: str, unique: bool = False) -> str:
+    '''hard-links destination to source, copies it when hard links aren't supported (other drive, FAT...).
+    The link (or copy) replaces destination in a single step, see `publish` for `unique`. Returns the final path'''
+    temporary_path = temporary_name(destination)
+    try:
+        os.link(source, temporary_path)
+    except OSError:
+        try:
+            shutil.copyfile(source, temporary_path)
+        except BaseException:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+            raise
+    try:
+        return publish(temporary_path, destination, unique)
+    except BaseException:
+        os.remove(temporary_path)
+        raise
+
+def copy_file(source: str, destination: str, unique: bool = False) -> str:
+    '''copies source to destination, the copy replaces destination in a single step, see `publish` for `unique`.
+    Unlike link_or_copy the two files never share their data, changing one leaves the other as it is. Returns the final path'''
+    temporary_path = temporary_name(destination)
+    try:
+        shutil.copyfile(source, temporary_path)
+        return publish(temporary_path, destination, unique)
+    except BaseException:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        raise
+
+def load_payload(source) -> np.ndarray:
+    '''returns the data to hide as a flat uint8 array without copying it: files (given by path) are memory-mapped
+    read only, so the OS pages them in while they're being hidden, any other bytes-like object is viewed in place'''
+    if isinstance(source, (str, os.PathLike)):
+        if os.path.getsize(source) == 0:
+            return np.empty(0, dtype=np.uint8) # Empty files can't be mapped
+        return np.memmap(source, dtype=np.uint8, mode='r')
+    if isinstance(source, np.ndarray):
+        return np.ascontiguousarray(source).reshape(-1).view(np.uint8)
+    return np.frombuffer(source, dtype=np.uint8)
+
+def stdin_image(image):
+    '''images given as "-" are read from stdin, in memory since reading an image needs to seek in it'''
+    if isinstance(image, str) and image == STDIO:
+        return io.BytesIO(sys.stdin.buffer.read())
+    return image
+
+def is_safe_name(name: str) -> bool:
+    '''True when `name` (read from a header) can be used as a file name in the output directory, without leaving it'''
+    return bool(name) and os.path.basename(name) == name and name not in (".", "..") and "\x00" not in name
+
+def encode_varints(values) -> np.ndarray:
+    '''encodes non negative integers as LEB128 varints (7 bits per byte, high bit set on every byte but the last), all at once'''
+    values = np.asarray(values, dtype=np.uint64).reshape(-1)
+    groups = (values[:, None] >> (np.arange(10, dtype=np.uint64) * np.uint64(7))) & np.uint64(0x7f) # 10 groups cover 64 bits
+    sizes = np.maximum(1, -(-_bit_lengths(values) // 7)) # Number of bytes of every varint
+    groups[np.arange(10) < sizes[:, None] - 1] |= np.uint64(0x80) # Continuation bit
+    return groups[np.arange(10) < sizes[:, None]].astype(np.uint8)
+
+def _bit_lengths(values: np.ndarray) -> np.ndarray:
+    '''number of bits needed to write each value (0 for 0)'''
+    lengths = np.zeros(values.shape, dtype=np.int64)
+    remaining = values.copy()
+    for shift in (32, 16, 8, 4, 2, 1):
+        big = remaining >= np.uint64(1 << shift)
+        lengths[big] += shift
+        remaining[big] >>= np.uint64(shift)
+    return lengths + (remaining > 0)
+
+def decode_varints(buffer, count: int, start: int = 0) -> tuple[np.ndarray, int]:
+    '''decodes `count` varints written by `encode_varints` starting at `start`, returns (values, position after the last one)'''
+    buffer = np.frombuffer(buffer, dtype=np.uint8) if not isinstance(buffer, np.ndarray) else buffer
+    if count == 0:
+        return np.zeros(0, dtype=np.uint64), start
+    ends = np.flatnonzero(buffer[start:] < 0x80)[:count] + start # Last byte of every varint
+    if ends.size < count:
+        raise ValueError("Truncated varints.")
+    stop = int(ends[-1]) + 1
+    data = buffer[start:stop].astype(np.uint64) & np.uint64(0x7f)
+    # Position of every byte inside its varint, then shifting and summing the groups of each varint
+    firsts = np.concatenate(([start], ends[:-1] + 1)) - start
+    positions = np.arange(stop - start) - np.repeat(firsts, np.diff(np.concatenate((firsts, [stop - start]))))
+    if positions.max() >= 10:
+        raise ValueError("Varint too long.")
+    return np.add.reduceat(data << (positions.astype(np.uint64) * np.uint64(7)), firsts), stop
+
 def is_image_file(filename):
     try:
         with Image.open(filename):
@@ -34,6 +220,21 @@ def is_image_file(filename):
     except:
         return False
     
+def pause() -> None:
+    '''leaves the last progress message on screen for PROGRESS_PAUSE seconds'''
+    if PROGRESS_PAUSE and not getattr(_pauses, "skipped", False):
+        time.sleep(PROGRESS_PAUSE)
+
+@contextmanager
+def no_pause():
+    '''skips the progress pauses in the current thread only (see aio.py), the other callers of the process keep them'''
+    skipped = getattr(_pauses, "skipped", False)
+    _pauses.skipped = True
+    try:
+        yield
+    finally:
+        _pauses.skipped = skipped
+
 def clear_previous_print_value():
     '''clears previous print value'''
     return print('\r' + ' ' * shutil.get_terminal_size().columns, end='', flush=True)
\ No newline at end of file
@@ -0,0 +1,222 @@
+'''module for watching directories and hiding or revealing every file dropped into them\n
+Payloads dropped into an inbox directory are hidden (in the given cover, or in the smallest cover of a pool
+that fits) and carriers dropped into a carrier directory are revealed. The directories are polled, a file is
+only picked up once its size and modification time stayed the same for `settle` seconds, so files still being
+copied are never read half written. The jobs run in a single pool of worker processes started once, at most
+a few jobs per worker are queued at a time, so bursts of arrivals never start a process per file.
+Once its job is done every file is moved to the "done" (or "failed") sub directory of its directory,
+failed jobs also get a "name.error.txt" file with the error.\n
+The options of the jobs come from the command line or from a `--json` profile, see configs/watch.json.\n
+`python VanGonography.py -cli --watch-encode inbox --watch-decode carriers --pool covers -o output -w 4`'''
+
+import os
+import time
+
+import utils
+import metrics
+from concurrent.futures import ProcessPoolExecutor
+
+from utils import publish, AtomicFile
+from VanGonography import encode_image, decode_image
+
+DONE_DIRECTORY = "done" # Sub directory of a watched directory where the files whose job succeeded are moved
+FAILED_DIRECTORY = "failed" # Same for the failed jobs
+POLL_INTERVAL = 1.0 # Seconds between two scans of the watched directories
+SETTLE_TIME = 2.0 # Seconds a file must stay unchanged before its job starts
+QUEUED_PER_WORKER = 4 # Jobs waiting in the pool for every worker, the other ready files wait for the next scans
+
+# Options of the profile (same names as the command line arguments) used by each kind of job, with the name encode_image or decode_image gives them
+ENCODE_OPTIONS = {"encrypt": "encrypt", "zip": "compress", "alpha": "alpha", "depth": "depth", "stealth": "stealth",
+                  "stealth_key": "stealth_key", "adaptive": "adaptive", "verify": "verify", "password": "password",
+                  "scanline_header": "scanline"}
+DECODE_OPTIONS = {"decrypt": "decrypt", "key": "key", "zip": "compressed", "stealth_key": "stealth_key", "password": "password"}
+
+_pools = {} # Cover pools of a worker process, loaded once by directory
+
+def profile_options(profile: dict, operation: str) -> dict:
+    '''keyword arguments of encode_image ("encode") or decode_image ("decode") from a profile using the command line names,
+    like the ones of configs/encoding.json or the arguments of the command line (vars(args)). Unset options are left out'''
+    names = ENCODE_OPTIONS if operation == "encode" else DECODE_OPTIONS
+    return {option: profile[name] for name, option in names.items() if profile.get(name) not in (None, "")}
+
+def _worker_init() -> None:
+    '''runs once in every worker process'''
+    utils.PROGRESS_PAUSE = 0 # No pause for the progress messages, jobs follow each other
+
+def _encode_job(path: str, cover: str, pool: str, output_directory: str, options: dict) -> str:
+    '''hides a payload, in `cover` or in the smallest cover of the pool `pool` able to hold it, runs inside a worker process'''
+    if not cover:
+        from coverpool import CoverPool, required_capacity # Imported here because only jobs without a cover need it
+        from VanGonography import job_metadata
+        from passwords import kdf_metadata, SALT_SIZE
+
+        if pool not in _pools:
+            _pools[pool] = CoverPool(pool)
+        else:
+            _pools[pool].refresh() # New covers may have been added since the last job
+        size = required_capacity(os.path.getsize(path), options.get("compress", False), options.get("encrypt", False))
+        # Header of the job, a salt of the same length stands for the one of the password
+        metadata = job_metadata(options.get("stealth", False), options.get("adaptive", False), kdf=kdf_metadata(bytes(SALT_SIZE)) if options.get("password") else None)
+        cover = _pools[pool].best_fit(size, options.get("depth"), options.get("alpha", False), metadata, os.path.splitext(path)[1][1:])
+    return encode_image(path, cover, output_directory, **options)
+
+def _decode_job(path: str, output_directory: str, options: dict) -> str:
+    '''reveals the file hidden in a carrier, runs inside a worker process'''
+    if options.get("decrypt") and not options.get("key") and not options.get("password"):
+        raise ValueError("No key was given, you must give a key or a password to decrypt the data.")
+    return decode_image(path, output_directory, **options)
+
+class Watcher:
+    """
+    Polls directories and hides or reveals every file that arrives in them.
+
+    Parameters:
+    - encode_directories (list): Directories of payloads to hide.
+    - decode_directories (list): Directories of carriers to reveal.
+    - output_directory (str): Directory where the carriers and the revealed files are saved.
+    - cover (str): Cover used for every payload.
+    - pool (str): Directory of covers to choose from when no cover is given, see coverpool.py.
+    - encode_options (dict): Keyword arguments of encode_image for every payload, see `profile_options`.
+    - decode_options (dict): Keyword arguments of decode_image for every carrier.
+    - workers (int): Number of worker processes.
+    - interval (float): Seconds between two scans.
+    - settle (float): Seconds a file must stay unchanged before its job starts.
+    """
+    def __init__(self, encode_directories: list = (), decode_directories: list = (), output_directory: str = "", cover: str = "", pool: str = "",
+                 encode_options: dict = None, decode_options: dict = None, workers: int = 1, interval: float = POLL_INTERVAL, settle: float = SETTLE_TIME):
+        if not encode_directories and not decode_directories:
+            raise ValueError("You must give at least one directory to watch.")
+        if encode_directories and not cover and not pool:
+            raise ValueError("You must give a cover image or a cover pool directory (--pool) for the payloads to hide.")
+        if workers < 1:
+            raise ValueError("The number of workers must be at least 1.")
+
+        self.directories = [(directory, "encode") for directory in encode_directories] + [(directory, "decode") for directory in decode_directories]
+        for directory, _ in self.directories:
+            if not os.path.isdir(directory):
+                raise FileNotFoundError(f"Directory not found: {directory}")
+            if os.path.abspath(directory) == os.path.abspath(output_directory or "."):
+                raise ValueError(f"The output directory can't be a watched directory: {directory}")
+            for sub_directory in (DONE_DIRECTORY, FAILED_DIRECTORY):
+                os.makedirs(os.path.join(directory, sub_directory), exist_ok=True)
+        if output_directory:
+            os.makedirs(output_directory, exist_ok=True)
+
+        self.output_directory = output_directory
+        self.cover = cover
+        self.pool = pool
+        self.encode_options = encode_options or {}
+        self.decode_options = decode_options or {}
+        self.workers = workers
+        self.interval = interval
+        self.settle = settle
+
+        self.seen = {} # path -> (size, mtime, time the file was last seen changing)
+        self.running = {} # future -> (path, directory, operation, start time)
+        self.executor = None
+        self.stopped = False
+        self.stats = {"encoded": 0, "decoded": 0, "failed": 0}
+
+    def ready_files(self) -> list[tuple[str, str, str]]:
+        '''(path, directory, operation) of the files that stayed unchanged for `settle` seconds and aren't being processed'''
+        now = time.monotonic()
+        busy = {path for path, _, _, _ in self.running.values()}
+        ready, present = [], set()
+
+        for directory, operation in self.directories:
+            try:
+                entries = sorted(os.scandir(directory), key=lambda entry: entry.name)
+            except FileNotFoundError:
+                continue
+            for entry in entries:
+                # Sub directories (done, failed) and hidden files (temporary files, indexes) are never picked up
+                if entry.name.startswith(".") or not entry.is_file():
+                    continue
+                present.add(entry.path)
+                if entry.path in busy:
+                    continue
+
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                seen = self.seen.get(entry.path)
+                if seen is None or seen[:2] != (stat.st_size, stat.st_mtime_ns):
+                    self.seen[entry.path] = (stat.st_size, stat.st_mtime_ns, now) # New or still being written
+                elif now - seen[2] >= self.settle:
+                    ready.append((entry.path, directory, operation))
+
+        # Forgetting the files that went away
+        for path in set(self.seen) - present:
+            del self.seen[path]
+        return ready
+
+    def submit(self, path: str, directory: str, operation: str) -> None:
+        '''starts the job of a ready file'''
+        if operation == "encode":
+            future = self.executor.submit(_encode_job, path, self.cover, self.pool, self.output_directory, self.encode_options)
+        else:
+            future = self.executor.submit(_decode_job, path, self.output_directory, self.decode_options)
+        self.running[future] = (path, directory, operation, time.monotonic())
+
+    def finish(self, future) -> None:
+        '''moves the file of a finished job to the done or failed directory and records the result'''
+        path, directory, operation, start = self.running.pop(future)
+        error = future.exception()
+        name = os.path.basename(path)
+
+        # Jobs of the worker processes are recorded in their own registry, counting them here instead
+        metrics.inc("vangonography_jobs_total", operation=operation, result="success" if error is None else "failure")
+        metrics.observe("vangonography_job_seconds", time.monotonic() - start, operation=operation)
+
+        try:
+            if error is None:
+                self.stats[f"{operation}d"] += 1
+                publish(path, os.path.join(directory, DONE_DIRECTORY, name), unique=True)
+            else:
+                metrics.inc("vangonography_failures_total", operation=operation, reason=metrics.failure_reason(error))
+                self.stats["failed"] += 1
+                print(f"Error processing '{name}': {error}")
+                moved = publish(path, os.path.join(directory, FAILED_DIRECTORY, name), unique=True)
+                with AtomicFile(f"{moved}.error.txt", text=True) as error_file:
+                    error_file.write(f"{operation} failed: {error}\n")
+        except FileNotFoundError:
+            pass # Removed by someone else in the meantime
+        self.seen.pop(path, None)
+
+    def poll(self) -> None:
+        '''a single scan: collects the finished jobs, then starts the jobs of the ready files while the pool has room'''
+        for future in [future for future in self.running if future.done()]:
+            self.finish(future)
+
+        room = self.workers * QUEUED_PER_WORKER - len(self.running)
+        for path, directory, operation in self.ready_files()[:max(room, 0)]:
+            self.submit(path, directory, operation)
+
+    def run(self, polls: int = None) -> dict:
+        '''watches the directories until `stop` is called (or Ctrl+C), or for `polls` scans, returns the statistics.
+        The jobs still running are waited for before returning'''
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_worker_init)
+        watched = ", ".join(f"{directory} ({operation})" for directory, operation in self.directories)
+        print(f"Watching {watched} with {self.workers} workers, press Ctrl+C to stop.")
+        try:
+            count = 0
+            while not self.stopped and (polls is None or count < polls):
+                self.poll()
+                count += 1
+                time.sleep(self.interval)
+        except KeyboardInterrupt:
+            print("Stopping, waiting for the running jobs...")
+        finally:
+            for future in list(self.running):
+                future.exception() # Waits for the job, without raising its error
+                self.finish(future)
+            self.executor.shutdown()
+            self.executor = None
+
+        print(f"Hid {self.stats['encoded']} files, revealed {self.stats['decoded']} files, {self.stats['failed']} failed.")
+        return self.stats
+
+    def stop(self) -> None:
+        '''stops `run` after the current scan'''
+        self.stopped = True